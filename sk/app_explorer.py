@@ -1,5 +1,4 @@
 import streamlit as st
-import google.generativeai as genai
 import os
 import sys
 
@@ -10,10 +9,15 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'sk'))
 sys.path.append(os.path.join(os.path.dirname(__file__), 'sk', 'autonomy'))
 
 # Import from identity_engine.py
-from identity_engine import get_gemini_model, log_narrative_event, get_personality_traits, identity_evolution, render_ui
+from autonomy.identity_engine import render_ui
+from cognition.gemini_api import get_gemini_model
+from chat_flow import chat_reply
+from chat_history import get_page, older_page_markdown, append_message, open_session
+import profiling
 
 # --- Streamlit UI for Chatbot ---
 st.set_page_config(page_title="Super-Bot AI", layout="centered")
+profiling.begin_rerun(st.session_state) # No-op unless SUPERBOT_PROFILING=1
 
 st.title("🤖 Super-Bot AI: Your Personalized Companion")
 
@@ -23,59 +27,57 @@ gemini_model = get_gemini_model()
 if gemini_model is None:
     st.warning("Cannot initialize Super-Bot. Please ensure GEMINI_API_KEY is set in Streamlit secrets.")
 else:
-    # Initialize chat history in session state
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-        # Add a welcome message from the bot
-        st.session_state.messages.append({"role": "assistant", "content": "Hello! How can I help you today?"})
-
-    # Display chat messages from history on app rerun
-    for message in st.session_state.messages:
+    # Identify this session so its memories go to its own user shard. Only an opaque
+    # session token is kept in the URL and checked against the stored sessions, so a
+    # refresh reopens the same conversation but a made-up id opens nobody's.
+    if "user_id" not in st.session_state:
+        st.session_state.user_id, st.query_params["session"] = open_session(st.query_params.get("session"))
+        if "uid" in st.query_params:
+            del st.query_params["uid"]
+    user_id = st.session_state.user_id
+    conversation_id = user_id
+    st.session_state.setdefault("older_chat_pages", 0)
+
+    def load_older_messages():
+        st.session_state.older_chat_pages += 1
+
+    # Only the latest page is rendered message by message; older pages are loaded
+    # on demand and shown as cached markdown blocks, so a rerun costs the same
+    # however long the conversation grows
+    messages, cursor = get_page(conversation_id, user_id=user_id)
+    older_pages = []
+    for _ in range(st.session_state.older_chat_pages):
+        if cursor is None:
+            break
+        markdown, cursor = older_page_markdown(conversation_id, cursor, user_id=user_id)
+        older_pages.append(markdown)
+    if cursor is not None:
+        st.button("Load older messages", on_click=load_older_messages)
+    for markdown in reversed(older_pages):
+        with st.container(border=True):
+            st.markdown(markdown)
+
+    if not messages:
+        with st.chat_message("assistant"):
+            st.markdown("Hello! How can I help you today?")
+    for message in messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
     # Accept user input
     if prompt := st.chat_input("Ask Super-Bot anything..."):
-        # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.older_chat_pages = 0 # Back to the latest page
         with st.chat_message("user"):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
             with st.spinner("Super-Bot is thinking..."):
                 try:
-                    # Generate response using Gemini
-                    # Combine history for context (simplified for this example)
-                    # For complex conversations, you might need to manage tokens carefully
-                    chat_history_for_gemini = [
-                        {"role": "user" if m["role"] == "user" else "model", "parts": [m["content"]]}
-                        for m in st.session_state.messages
-                        if m["role"] != "welcome" # Exclude welcome message from Gemini context
-                    ]
-                    
-                    # Ensure the prompt is the last message for Gemini
-                    if chat_history_for_gemini and chat_history_for_gemini[-1]["parts"][0] != prompt:
-                         chat_history_for_gemini.append({"role": "user", "parts": [prompt]})
-
-                    # Start chat with existing history or just prompt if no history
-                    if len(chat_history_for_gemini) > 1:
-                        # Ensure the last part is the user's current prompt
-                        # Initialize a chat session from the model
-                        chat = gemini_model.start_chat(history=chat_history_for_gemini[:-1]) # Pass all but the last user prompt
-                        response = chat.send_message(prompt) # Send the current prompt
-                    else:
-                        response = gemini_model.generate_content(prompt) # First message or no history
-
-                    full_response = response.text
+                    full_response = chat_reply(conversation_id, prompt, user_id=user_id)
                     st.markdown(full_response)
-                    st.session_state.messages.append({"role": "assistant", "content": full_response})
-
-                    # Log interaction to narrative memory
-                    log_narrative_event("chat_interaction", f"User: {prompt}\nBot: {full_response}")
-
                 except Exception as e:
                     st.error(f"An error occurred: {e}")
-                    st.session_state.messages.append({"role": "assistant", "content": "Sorry, I'm having trouble responding right now."})
+                    append_message(conversation_id, "assistant", "Sorry, I'm having trouble responding right now.", user_id)
 
 # --- Separator for UI Sections ---
 st.markdown("---")
@@ -94,3 +96,6 @@ st.sidebar.info(
 st.sidebar.markdown(
     "Get your API key from [Google AI Studio](https://aistudio.google.com/app/apikey)."
 )
+
+profiling.render_sidebar(st.session_state)
+profiling.end_rerun(st.session_state)
@@ -1,36 +1,176 @@
 import streamlit as st
 from cognition.moral_compass import dilemma_resolver
 from autonomy.identity_engine import get_personality_traits
+from storage.engine import connect
+import os
+import json
+import hashlib
 import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 # This module would typically interact with a goal database and world model.
-# For this demo, we'll simulate goal management and ethical filtering.
+# Goals are persisted in the narrative database with a dependency DAG: a goal
+# waits for every goal it depends on (a parent goal depends on its subgoals).
+#
+# run_goals() works through the pending goals: each goal whose dependencies are
+# all done runs on a bounded worker pool (SUPERBOT_GOAL_WORKERS), so independent
+# goals progress in parallel, and as goals finish their dependents become ready.
+# Running a goal means an ethics check followed by make_decision on the goal and
+# its dependencies' results. The ethics verdict is stored with the hash of the
+# goal's description and context it was reached for, and is only asked for
+# again once that context changes. Only the scheduling thread writes to the
+# database: goals are claimed (pending -> running) atomically, so two runs never
+# execute the same goal, and every result is saved as soon as it is ready. A
+# goal that fails, or is rejected, blocks everything that depends on it.
 
-# Placeholder for a simple goal list (in-memory for demo)
-# In a real system, this would be persistent storage
-goals = []
+GOAL_WORKERS = int(os.environ.get("SUPERBOT_GOAL_WORKERS", "4"))
+GOAL_LEASE_SECONDS = int(os.environ.get("SUPERBOT_GOAL_LEASE", "1800")) # A "running" goal older than this was interrupted
+GOAL_STATUSES = ["pending", "running", "done", "failed", "rejected", "blocked"]
+DEPENDENCY_RESULT_CHARS = 300 # Of each dependency's result, passed on to the goals waiting for it
 
-def add_goal(goal_description):
-    goals.append({
-        "id": len(goals) + 1,
-        "description": goal_description,
-        "status": "pending",
-        "created_at": datetime.datetime.now().isoformat()
-    })
-    return True
+def _now():
+    return datetime.datetime.now().isoformat()
+
+def context_hash(description, context=None):
+    """Identifies a goal's description and context; ethics is re-checked when it changes."""
+    canonical = json.dumps({"description": description, "context": context or {}}, sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+def add_goal(goal_description, depends_on=(), context=None, user_id=None, ethics=None):
+    """
+    Stores a pending goal that waits for the goals in depends_on and returns its id.
+    ethics is an optional (acceptable, reasoning) verdict already reached for this goal
+    and context, so the engine does not ask again.
+    """
+    digest = context_hash(goal_description, context)
+    conn = connect("narrative")
+    try:
+        known = {row[0] for row in conn.execute("SELECT id FROM goals")}
+        missing = set(depends_on) - known
+        if missing:
+            raise ValueError(f"Unknown goal ids in depends_on: {sorted(missing)}")
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO goals (description, context, status, context_hash, ethics_hash, ethics_ok, ethics_reasoning, user_id, created_at)
+            VALUES (?, ?, 'pending', ?, ?, ?, ?, ?, ?)
+        """, (goal_description, json.dumps(context or {}), digest, digest if ethics else None,
+              int(ethics[0]) if ethics else None, ethics[1] if ethics else None, user_id, _now()))
+        goal_id = cursor.lastrowid
+        # A new goal has no dependents yet, so these edges cannot close a cycle
+        cursor.executemany("INSERT OR IGNORE INTO goal_dependencies (goal_id, depends_on) VALUES (?, ?)",
+                           [(goal_id, dependency) for dependency in depends_on])
+        conn.commit()
+    finally:
+        conn.close()
+    return goal_id
+
+def add_subgoal(parent_id, goal_description, depends_on=(), context=None, user_id=None):
+    """Adds a goal that parent_id waits for. Returns the subgoal's id."""
+    subgoal_id = add_goal(goal_description, depends_on, context, user_id)
+    add_dependency(parent_id, subgoal_id)
+    return subgoal_id
+
+def _dependency_map(conn):
+    depends = {}
+    for goal_id, dependency in conn.execute("SELECT goal_id, depends_on FROM goal_dependencies"):
+        depends.setdefault(goal_id, set()).add(dependency)
+    return depends
+
+def add_dependency(goal_id, depends_on):
+    """Makes goal_id wait for depends_on. Raises ValueError if that would create a cycle."""
+    conn = connect("narrative")
+    try:
+        depends = _dependency_map(conn)
+        # A cycle would need goal_id to be reachable from depends_on already
+        stack, seen = [depends_on], set()
+        while stack:
+            current = stack.pop()
+            if current == goal_id:
+                raise ValueError(f"Goal {depends_on} already waits for goal {goal_id}; the dependency would form a cycle")
+            if current not in seen:
+                seen.add(current)
+                stack.extend(depends.get(current, ()))
+        conn.execute("INSERT OR IGNORE INTO goal_dependencies (goal_id, depends_on) VALUES (?, ?)", (goal_id, depends_on))
+        conn.commit()
+    finally:
+        conn.close()
+
+def _descendants(conn, goal_id):
+    dependents = {}
+    for waiting, dependency in conn.execute("SELECT goal_id, depends_on FROM goal_dependencies"):
+        dependents.setdefault(dependency, []).append(waiting)
+    found, stack = set(), list(dependents.get(goal_id, ()))
+    while stack:
+        current = stack.pop()
+        if current not in found:
+            found.add(current)
+            stack.extend(dependents.get(current, ()))
+    return found
+
+def set_goal_context(goal_id, context):
+    """
+    Replaces a goal's context. A goal that has not completed goes back to pending (goals it
+    blocked are released), and its ethics will be re-checked before it runs again.
+    """
+    conn = connect("narrative")
+    try:
+        row = conn.execute("SELECT description, status FROM goals WHERE id = ?", (goal_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown goal id: {goal_id}")
+        status = "pending" if row[1] in ("failed", "rejected", "blocked") else row[1]
+        conn.execute("UPDATE goals SET context = ?, context_hash = ?, status = ? WHERE id = ?",
+                     (json.dumps(context or {}), context_hash(row[0], context), status, goal_id))
+        if status == "pending":
+            _unblock(conn, goal_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+def reopen_goal(goal_id):
+    """Puts a finished, failed or rejected goal back to pending, along with the goals it blocked."""
+    conn = connect("narrative")
+    try:
+        conn.execute("UPDATE goals SET status = 'pending', error = NULL WHERE id = ? AND status != 'running'", (goal_id,))
+        _unblock(conn, goal_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+def _unblock(conn, goal_id):
+    descendants = _descendants(conn, goal_id)
+    conn.executemany("UPDATE goals SET status = 'pending' WHERE id = ? AND status = 'blocked'", [(g,) for g in descendants])
+
+def get_goals(status=None):
+    """Returns goals (optionally of one status) as dicts in id order, each with its depends_on list."""
+    conn = connect("narrative")
+    try:
+        columns = ["id", "description", "context", "status", "ethics_ok", "ethics_reasoning", "result", "error",
+                   "attempts", "user_id", "created_at", "started_at", "finished_at"]
+        sql = f"SELECT {', '.join(columns)} FROM goals" + (" WHERE status = ?" if status else "") + " ORDER BY id"
+        rows = conn.execute(sql, (status,) if status else ()).fetchall()
+        depends = _dependency_map(conn)
+    finally:
+        conn.close()
+    goals = []
+    for row in rows:
+        goal = dict(zip(columns, row))
+        goal["context"] = json.loads(goal["context"] or "{}")
+        goal["depends_on"] = sorted(depends.get(goal["id"], ()))
+        goals.append(goal)
+    return goals
 
 def filter_goal(goal_description, context={}):
     """
     Checks if a goal is ethically acceptable using the moral compass.
     """
     # Simulate context retrieval if needed
-    
+
     traits = get_personality_traits() # Get AI's current personality traits
-    
+
     # Use dilemma_resolver for ethical filtering
     situation = f"Should I pursue the goal: '{goal_description}'?"
     ethical_guidance = dilemma_resolver(situation, context, traits)
-    
+
     # Simple check: if LLM's response contains negative ethical terms, it's not acceptable
     if "unethical" in ethical_guidance.lower() or \
        "not recommended" in ethical_guidance.lower() or \
@@ -38,16 +178,155 @@ def filter_goal(goal_description, context={}):
         return False, ethical_guidance
     return True, ethical_guidance
 
+# --- Execution engine ---
+
+def _execute_goal(goal, dependency_results):
+    """Runs on a worker thread: ethics check (if the context changed) and make_decision. Returns the outcome."""
+    from cognition.reasoning_core import make_decision # Loads the reasoning models on first use only
+    outcome = {"ethics_hash": goal["ethics_hash"], "ethics_ok": goal["ethics_ok"],
+               "ethics_reasoning": goal["ethics_reasoning"], "ethics_checked": False}
+    try:
+        context = json.loads(goal["context"] or "{}")
+        if goal["ethics_ok"] is None or goal["ethics_hash"] != goal["context_hash"]:
+            acceptable, reasoning = filter_goal(goal["description"], context)
+            outcome.update(ethics_hash=goal["context_hash"], ethics_ok=int(acceptable), ethics_reasoning=reasoning, ethics_checked=True)
+        if not outcome["ethics_ok"]:
+            outcome["status"] = "rejected"
+            return outcome
+        scenario = f"Work towards the goal: {goal['description']}"
+        if dependency_results:
+            scenario += "\nResults of the goals it builds on:\n" + "\n".join(
+                f"- {description}: {(result or '')[:DEPENDENCY_RESULT_CHARS]}" for description, result in dependency_results)
+        context_data = dict(context, scenario=scenario, ethics_flag=False) # Ethics was settled above
+        context_data.setdefault("user_input", goal["description"])
+        outcome["result"] = make_decision(context_data, user_id=goal["user_id"])
+        outcome["status"] = "done"
+    except Exception as e:
+        outcome["status"] = "failed"
+        outcome["error"] = f"{type(e).__name__}: {e}"
+    return outcome
+
+def _recover_interrupted(conn):
+    # Goals left "running" past the lease belonged to a run that died; they can be claimed again
+    cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=GOAL_LEASE_SECONDS)).isoformat()
+    stale = [row[0] for row in conn.execute("SELECT id FROM goals WHERE status = ? AND started_at < ?", ("running", cutoff))]
+    conn.executemany("UPDATE goals SET status = 'pending' WHERE id = ? AND status = 'running'", [(g,) for g in stale])
+    conn.commit()
+    return len(stale)
+
+def run_goals(max_workers=GOAL_WORKERS, max_goals=None, on_update=None):
+    """
+    Executes pending goals in dependency order, independent ones in parallel on up to
+    max_workers threads, until nothing is runnable (or max_goals goals have been started).
+    on_update(goal_id, status) is called from this thread after each change is saved.
+    Returns counts of the statuses reached plus "ethics_checks" and "recovered".
+    """
+    summary = {"done": 0, "failed": 0, "rejected": 0, "blocked": 0, "ethics_checks": 0, "recovered": 0}
+    conn = connect("narrative")
+    try:
+        summary["recovered"] = _recover_interrupted(conn)
+        # Only pending goals and the goals they wait for are read, so a run costs the
+        # size of the backlog rather than of the whole goal history
+        pending_sql = "SELECT id FROM goals WHERE status = 'pending'"
+        statuses = {row[0]: "pending" for row in conn.execute(pending_sql)}
+        depends = {}
+        for goal_id, dependency in conn.execute(f"SELECT goal_id, depends_on FROM goal_dependencies WHERE goal_id IN ({pending_sql})"):
+            depends.setdefault(goal_id, set()).add(dependency)
+        statuses.update(conn.execute("SELECT id, status FROM goals WHERE id IN "
+                                     f"(SELECT depends_on FROM goal_dependencies WHERE goal_id IN ({pending_sql}))"))
+        dependents = {}
+        for goal_id, dependencies in depends.items():
+            for dependency in dependencies:
+                dependents.setdefault(dependency, []).append(goal_id)
+        pending = {g for g, status in statuses.items() if status == "pending"}
+        waiting = {g: sum(statuses.get(d) != "done" for d in depends.get(g, ())) for g in pending}
+
+        def save(goal_id, status, **fields):
+            fields["status"] = status
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            conn.execute(f"UPDATE goals SET {assignments} WHERE id = ?", (*fields.values(), goal_id))
+            conn.commit()
+            statuses[goal_id] = status
+            if on_update:
+                on_update(goal_id, status)
+
+        def block_dependents_of(goal_id):
+            stack = list(dependents.get(goal_id, ()))
+            while stack:
+                current = stack.pop()
+                if current in pending:
+                    pending.discard(current)
+                    save(current, "blocked", error=f"Waits for goal {goal_id}, which is {statuses[goal_id]}")
+                    summary["blocked"] += 1
+                    stack.extend(dependents.get(current, ()))
+
+        for goal_id in sorted(pending):
+            if goal_id in pending and any(statuses.get(d) in ("failed", "rejected", "blocked") for d in depends.get(goal_id, ())):
+                pending.discard(goal_id)
+                save(goal_id, "blocked", error="A goal it depends on did not complete")
+                summary["blocked"] += 1
+                block_dependents_of(goal_id)
+        ready = sorted(g for g in pending if waiting[g] == 0)
+
+        columns = ["id", "description", "context", "context_hash", "ethics_hash", "ethics_ok", "ethics_reasoning", "user_id"]
+        started = 0
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="goal") as pool:
+            while ready or in_flight:
+                # Only as many goals are handed out as there are workers, so the pool never holds a backlog
+                while ready and len(in_flight) < max_workers and (max_goals is None or started < max_goals):
+                    goal_id = ready.pop(0)
+                    claimed = conn.execute("UPDATE goals SET status = 'running', started_at = ?, attempts = attempts + 1 "
+                                           "WHERE id = ? AND status = 'pending'", (_now(), goal_id)).rowcount
+                    conn.commit()
+                    if not claimed: # Taken by a concurrent run
+                        pending.discard(goal_id)
+                        continue
+                    goal = dict(zip(columns, conn.execute(f"SELECT {', '.join(columns)} FROM goals WHERE id = ?", (goal_id,)).fetchone()))
+                    dependency_ids = sorted(depends.get(goal_id, ()))
+                    dependency_results = conn.execute(
+                        f"SELECT description, result FROM goals WHERE id IN ({', '.join('?' * len(dependency_ids))}) ORDER BY id",
+                        dependency_ids).fetchall() if dependency_ids else []
+                    in_flight[pool.submit(_execute_goal, goal, dependency_results)] = goal_id
+                    started += 1
+                    if on_update:
+                        on_update(goal_id, "running")
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    goal_id = in_flight.pop(future)
+                    pending.discard(goal_id)
+                    outcome = future.result()
+                    summary["ethics_checks"] += outcome.pop("ethics_checked")
+                    status = outcome.pop("status")
+                    save(goal_id, status, finished_at=_now(), **outcome)
+                    summary[status] += 1
+                    if status == "done":
+                        for dependent in dependents.get(goal_id, ()):
+                            if dependent in pending:
+                                waiting[dependent] -= 1
+                                if waiting[dependent] == 0:
+                                    ready.append(dependent)
+                    else:
+                        block_dependents_of(goal_id)
+    finally:
+        conn.close()
+    return summary
+
 def render_ui():
     st.subheader("🎯 AI Goal Management")
     st.write("This module helps Super-Bot set and manage its goals, ensuring ethical alignment.")
 
+    goals = get_goals()
+    labels = {goal["id"]: f"#{goal['id']} {goal['description']}" for goal in goals}
     new_goal = st.text_input("Propose a new goal for Super-Bot:")
+    depends_on = st.multiselect("Depends on:", list(labels), format_func=labels.get)
     if st.button("Add & Filter Goal"):
         if new_goal:
             is_ethical, reasoning = filter_goal(new_goal)
             if is_ethical:
-                add_goal(new_goal)
+                add_goal(new_goal, depends_on, user_id=st.session_state.get("user_id"), ethics=(True, reasoning))
                 st.success(f"Goal '{new_goal}' added. Ethical Check: PASSED!")
                 st.write("Ethical Reasoning:")
                 st.code(reasoning)
@@ -58,10 +337,21 @@ def render_ui():
         else:
             st.info("Please enter a goal description.")
 
+    workers = st.slider("Parallel workers:", 1, 8, GOAL_WORKERS)
+    if st.button("Run Pending Goals"):
+        with st.spinner("Working through the goals..."):
+            summary = run_goals(max_workers=workers)
+        st.success(f"Done: {summary['done']}, failed: {summary['failed']}, rejected: {summary['rejected']}, "
+                   f"blocked: {summary['blocked']} ({summary['ethics_checks']} ethics checks).")
+        goals = get_goals()
+
     st.subheader("Current Goals:")
     if goals:
         for goal in goals:
-            st.markdown(f"- **{goal['description']}** (Status: {goal['status']})")
+            waits = f", waits for {', '.join(f'#{d}' for d in goal['depends_on'])}" if goal["depends_on"] else ""
+            st.markdown(f"- **#{goal['id']} {goal['description']}** (Status: {goal['status']}{waits})")
+            if goal["result"] or goal["error"]:
+                with st.expander(f"Outcome of #{goal['id']}"):
+                    st.code(goal["result"] or goal["error"])
     else:
         st.info("No goals set yet.")
-
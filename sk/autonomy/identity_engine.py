@@ -1,99 +1,311 @@
-import sqlite3
 import datetime
-import os
+import re
+import heapq
+import sqlite3
+from typing import NamedTuple
 import streamlit as st # Added for UI rendering
+from model_server import load_pipeline
+from storage.migrations import migrate
+from storage.engine import connect, db_path, all_paths, TrackedConnection
+from storage.panel_cache import cached_panel, cached_query
+from storage.iterators import iter_rows, iter_columns, PAGE_SIZE
+from autonomy.trait_history import append_trait_values, downsample
 
-# Database path - dynamically set based on where it's run
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # superbot/
-DB_PATH = os.path.join(BASE_DIR, 'db', "narrative_memory.db")
-
-# Ensure the directory exists
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+# Database path - resolved by the storage engine (split or single-file mode)
+DB_PATH = db_path("narrative")
 
 # Using a simple text-generation pipeline for demonstration
 # For real use, replace with Google Gemini API
 @st.cache_resource
 def get_llm_pipeline():
-    from transformers import pipeline
-    return pipeline("text-generation", model="gpt2")
+    return load_pipeline("text-generation", "gpt2") # Shared model server if SUPERBOT_MODEL_SERVER is set
 
 llm_pipeline = get_llm_pipeline() # Load LLM once
 
 def init_narrative_db_if_not_exists():
-    """Initializes the database if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS narrative_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            type TEXT,
-            content TEXT
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS personality_traits (
-            trait TEXT PRIMARY KEY,
-            value REAL
-        )
-    """)
-
-    default_traits = {
-        "empathy": 0.5,
-        "curiosity": 0.5,
-        "caution": 0.5,
-        "humor": 0.5,
-        "confidence": 0.5
-    }
-
-    for trait, val in default_traits.items():
-        cursor.execute("INSERT OR IGNORE INTO personality_traits (trait, value) VALUES (?, ?)", (trait, val))
-
-    conn.commit()
-    conn.close()
+    """Initializes the database if it doesn't exist and applies pending migrations."""
+    migrate(DB_PATH, "narrative")
 
 # Ensure DB is initialized when module is loaded (for Streamlit Cloud)
 init_narrative_db_if_not_exists()
 
-# Log life events
-def log_narrative_event(event_type, content):
-    conn = sqlite3.connect(DB_PATH)
+# Log life events (into the user's shard when a user_id is given)
+def log_narrative_event(event_type, content, user_id=None):
+    conn = connect("narrative", user_id)
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO narrative_log (timestamp, type, content) VALUES (?, ?, ?)", (
+    cursor.execute("INSERT INTO narrative_log (timestamp, type, content, user_id) VALUES (?, ?, ?, ?)", (
         datetime.datetime.now().isoformat(),
         event_type,
-        content
+        content,
+        user_id
     ))
     conn.commit()
     conn.close()
 
 # Fetch and return current traits
 def get_personality_traits():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect("narrative")
     cursor = conn.cursor()
     cursor.execute("SELECT trait, value FROM personality_traits")
     traits = {row[0]: row[1] for row in cursor.fetchall()}
     conn.close()
     return traits
 
+# Fetch recent life events, optionally of one type and/or one user
+def get_recent_narrative(limit=10, event_type=None, user_id=None):
+    conn = connect("narrative", user_id)
+    cursor = conn.cursor()
+    if user_id is None and event_type is None:
+        cursor.execute("SELECT timestamp, type, content FROM narrative_log ORDER BY id DESC LIMIT ?", (limit,))
+    elif user_id is None:
+        cursor.execute("SELECT timestamp, type, content FROM narrative_log WHERE type = ? ORDER BY id DESC LIMIT ?", (event_type, limit))
+    elif event_type is None:
+        cursor.execute("SELECT timestamp, type, content FROM narrative_log WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit))
+    else:
+        cursor.execute("SELECT timestamp, type, content FROM narrative_log WHERE user_id = ? AND type = ? ORDER BY id DESC LIMIT ?", (user_id, event_type, limit))
+    events = [{"timestamp": r[0], "type": r[1], "content": r[2]} for r in cursor.fetchall()]
+    conn.close()
+    return events
+
+# Compact record type for streaming scans
+class NarrativeRecord(NamedTuple):
+    id: int
+    timestamp: str
+    type: str
+    content: str
+    user_id: str
+
+def iter_narrative(user_id=None, event_type=None, all_shards=False, as_columns=False, page_size=PAGE_SIZE):
+    """
+    Streams narrative events in id order without loading the log into memory.
+    Yields NarrativeRecord tuples, or numpy column chunks if as_columns is set.
+    """
+    records = iter_rows("narrative", "narrative_log", NarrativeRecord,
+                        where="type = ?" if event_type else "", params=(event_type,) if event_type else (),
+                        user_id=user_id, all_shards=all_shards, page_size=page_size)
+    return iter_columns(records, page_size) if as_columns else records
+
+# --- Narrative timeline ---
+# Pages through the log by time range and event type with keyset pagination on
+# (timestamp, id): a page cursor is the position of the last event shown, so
+# page 1000 costs the same index seek as page 1. With several event types (or
+# every user shard) each source is paged on its own index and the sorted pages
+# are merged. Per-day counts come from the narrative_daily rollup, which
+# triggers keep current on every insert.
+
+NARRATIVE_EVENT_TYPES = ["chat_interaction", "internal_monologue", "introspection"]
+TIMELINE_PAGE_SIZE = 50
+
+def _timeline_sql(event_type, user_id, start, end, cursor, descending):
+    conditions, params = [], []
+    if event_type is not None:
+        conditions.append("type = ?")
+        params.append(event_type)
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    # The cursor replaces the range bound on its side, so the index seek starts right after it
+    if cursor is not None and not descending:
+        conditions += ["timestamp >= ?", "(timestamp, id) > (?, ?)"]
+        params += [cursor[0], cursor[0], cursor[1]]
+    elif start is not None:
+        conditions.append("timestamp >= ?")
+        params.append(start)
+    if cursor is not None and descending:
+        conditions += ["timestamp <= ?", "(timestamp, id) < (?, ?)"]
+        params += [cursor[0], cursor[0], cursor[1]]
+    elif end is not None:
+        conditions.append("timestamp < ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    order = "DESC" if descending else "ASC"
+    return (f"SELECT id, timestamp, type, content, user_id FROM narrative_log {where}"
+            f"ORDER BY timestamp {order}, id {order} LIMIT ?"), params
+
+def encode_cursor(record):
+    return f"{record.timestamp}|{record.id}"
+
+def decode_cursor(cursor):
+    timestamp, _, event_id = cursor.rpartition("|")
+    return timestamp, int(event_id)
+
+def get_timeline(start=None, end=None, event_types=None, user_id=None, all_shards=False,
+                 limit=TIMELINE_PAGE_SIZE, cursor=None, descending=True):
+    """
+    Returns (events, next_cursor): up to limit NarrativeRecords with start <= timestamp < end
+    (ISO strings or dates; either may be None), newest first unless descending is False.
+    event_types restricts the types; pass next_cursor back as cursor for the following
+    page, it is None on the last page. user_id reads that user's shard, all_shards every shard.
+    """
+    start = start.isoformat() if isinstance(start, datetime.date) else start
+    end = end.isoformat() if isinstance(end, datetime.date) else end
+    position = decode_cursor(cursor) if cursor else None
+    if user_id is not None:
+        paths = [db_path("narrative", user_id)]
+    else:
+        paths = all_paths("narrative") if all_shards else [db_path("narrative")]
+
+    pages = []
+    for path in paths:
+        migrate(path, "narrative")
+        conn = sqlite3.connect(path, factory=TrackedConnection)
+        try:
+            for event_type in (event_types or [None]):
+                sql, params = _timeline_sql(event_type, user_id, start, end, position, descending)
+                # One extra row tells whether another page follows
+                pages.append([NarrativeRecord._make(r) for r in conn.execute(sql, params + [limit + 1])])
+        finally:
+            conn.close()
+
+    key = lambda r: (r.timestamp or "", r.id)
+    merged = pages[0] if len(pages) == 1 else list(heapq.merge(*pages, key=key, reverse=descending))
+    events = merged[:limit]
+    next_cursor = encode_cursor(events[-1]) if len(merged) > limit else None
+    return events, next_cursor
+
+def get_daily_counts(start_day=None, end_day=None, event_types=None, all_shards=False):
+    """
+    Returns [{"day", "type", "events"}] per day (inclusive range, "YYYY-MM-DD") from the
+    daily rollup, without touching narrative_log. all_shards sums the counts over every shard.
+    """
+    start_day = start_day.isoformat() if isinstance(start_day, datetime.date) else start_day
+    end_day = end_day.isoformat() if isinstance(end_day, datetime.date) else end_day
+    sql = "SELECT day, type, events FROM narrative_daily WHERE day >= ? AND day <= ? ORDER BY day"
+    params = (start_day or "", end_day or "9999-12-31")
+    rows = cached_query("narrative", sql, params, all_shards=all_shards)
+    totals = {}
+    for day, event_type, events in rows:
+        if event_types and event_type not in event_types:
+            continue
+        totals[(day, event_type)] = totals.get((day, event_type), 0) + events
+    return [{"day": day, "type": event_type, "events": events}
+            for (day, event_type), events in sorted(totals.items()) if events > 0]
+
+# --- Trait updates ---
+# Every change is clamped to [0, 1] and appended to the trait history in the same
+# transaction, so the current value and its history never disagree.
+
+MAX_TRAIT_DELTA = 0.05 # Largest change one introspection may make to a trait
+_DELTA_PATTERN = re.compile(r"\b(empathy|curiosity|humor|caution|confidence)\s*[:=]\s*([+-]?\d*\.?\d+)", re.IGNORECASE)
+
+def update_personality_traits(deltas, timestamp=None):
+    """Adds deltas ({trait: delta}) to the stored traits and records the new values. Returns them."""
+    conn = connect("narrative")
+    conn.isolation_level = None # Manage the transaction explicitly
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            values = {}
+            for trait, delta in deltas.items():
+                conn.execute("UPDATE personality_traits SET value = MAX(0.0, MIN(1.0, value + ?)) WHERE trait = ?", (delta, trait))
+                row = conn.execute("SELECT value FROM personality_traits WHERE trait = ?", (trait,)).fetchone()
+                if row is not None:
+                    values[trait] = row[0]
+            append_trait_values(conn, values, timestamp)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return values
+
+def update_personality_trait(trait, delta):
+    """Adds delta to one trait and records the new value. Returns it, or None for an unknown trait."""
+    return update_personality_traits({trait: delta}).get(trait)
+
+def parse_trait_deltas(text):
+    """Extracts "trait: +0.02" style deltas from text, each clamped to MAX_TRAIT_DELTA."""
+    deltas = {}
+    for trait, delta in _DELTA_PATTERN.findall(text):
+        deltas[trait.lower()] = max(-MAX_TRAIT_DELTA, min(MAX_TRAIT_DELTA, float(delta)))
+    return deltas
+
 # Update traits from introspection
 def identity_evolution():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT content FROM narrative_log ORDER BY id DESC LIMIT 10")
-    logs = [row[0] for row in cursor.fetchall()]
+    events, _ = get_timeline(limit=10, all_shards=True) # Chat interactions live in the users' shards
+    logs = [event.content for event in events]
 
     prompt = f"""Based on these recent reflections and experiences:\n{logs}\nSuggest how the AI's personality traits (empathy, curiosity, humor, caution, confidence) should evolve. Provide specific delta values for each trait (e.g., empathy: +0.02, curiosity: -0.01)."""
 
-    # Use the pre-loaded LLM pipeline
-    analysis_text = llm_pipeline(prompt, max_length=200, num_return_sequences=1)[0]["generated_text"]
+    # Use the pre-loaded LLM pipeline; only the completion comes back, so the prompt's example deltas are not applied
+    analysis_text = llm_pipeline(prompt, max_new_tokens=120, num_return_sequences=1, stop_sequences=("\n\n",))[0]["generated_text"]
+
+    delta = parse_trait_deltas(analysis_text)
+    if not delta:
+        return {}
+    values = update_personality_traits(delta)
+    log_narrative_event("introspection", f"Trait changes: {delta}; now {values}")
+    return values
+
+# UI Rendering for Streamlit
+def _timeline_page(filters, cursor):
+    events, next_cursor = get_timeline(filters["start"], filters["end"], filters["types"] or None, all_shards=True, cursor=cursor)
+    return [{"timestamp": e.timestamp, "type": e.type, "content": e.content} for e in events], next_cursor
+
+def _older_page(next_cursor):
+    st.session_state.timeline_cursors.append(next_cursor)
+
+def _newer_page():
+    st.session_state.timeline_cursors.pop()
+
+def render_ui():
+    st.markdown("### Personality Traits")
+    traits = cached_panel("identity_engine.traits", ("narrative",), get_personality_traits)
+    st.table([{"trait": trait, "value": value} for trait, value in traits.items()])
 
-    # Simulated parsing for delta (you'd use NLP to extract from analysis_text)
-    # For demo, we'll apply a fixed or simple logic
-    delta = {}
+    st.markdown("### Trait Evolution")
+    span = st.selectbox("Period:", ["30 days", "90 days", "1 year"], index=2)
+    end = datetime.datetime.now()
+    start = end - datetime.timedelta(days={"30 days": 30, "90 days": 90, "1 year": 365}[span])
+    # Bucketed to the day so reruns within a day share the cached series
+    history_start = datetime.datetime.combine(start.date(), datetime.time())
+    history_end = datetime.datetime.combine(end.date() + datetime.timedelta(days=1), datetime.time())
+    series = cached_panel(("identity_engine.trait_history", span, history_start), ("narrative",),
+                          lambda: {trait: downsample(trait, history_start, history_end) for trait in traits})
+    if any(len(s["time"]) for s in series.values()):
+        import pandas as pd # Only needed for the chart
+        chart = pd.concat([pd.Series(s["mean"], index=pd.DatetimeIndex(s["time"]), name=trait)
+                           for trait, s in series.items() if len(s["time"])], axis=1)
+        st.line_chart(chart)
+        st.caption("Mean per period; the range within each period is in the table below.")
+        st.dataframe([{"trait": trait, "min": float(s["min"].min()), "max": float(s["max"].max()), "updates": int(s["count"].sum())}
+                      for trait, s in series.items() if len(s["time"])])
+    else:
+        st.info("No trait changes recorded yet.")
 
-    # Example simple parsing:
+    st.markdown("### Narrative Timeline")
+    today = datetime.date.today()
+    event_types = st.multiselect("Event types:", NARRATIVE_EVENT_TYPES, default=NARRATIVE_EVENT_TYPES)
+    date_range = st.date_input("Date range:", (today - datetime.timedelta(days=30), today))
+    start_day, end_day = (date_range if len(date_range) == 2 else (date_range[0], date_range[0]))
+    filters = {"types": tuple(event_types), "start": start_day.isoformat(),
+               "end": (end_day + datetime.timedelta(days=1)).isoformat()}
 
+    # Stack of page cursors; changing a filter starts again from the newest page
+    if st.session_state.get("timeline_filters") != filters:
+        st.session_state.timeline_filters = filters
+        st.session_state.timeline_cursors = []
+    cursors = st.session_state.timeline_cursors
+    cursor = cursors[-1] if cursors else None
+    # Chat interactions are logged to the users' shards: the page reads every shard and is keyed
+    # on the shard files as well (the "narrative" change token covers their writes)
+    shard_files = tuple(all_paths("narrative"))
+    events, next_cursor = cached_panel(("identity_engine.timeline", tuple(sorted(filters.items())), cursor, shard_files),
+                                       ("narrative",), lambda: _timeline_page(filters, cursor))
+    if events:
+        st.table(events)
+    else:
+        st.info("No narrative events in this range.")
+    newer, older = st.columns(2)
+    newer.button("Newer", disabled=not cursors, on_click=_newer_page)
+    older.button("Older", disabled=next_cursor is None, on_click=_older_page, args=(next_cursor,))
 
+    st.markdown("### Events per Day")
+    counts = get_daily_counts(filters["start"], end_day.isoformat(), event_types or None, all_shards=True)
+    if counts:
+        import pandas as pd # Only needed for the chart
+        chart = pd.DataFrame(counts).pivot_table(index="day", columns="type", values="events", fill_value=0)
+        st.bar_chart(chart)
+    else:
+        st.info("No events logged in this range.")
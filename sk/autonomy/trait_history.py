@@ -0,0 +1,132 @@
+import os
+import datetime
+import numpy as np
+from storage.engine import connect
+
+# Personality trait history as compact time series.
+# Every trait update appends one packed (float64 epoch seconds, float32 value)
+# record, 12 bytes, to the open segment of that trait: a BLOB row holding up to
+# SEGMENT_RECORDS records, extended in place with SQL blob concatenation. Each
+# segment row also keeps its time span, record count and min/max/sum, ahead of
+# the blob. Downsampling a range into chart buckets answers every segment that
+# falls inside a single bucket from those summary columns alone, and decodes
+# only the segments that straddle bucket edges, so a year of evolution comes back
+# as a few hundred (min, max, mean) points after reading a handful of blobs.
+
+SEGMENT_RECORDS = int(os.environ.get("SUPERBOT_TRAIT_SEGMENT_RECORDS", "1024"))
+TRAIT_CHART_POINTS = 300
+RECORD_DTYPE = np.dtype([("ts", "<f8"), ("value", "<f4")])
+
+def _epoch(moment):
+    if moment is None:
+        return datetime.datetime.now().timestamp()
+    if isinstance(moment, str):
+        moment = datetime.datetime.fromisoformat(moment)
+    if isinstance(moment, datetime.datetime):
+        return moment.timestamp()
+    if isinstance(moment, datetime.date):
+        return datetime.datetime.combine(moment, datetime.time()).timestamp()
+    return float(moment)
+
+def append_trait_values(conn, values, timestamp=None):
+    """
+    Appends one record per trait in values ({trait: value}) on an open connection; the
+    caller owns the transaction, so a trait update and its history commit together.
+    """
+    ts = _epoch(timestamp)
+    for trait, value in values.items():
+        value = float(np.float32(value)) # Summaries match the stored float32
+        record = np.array([(ts, value)], dtype=RECORD_DTYPE).tobytes()
+        row = conn.execute("SELECT id, records FROM trait_history WHERE trait = ? ORDER BY last_ts DESC LIMIT 1", (trait,)).fetchone()
+        if row is not None and row[1] < SEGMENT_RECORDS:
+            conn.execute("""
+                UPDATE trait_history SET data = CAST(data || ? AS BLOB), records = records + 1,
+                    first_ts = MIN(first_ts, ?), last_ts = MAX(last_ts, ?), min_value = MIN(min_value, ?),
+                    max_value = MAX(max_value, ?), sum_value = sum_value + ?
+                WHERE id = ?
+            """, (record, ts, ts, value, value, value, row[0]))
+        else:
+            conn.execute("""
+                INSERT INTO trait_history (trait, first_ts, last_ts, records, min_value, max_value, sum_value, data)
+                VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+            """, (trait, ts, ts, value, value, value, record))
+
+def record_trait_values(values, timestamp=None):
+    """Appends one record per trait in values ({trait: value}) in its own transaction."""
+    conn = connect("narrative")
+    conn.isolation_level = None # Manage the transaction explicitly
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            append_trait_values(conn, values, timestamp)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def load_trait_history(trait, start=None, end=None):
+    """Returns every (ts, value) record of a trait with start <= ts < end as a RECORD_DTYPE array, in time order."""
+    start, end = _epoch(start) if start is not None else -np.inf, _epoch(end) if end is not None else np.inf
+    conn = connect("narrative")
+    try:
+        blobs = [r[0] for r in conn.execute(
+            "SELECT data FROM trait_history WHERE trait = ? AND last_ts >= ? AND first_ts < ? ORDER BY last_ts",
+            (trait, start, end))]
+    finally:
+        conn.close()
+    records = np.frombuffer(b"".join(blobs), dtype=RECORD_DTYPE)
+    records = records[(records["ts"] >= start) & (records["ts"] < end)]
+    return records[np.argsort(records["ts"], kind="stable")]
+
+def downsample(trait, start, end=None, points=TRAIT_CHART_POINTS):
+    """
+    Summarises a trait's history over [start, end) in up to points equal-width time buckets.
+    Returns {"time": bucket start datetimes, "min", "max", "mean", "count"} arrays with
+    the empty buckets left out, plus "segments_read", the number of blobs decoded.
+    """
+    start, end = _epoch(start), _epoch(end)
+    width = max(end - start, 1e-9) / points
+    mins, maxs = np.full(points, np.inf), np.full(points, -np.inf)
+    sums, counts = np.zeros(points), np.zeros(points, dtype=np.int64)
+
+    conn = connect("narrative")
+    try:
+        segments = conn.execute("""
+            SELECT id, first_ts, last_ts, records, min_value, max_value, sum_value FROM trait_history
+            WHERE trait = ? AND last_ts >= ? AND first_ts < ? ORDER BY last_ts
+        """, (trait, start, end)).fetchall()
+        straddling = []
+        for seg_id, first_ts, last_ts, records, min_value, max_value, sum_value in segments:
+            bucket = min(int((first_ts - start) // width), points - 1)
+            if first_ts >= start and last_ts < end and bucket == min(int((last_ts - start) // width), points - 1):
+                mins[bucket] = min(mins[bucket], min_value)
+                maxs[bucket] = max(maxs[bucket], max_value)
+                sums[bucket] += sum_value
+                counts[bucket] += records
+            else:
+                straddling.append(seg_id)
+        blobs = [conn.execute("SELECT data FROM trait_history WHERE id = ?", (seg_id,)).fetchone()[0] for seg_id in straddling]
+    finally:
+        conn.close()
+
+    if blobs:
+        records = np.frombuffer(b"".join(blobs), dtype=RECORD_DTYPE)
+        records = records[(records["ts"] >= start) & (records["ts"] < end)]
+        buckets = np.minimum(((records["ts"] - start) // width).astype(np.int64), points - 1)
+        values = records["value"].astype(np.float64)
+        np.minimum.at(mins, buckets, values)
+        np.maximum.at(maxs, buckets, values)
+        np.add.at(sums, buckets, values)
+        np.add.at(counts, buckets, 1)
+
+    filled = counts > 0
+    return {
+        "time": [datetime.datetime.fromtimestamp(start + width * b) for b in np.flatnonzero(filled)],
+        "min": mins[filled],
+        "max": maxs[filled],
+        "mean": sums[filled] / counts[filled],
+        "count": counts[filled],
+        "segments_read": len(blobs),
+    }
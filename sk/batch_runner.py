@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Headless batch runner for make_decision.
+# Streams scenarios from a JSONL file, evaluates them in a process pool (each
+# worker imports the reasoning core, and so loads its models, exactly once),
+# and appends one JSON result per line as soon as it is ready. Re-running with
+# the same output file skips scenarios that already completed, so an
+# interrupted run resumes where it stopped.
+#
+# Usage: python sk/batch_runner.py scenarios.jsonl results.jsonl --workers 8
+# Each input line is a context_data dict for make_decision, plus optional "id"
+# and "user_id" keys; lines without an id are numbered by their line position.
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+_make_decision = None # Set per worker by _init_worker
+
+def _init_worker():
+    global _make_decision
+    from cognition.reasoning_core import make_decision # Loads the LLM pipelines once in this worker
+    _make_decision = make_decision
+
+def _run_scenario(scenario_id, context_data):
+    started = time.perf_counter()
+    result = {"id": scenario_id, "worker_pid": os.getpid()}
+    try:
+        result["decision"] = _make_decision(context_data, user_id=context_data.get("user_id"))
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+def read_scenarios(path):
+    """Yields (scenario_id, context_data) pairs from a JSONL file."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            context_data = json.loads(line)
+            yield str(context_data.get("id", line_no)), context_data
+
+def completed_ids(output_path, retry_errors=False):
+    """Returns the ids already present in an output file (only successful ones if retry_errors)."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue # A line cut short by an interruption
+            if not retry_errors or result.get("status") == "ok":
+                done.add(str(result["id"]))
+    return done
+
+def trim_partial_line(output_path):
+    """Cuts an unterminated last line (a result cut short by an interruption) off the output file."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # Walk back to the end of the last complete line
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            f.seek(position - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline != -1:
+                f.truncate(position - step + newline + 1)
+                return
+            position -= step
+        f.truncate(0)
+
+def run_batch(input_path, output_path, workers=None, retry_errors=False, progress=None):
+    """Evaluates every pending scenario and appends results to output_path. Returns a summary dict."""
+    workers = workers or os.cpu_count() or 1
+    trim_partial_line(output_path) # Otherwise the next result would be appended to it
+    done = completed_ids(output_path, retry_errors)
+    summary = {"skipped": 0, "ok": 0, "error": 0, "scenario_seconds": 0.0}
+
+    def pending_scenarios():
+        for sid, ctx in read_scenarios(input_path):
+            if sid in done:
+                summary["skipped"] += 1 # Inputs of this run that already have a result
+            else:
+                yield sid, ctx
+
+    pending = pending_scenarios()
+    started = time.perf_counter()
+    # spawn keeps workers from inheriting half-initialised model/thread state from the parent
+    context = multiprocessing.get_context("spawn")
+    with open(output_path, "a", encoding="utf-8") as out, \
+         ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            # Keep a bounded number of scenarios queued so huge inputs are never loaded at once
+            while not exhausted and len(in_flight) < workers * 2:
+                try:
+                    sid, ctx = next(pending)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight.add(pool.submit(_run_scenario, sid, ctx))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                summary[result["status"]] += 1
+                summary["scenario_seconds"] += result["seconds"]
+                if progress:
+                    progress(summary)
+
+    summary["wall_seconds"] = round(time.perf_counter() - started, 3)
+    processed = summary["ok"] + summary["error"]
+    summary["throughput_per_second"] = round(processed / summary["wall_seconds"], 3) if summary["wall_seconds"] else 0.0
+    summary["scenario_seconds"] = round(summary["scenario_seconds"], 3)
+    summary["workers"] = workers
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run make_decision over a JSONL file of scenarios.")
+    parser.add_argument("input", help="JSONL file of scenarios (context_data dicts)")
+    parser.add_argument("output", help="JSONL file results are appended to; reused to resume")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--retry-errors", action="store_true", help="Re-run scenarios whose previous result was an error")
+    args = parser.parse_args()
+
+    def report(summary):
+        print(f"\rok={summary['ok']} error={summary['error']} skipped={summary['skipped']}", end="", file=sys.stderr)
+
+    summary = run_batch(args.input, args.output, workers=args.workers, retry_errors=args.retry_errors, progress=report)
+    print(file=sys.stderr)
+    print(json.dumps(summary, indent=2))
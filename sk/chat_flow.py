@@ -0,0 +1,29 @@
+import os
+from autonomy.identity_engine import log_narrative_event
+from cognition.gemini_api import get_llm_client
+from chat_history import append_message, recent_messages, CHAT_CONTEXT_MESSAGES
+
+# The chat turn behind app_explorer.py, kept free of Streamlit calls so the
+# load-test harness (and any other front end) can drive exactly the same logic.
+
+CHAT_LLM_BACKEND = os.environ.get("SUPERBOT_CHAT_BACKEND", "gemini")
+CHAT_MAX_TOKENS = 500
+
+def to_gemini_history(messages):
+    """Converts chat messages ({"role", "content"}) to Gemini chat history entries."""
+    return [{"role": "user" if m["role"] == "user" else "model", "parts": [m["content"]]} for m in messages]
+
+def chat_reply(conversation_id, prompt, user_id=None, client=None):
+    """
+    Answers prompt in a stored conversation, with its latest turns as history. Both the
+    prompt and the reply are saved to the conversation, and the exchange is logged to
+    the narrative memory. Returns the reply text.
+    """
+    client = client or get_llm_client(CHAT_LLM_BACKEND)
+    history = recent_messages(conversation_id, CHAT_CONTEXT_MESSAGES, user_id)
+    append_message(conversation_id, "user", prompt, user_id)
+    # Through the resilient client: deadline, retries, concurrency cap, local fallback if the LLM is down
+    reply = client.generate(prompt, max_tokens=CHAT_MAX_TOKENS, history=to_gemini_history(history) or None)
+    append_message(conversation_id, "assistant", reply, user_id)
+    log_narrative_event("chat_interaction", f"User: {prompt}\nBot: {reply}", user_id=user_id)
+    return reply
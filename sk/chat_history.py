@@ -0,0 +1,126 @@
+import os
+import datetime
+import hashlib
+import secrets
+import threading
+import uuid
+from collections import OrderedDict
+from storage.engine import connect
+
+# Persistent chat conversations.
+# Messages are stored in the narrative database (in the user's shard when
+# sharding is on) and read back a page at a time, newest first, with the id of
+# the oldest message shown as the keyset cursor for the page before it. Only the
+# latest page is rendered message by message; older pages are loaded on demand
+# and, since messages before an existing one never change, rendered once into a
+# cached markdown block. A rerun therefore costs one page of messages, however
+# long the conversation is.
+#
+# A browser session is identified by a random token in the URL, never by the user
+# id itself. Only the token's hash is stored, in the global narrative database,
+# mapped to the user id it resumes; an unknown or expired token starts a new user.
+# The token is replaced each time it is resumed, so a copied link stops working
+# once its owner opens the app again.
+
+CHAT_PAGE_SIZE = int(os.environ.get("SUPERBOT_CHAT_PAGE_SIZE", "20"))
+CHAT_CONTEXT_MESSAGES = int(os.environ.get("SUPERBOT_CHAT_CONTEXT_MESSAGES", "20")) # Earlier turns sent to the LLM
+RENDER_CACHE_SIZE = 256
+_NEWEST = 2 ** 63 - 1 # Cursor that starts a conversation from its latest message
+CHAT_SESSION_DAYS = float(os.environ.get("SUPERBOT_CHAT_SESSION_DAYS", "30")) # Idle time before a session token expires
+
+# --- Sessions ---
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _issue_token(cursor, user_id, now):
+    token = secrets.token_urlsafe(24)
+    cursor.execute("INSERT INTO chat_sessions (token_hash, user_id, created_at, last_seen) VALUES (?, ?, ?, ?)",
+                   (_token_hash(token), user_id, now, now))
+    return token
+
+def open_session(token=None):
+    """
+    Returns (user_id, token) for a browser session. A valid token resumes its user and is
+    exchanged for a new one; a missing, unknown or expired token starts a new user.
+    """
+    now = datetime.datetime.now()
+    conn = connect("narrative")
+    try:
+        cursor = conn.cursor()
+        row = None
+        if token:
+            row = cursor.execute("SELECT user_id, last_seen FROM chat_sessions WHERE token_hash = ?",
+                                 (_token_hash(token),)).fetchone()
+            cursor.execute("DELETE FROM chat_sessions WHERE token_hash = ?", (_token_hash(token),))
+        if row and now - datetime.datetime.fromisoformat(row[1]) <= datetime.timedelta(days=CHAT_SESSION_DAYS):
+            user_id = row[0]
+        else:
+            user_id = f"session-{uuid.uuid4().hex[:12]}"
+        new_token = _issue_token(cursor, user_id, now.isoformat())
+        conn.commit()
+        return user_id, new_token
+    finally:
+        conn.close()
+
+def append_message(conversation_id, role, content, user_id=None):
+    """Stores one message and returns its id."""
+    conn = connect("narrative", user_id)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO chat_messages (conversation_id, role, content, timestamp, user_id) VALUES (?, ?, ?, ?, ?)",
+                       (conversation_id, role, content, datetime.datetime.now().isoformat(), user_id))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+def get_page(conversation_id, before_id=None, limit=CHAT_PAGE_SIZE, user_id=None):
+    """
+    Returns (messages, older_cursor): up to limit messages older than before_id (the newest
+    ones if None) in chronological order, as {"id", "role", "content", "timestamp"} dicts.
+    older_cursor is the before_id of the previous page, or None at the start of the conversation.
+    """
+    conn = connect("narrative", user_id)
+    try:
+        rows = conn.execute(
+            "SELECT id, role, content, timestamp FROM chat_messages WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (conversation_id, before_id or _NEWEST, limit + 1)).fetchall()
+    finally:
+        conn.close()
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+    messages = [{"id": r[0], "role": r[1], "content": r[2], "timestamp": r[3]} for r in reversed(rows)]
+    return messages, (messages[0]["id"] if has_older else None)
+
+def recent_messages(conversation_id, limit=CHAT_CONTEXT_MESSAGES, user_id=None):
+    """The last limit messages of a conversation, oldest first (the LLM context window)."""
+    return get_page(conversation_id, limit=limit, user_id=user_id)[0]
+
+# --- Rendered older pages ---
+_render_cache = OrderedDict() # (conversation_id, before_id, limit) -> (markdown, older_cursor)
+_render_lock = threading.Lock()
+render_cache_stats = {"hits": 0, "misses": 0}
+
+def _render(messages):
+    label = {"user": "**You:**", "assistant": "**Super-Bot:**"}
+    return "\n\n".join(f"{label.get(m['role'], m['role'])} {m['content']}" for m in messages)
+
+def older_page_markdown(conversation_id, before_id, limit=CHAT_PAGE_SIZE, user_id=None):
+    """
+    Returns (markdown, older_cursor) for the page of messages before before_id, rendered as
+    one markdown block. Messages before an existing one never change, so the result is cached.
+    """
+    key = (conversation_id, before_id, limit)
+    with _render_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            render_cache_stats["hits"] += 1
+            return _render_cache[key]
+        render_cache_stats["misses"] += 1
+    messages, older_cursor = get_page(conversation_id, before_id, limit, user_id)
+    result = (_render(messages), older_cursor)
+    with _render_lock:
+        _render_cache[key] = result
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return result
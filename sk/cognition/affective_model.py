@@ -1,34 +1,173 @@
 import streamlit as st
-from transformers import pipeline
+from model_server import load_pipeline
 import os
+import re
+import time
+import threading
+import numpy as np
 
-# Load sentiment analysis model once
+# Load sentiment analysis model once (lazily: most texts never reach it)
 @st.cache_resource
 def get_sentiment_pipeline():
-    return pipeline("sentiment-analysis")
-
-sentiment_analyzer = get_sentiment_pipeline()
+    return load_pipeline("sentiment-analysis") # Shared model server if SUPERBOT_MODEL_SERVER is set
 
 def process_sentiment(text):
     """Analyzes the sentiment of a given text."""
-    result = sentiment_analyzer(text)
+    result = get_sentiment_pipeline()(text)
     if result:
         return result[0]['label'], result[0]['score']
     return "neutral", 0.0
 
-def predict_emotion(text):
-    """Predicts a general emotion based on sentiment."""
+# --- Tier 1: lexicon scorer ---
+# Each lexicon word carries a score per emotion. A text's token hits are summed
+# with one numpy gather, negations flip the polarity of the next few words, and
+# intensifiers scale them. Confidence combines the margin between the top two
+# emotions with how much lexical evidence was found; below the threshold the
+# text escalates to the transformer tier.
+
+EMOTIONS = ["joy", "sadness", "anger", "fear", "surprise", "disgust", "neutral"]
+LEXICON_CONFIDENCE_THRESHOLD = float(os.environ.get("SUPERBOT_LEXICON_CONFIDENCE", "0.6"))
+
+_LEXICON_WORDS = {
+    "joy": "happy glad great good love loved lovely wonderful amazing awesome excellent fantastic thanks thank "
+           "thankful grateful delighted pleased excited enjoy enjoyed fun nice perfect brilliant yay cheerful proud relieved",
+    "sadness": "sad unhappy depressed down miserable lonely cry crying heartbroken grief lost hopeless disappointed "
+               "sorry regret gloomy hurt tired empty",
+    "anger": "angry mad furious annoyed irritated hate hated outraged rage frustrated frustrating unfair ridiculous "
+             "stupid awful terrible worst",
+    "fear": "afraid scared worried worry anxious anxiety nervous terrified fear panic frightened uneasy insecure stress stressed",
+    "surprise": "surprised surprising shocked shocking unexpected wow astonished amazed sudden suddenly unbelievable",
+    "disgust": "disgusting disgusted gross nasty revolting sick vile repulsive creepy",
+}
+_NEGATIONS = {"not", "no", "never", "nothing", "hardly", "don't", "didn't", "isn't", "wasn't", "can't", "won't", "dont", "didnt", "isnt", "cant"}
+_INTENSIFIERS = {"very": 1.5, "so": 1.4, "really": 1.4, "extremely": 1.8, "super": 1.5, "totally": 1.4, "quite": 1.2}
+# Negating an emotion shifts evidence to its opposite (and away from itself)
+_NEGATED = {"joy": "sadness", "sadness": "joy", "anger": "neutral", "fear": "neutral", "surprise": "neutral", "disgust": "neutral"}
+
+_VOCAB = {}
+for _emotion, _words in _LEXICON_WORDS.items():
+    for _word in _words.split():
+        _VOCAB[_word] = _emotion
+_WORD_INDEX = {w: i for i, w in enumerate(_VOCAB)}
+_LEXICON_MATRIX = np.zeros((len(_VOCAB), len(EMOTIONS)), dtype=np.float32)
+_NEGATED_MATRIX = np.zeros((len(_VOCAB), len(EMOTIONS)), dtype=np.float32)
+for _word, _emotion in _VOCAB.items():
+    _LEXICON_MATRIX[_WORD_INDEX[_word], EMOTIONS.index(_emotion)] = 1.0
+    _NEGATED_MATRIX[_WORD_INDEX[_word], EMOTIONS.index(_NEGATED[_emotion])] = 0.8
+
+def lexicon_scores(text):
+    """Returns (emotion, confidence, scores) from the lexicon tier."""
+    tokens = re.findall(r"[a-z']+", text.lower())
+    rows, negated_rows, scales, negated_scales = [], [], [], []
+    negate_window, scale = 0, 1.0
+    for token in tokens:
+        if token in _NEGATIONS:
+            negate_window = 3
+            continue
+        if token in _INTENSIFIERS:
+            scale = _INTENSIFIERS[token]
+            continue
+        idx = _WORD_INDEX.get(token)
+        if idx is not None:
+            if negate_window:
+                negated_rows.append(idx)
+                negated_scales.append(scale)
+            else:
+                rows.append(idx)
+                scales.append(scale)
+        scale = 1.0
+        negate_window = max(0, negate_window - 1)
+
+    scores = np.zeros(len(EMOTIONS), dtype=np.float32)
+    if rows:
+        scores += np.asarray(scales, dtype=np.float32) @ _LEXICON_MATRIX[rows]
+    if negated_rows:
+        scores += np.asarray(negated_scales, dtype=np.float32) @ _NEGATED_MATRIX[negated_rows]
+    evidence = float(scores.sum())
+    if evidence == 0.0:
+        return "neutral", 0.0, scores
+    order = np.argsort(-scores)
+    top, second = float(scores[order[0]]), float(scores[order[1]])
+    confidence = ((top - second) / top) * min(1.0, evidence / 2.0)
+    return EMOTIONS[order[0]], confidence, scores
+
+# --- Cascade ---
+cascade_stats = {"lexicon": 0, "transformer": 0, "lexicon_seconds": 0.0, "transformer_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+def _record(tier, seconds):
+    with _stats_lock:
+        cascade_stats[tier] += 1
+        cascade_stats[tier + "_seconds"] += seconds
+
+def _transformer_emotion(text, lexicon_scores_):
     sentiment, score = process_sentiment(text)
     if sentiment == 'POSITIVE':
         return 'joy', score
-    elif sentiment == 'NEGATIVE':
-        return 'sadness', score
+    if sentiment == 'NEGATIVE':
+        # Keep the lexicon's more specific negative emotion if it saw one
+        negative = [EMOTIONS.index(e) for e in ("sadness", "anger", "fear", "disgust")]
+        best = max(negative, key=lambda i: lexicon_scores_[i])
+        return (EMOTIONS[best] if lexicon_scores_[best] > 0 else 'sadness'), score
     return 'neutral', score
 
+def predict_emotion(text, threshold=None):
+    """Predicts an emotion: lexicon tier first, escalating to the transformer when unsure."""
+    threshold = LEXICON_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    started = time.perf_counter()
+    emotion, confidence, scores = lexicon_scores(text)
+    if confidence >= threshold:
+        _record("lexicon", time.perf_counter() - started)
+        return emotion, confidence
+    emotion, score = _transformer_emotion(text, scores)
+    _record("transformer", time.perf_counter() - started)
+    return emotion, score
+
+# Small labeled sample for the accuracy-versus-latency report
+LABELED_SAMPLE = [
+    ("thanks, that's great!", "joy"),
+    ("I am feeling very happy today!", "joy"),
+    ("I love how helpful you were", "joy"),
+    ("I'm so sad my dog died", "sadness"),
+    ("I feel lonely and empty lately", "sadness"),
+    ("This is not good at all", "sadness"),
+    ("I'm furious, this is completely unfair", "anger"),
+    ("I hate waiting on hold for hours", "anger"),
+    ("I'm worried about my job security and future.", "fear"),
+    ("I'm really anxious about the exam tomorrow", "fear"),
+    ("Wow, I did not expect that at all", "surprise"),
+    ("That smell is disgusting", "disgust"),
+    ("The meeting is at 3pm in room 4", "neutral"),
+]
+
+def evaluate_cascade(samples=None, threshold=None):
+    """
+    Compares lexicon-only, transformer-only and cascade on labeled (text, emotion) samples.
+    Returns {mode: {"accuracy", "mean_ms"}} plus the share of texts the cascade escalated.
+    """
+    samples = samples or LABELED_SAMPLE
+    threshold = LEXICON_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    modes = {
+        "lexicon": lambda t: lexicon_scores(t)[0],
+        "transformer": lambda t: _transformer_emotion(t, lexicon_scores(t)[2])[0],
+        "cascade": lambda t: predict_emotion(t, threshold)[0],
+    }
+    report = {}
+    for mode, predict in modes.items():
+        correct, elapsed = 0, 0.0
+        for text, label in samples:
+            started = time.perf_counter()
+            correct += predict(text) == label
+            elapsed += time.perf_counter() - started
+        report[mode] = {"accuracy": correct / len(samples), "mean_ms": 1000 * elapsed / len(samples)}
+    escalated = sum(lexicon_scores(t)[1] < threshold for t, _ in samples)
+    report["escalation_rate"] = escalated / len(samples)
+    return report
+
 def render_ui():
     st.subheader("💡 AI's Affective Model")
     st.write("This module analyzes text for sentiment and predicts general emotions.")
-    
+
     user_text = st.text_area("Enter text to analyze sentiment/emotion:", "I am feeling very happy today!")
     if st.button("Analyze Emotion"):
         if user_text:
@@ -37,3 +176,12 @@ def render_ui():
         else:
             st.info("Please enter some text.")
 
+    st.markdown("### Sentiment Cascade")
+    st.caption(f"Lexicon tier answered {cascade_stats['lexicon']} texts, transformer tier {cascade_stats['transformer']} "
+               f"(confidence threshold {LEXICON_CONFIDENCE_THRESHOLD:.2f}).")
+    if st.button("Run Accuracy vs. Latency Report"):
+        with st.spinner("Evaluating tiers on the labeled sample..."):
+            report = evaluate_cascade()
+            escalation_rate = report.pop("escalation_rate")
+            st.table(report)
+            st.write(f"Cascade escalated {escalation_rate:.0%} of the sample to the transformer.")
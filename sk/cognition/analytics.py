@@ -0,0 +1,28 @@
+from storage.engine import query_all_shards
+
+# Cross-module analytics.
+# Each side is aggregated per day where its rows live: dilemmas in the moral
+# database, empathy feedback in the global ToM file and every user shard it was
+# written to. The per-day counts are small, so they are merged here in Python
+# instead of joining across ATTACHed files, which would only ever see the
+# global ToM file.
+
+def dilemmas_vs_empathy_accuracy():
+    """Returns, for every day with logged dilemmas, the dilemma count and that day's empathy accuracy."""
+    dilemmas = query_all_shards("moral", "SELECT substr(timestamp, 1, 10) AS day, COUNT(*) FROM dilemma_log GROUP BY day")
+    empathy = {}
+    for day, total, matches in query_all_shards("tom", """
+        SELECT substr(timestamp, 1, 10) AS day, COUNT(*), SUM(lower(trim(predicted_emotion)) = lower(trim(actual_emotion)))
+        FROM empathy_logs GROUP BY day
+    """):
+        day_total, day_matches = empathy.get(day, (0, 0))
+        empathy[day] = (day_total + total, day_matches + (matches or 0))
+    per_day = {}
+    for day, count in dilemmas:
+        per_day[day] = per_day.get(day, 0) + count
+    report = []
+    for day in sorted(per_day):
+        total, matches = empathy.get(day, (0, 0))
+        report.append({"day": day, "dilemmas": per_day[day], "empathy_logs": total,
+                       "empathy_accuracy": matches / total if total else None})
+    return report
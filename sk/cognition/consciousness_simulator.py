@@ -1,14 +1,13 @@
 import streamlit as st
+from model_server import load_pipeline
 import datetime
 from autonomy.identity_engine import log_narrative_event
-from transformers import pipeline
 
 # Using a simple text-generation pipeline for demonstration
 # For real use, replace with Google Gemini API
 @st.cache_resource
 def get_llm_pipeline():
-    from transformers import pipeline
-    return pipeline("text-generation", model="gpt2")
+    return load_pipeline("text-generation", "gpt2") # Shared model server if SUPERBOT_MODEL_SERVER is set
 
 llm_pipeline = get_llm_pipeline() # Load LLM once
 
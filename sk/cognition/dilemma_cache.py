@@ -0,0 +1,97 @@
+import os
+import threading
+import hashlib
+import numpy as np
+from cognition.embeddings import embed_text, EMBEDDING_DIM
+
+# Semantic near-duplicate cache for dilemma resolutions.
+# Situations are embedded and stored in a fixed-size matrix; a lookup scores every
+# slot with one matrix-vector product, keeps the top-k, and reuses the best stored
+# resolution if it clears the similarity threshold. Entries are scoped to a version
+# of the rules and values, so any weight or priority change stops old answers from
+# being served. When full, the least recently used slot is evicted.
+
+DILEMMA_CACHE_SIZE = int(os.environ.get("SUPERBOT_DILEMMA_CACHE_SIZE", "1024"))
+DILEMMA_CACHE_THRESHOLD = float(os.environ.get("SUPERBOT_DILEMMA_CACHE_THRESHOLD", "0.9"))
+DILEMMA_CACHE_TOP_K = 5
+
+def rules_version(rules, values):
+    """Returns an integer identifying a set of rules and values with their weights and priorities."""
+    digest = hashlib.sha1()
+    for r in sorted(rules, key=lambda r: r["id"]):
+        digest.update(f"{r['id']}|{r['rule']}|{r['weight']:.6f}\n".encode("utf-8"))
+    for name in sorted(values):
+        digest.update(f"{name}|{values[name]['score']:.6f}\n".encode("utf-8"))
+    return int.from_bytes(digest.digest()[:8], "big") >> 1 # Fits a signed int64
+
+class DilemmaCache:
+    def __init__(self, capacity=DILEMMA_CACHE_SIZE, threshold=DILEMMA_CACHE_THRESHOLD, top_k=DILEMMA_CACHE_TOP_K):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.top_k = top_k
+        self._vectors = np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32)
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._resolutions = [None] * capacity
+        self._situations = [None] * capacity
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, situation, scope):
+        """Returns (resolution, similarity) of the closest cached situation in scope, or None."""
+        query = embed_text(situation)
+        with self._lock:
+            n = self._size
+            if n:
+                scores = self._vectors[:n] @ query
+                scores[self._scopes[:n] != scope] = -np.inf
+                k = min(self.top_k, n)
+                candidates = np.argpartition(-scores, k - 1)[:k]
+                best = candidates[np.argmax(scores[candidates])]
+                if scores[best] >= self.threshold:
+                    self._clock += 1
+                    self._last_used[best] = self._clock
+                    self.hits += 1
+                    return self._resolutions[best], float(scores[best])
+            self.misses += 1
+            return None
+
+    def put(self, situation, scope, resolution):
+        vector = embed_text(situation)
+        with self._lock:
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._clock += 1
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._last_used[slot] = self._clock
+            self._resolutions[slot] = resolution
+            self._situations[slot] = situation
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._resolutions = [None] * self.capacity
+            self._situations = [None] * self.capacity
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Process-wide cache used by moral_compass.dilemma_resolver
+dilemma_cache = DilemmaCache()
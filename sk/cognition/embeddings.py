@@ -0,0 +1,52 @@
+import re
+import zlib
+import numpy as np
+
+# Lightweight text embeddings via feature hashing of word unigrams and bigrams.
+# No model download is needed and vectors are stable across processes (crc32,
+# not Python's salted hash), so they can be cached or persisted. Vectors are
+# L2-normalised, which makes a dot product the cosine similarity.
+
+EMBEDDING_DIM = 2048
+
+# Function words carry no topical signal and only add hash-collision noise.
+# Negations ("not", "no") are deliberately kept: they flip the meaning of a dilemma.
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at by for with from as is are was were be been being
+i me my we our you your he she it its they them their this that these those there here
+do does did should would could can will shall may might must have has had so
+what which who whom how when where why than then too very just about into over
+""".split())
+
+def _features(text):
+    words = [w for w in re.findall(r"[a-z0-9']+", (text or "").lower()) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def embed_text(text, dim=EMBEDDING_DIM):
+    """Embeds one text into a unit-length float32 vector."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode("utf-8"))
+        # The top bit picks the sign, which keeps hash collisions from only ever adding up
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+def embed_texts(texts, dim=EMBEDDING_DIM):
+    """Embeds a list of texts into an (n, dim) float32 matrix."""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        matrix[i] = embed_text(text, dim)
+    return matrix
+
+def top_k(matrix, query, k):
+    """Returns (indices, scores) of the k rows of matrix most similar to query, best first."""
+    if len(matrix) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+    scores = matrix @ query
+    k = min(k, len(scores))
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[np.argsort(-scores[idx])]
+    return idx, scores[idx]
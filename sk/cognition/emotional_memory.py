@@ -1,71 +1,216 @@
+import os
+import re
+import sys
+import math
 import sqlite3
+import hashlib
+import argparse
 from datetime import datetime
-import os
+from typing import NamedTuple
 import streamlit as st
+from storage.migrations import migrate
+from storage.engine import connect, db_path, all_paths, query_all_shards, TrackedConnection
+from storage.panel_cache import cached_panel
+from storage.iterators import iter_rows, iter_columns, PAGE_SIZE
 
-# Database path - dynamically set
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # superbot/
-DB_PATH = os.path.join(BASE_DIR, 'memory', "emotional_memory.db")
-
-# Ensure the directory exists
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+# Database path - resolved by the storage engine (split or single-file mode)
+DB_PATH = db_path("emotional")
 
 def init_emotional_db_if_not_exists():
-    """Initializes the database if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS emotional_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event TEXT,
-            emotion TEXT,
-            intensity REAL,
-            context TEXT,
-            timestamp TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Initializes the database if it doesn't exist and applies pending migrations."""
+    migrate(DB_PATH, "emotional")
 
 # Ensure DB is initialized when module is loaded (for Streamlit Cloud)
 init_emotional_db_if_not_exists()
 
-# Save emotional event
-def store_emotion(event, emotion, intensity=1.0, context=""):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO emotional_memory (event, emotion, intensity, context, timestamp)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (event, emotion, intensity, context, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
-
-# Recall related emotional memories
-def recall_emotion(event_query, top_n=5):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT event, emotion, intensity, context, timestamp
-        FROM emotional_memory
-        WHERE event LIKE ? ORDER BY intensity DESC, timestamp DESC LIMIT ?
-    ''', ('%' + event_query + '%', top_n))
-    data = cursor.fetchall()
-    conn.close()
-    return [{"event": r[0], "emotion": r[1], "intensity": r[2], "context": r[3], "timestamp": r[4]} for r in data]
+# --- Repeat merging ---
+# Events are normalised (case, whitespace, trailing punctuation) and hashed with
+# their emotion and user, and a repeat of a stored memory updates that row
+# instead of adding one: its occurrence count and last-seen time go up, the
+# intensity becomes the larger of the new one and the old one decayed by the
+# time since it was last seen, and the peak is kept in max_intensity. Recall
+# orders by recall_weight, the intensity scaled by 1 + ln(occurrences), so
+# frequent memories rank higher without crowding out everything else.
+
+EMOTION_HALF_LIFE_DAYS = float(os.environ.get("SUPERBOT_EMOTION_HALF_LIFE_DAYS", "7"))
+RECALL_OVERFETCH = 4 # Rows read per memory returned, to cover repeats the compaction job has not merged yet
+
+def normalize_event(event):
+    return re.sub(r"\s+", " ", (event or "").lower()).strip().rstrip(".!?").strip()
+
+def content_hash(event, emotion, user_id=None):
+    key = f"{user_id or ''}\x1f{emotion or ''}\x1f{normalize_event(event)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def _recall_weight(intensity, occurrences):
+    return (intensity or 0.0) * (1.0 + math.log(occurrences))
+
+def _merged_intensity(intensity, last_seen, new_intensity, now):
+    # The larger of the new intensity and the stored one decayed over the gap since it was last seen
+    try:
+        age_days = max(0.0, (datetime.fromisoformat(now) - datetime.fromisoformat(last_seen)).total_seconds() / 86400)
+    except (TypeError, ValueError):
+        age_days = 0.0
+    return max(new_intensity, (intensity or 0.0) * 0.5 ** (age_days / EMOTION_HALF_LIFE_DAYS))
+
+# Save emotional event, merging it into the stored copy if it is a repeat
+def store_emotion(event, emotion, intensity=1.0, context="", user_id=None):
+    digest = content_hash(event, emotion, user_id)
+    now = datetime.now().isoformat()
+    conn = connect("emotional", user_id)
+    conn.isolation_level = None # Manage the transaction explicitly
+    try:
+        # IMMEDIATE so two sessions storing the same event cannot both insert it
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT id, intensity, occurrences, last_seen FROM emotional_memory WHERE content_hash = ? ORDER BY id LIMIT 1",
+                           (digest,)).fetchone()
+        if row is None:
+            conn.execute('''
+                INSERT INTO emotional_memory (event, emotion, intensity, context, timestamp, user_id,
+                                              content_hash, occurrences, max_intensity, last_seen, recall_weight)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?)
+            ''', (event, emotion, intensity, context, now, user_id, digest, intensity, now, intensity))
+        else:
+            memory_id, stored, occurrences, last_seen = row
+            merged = _merged_intensity(stored, last_seen, intensity, now)
+            conn.execute('''
+                UPDATE emotional_memory SET intensity = ?, occurrences = occurrences + 1, max_intensity = MAX(COALESCE(max_intensity, 0), ?),
+                    last_seen = ?, recall_weight = ?, context = COALESCE(NULLIF(?, ''), context)
+                WHERE id = ?
+            ''', (merged, intensity, now, _recall_weight(merged, occurrences + 1), context, memory_id))
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+# Recall distinct related emotional memories, most intense and frequent first (only the given user's, if user_id is set)
+def recall_emotion(event_query, top_n=5, user_id=None):
+    columns = "id, event, emotion, intensity, context, timestamp, occurrences, last_seen, content_hash, user_id"
+    conn = connect("emotional", user_id)
+    try:
+        if user_id is None:
+            rows = conn.execute(f'''
+                SELECT {columns} FROM emotional_memory
+                WHERE event LIKE ? ORDER BY recall_weight DESC, last_seen DESC LIMIT ?
+            ''', ('%' + event_query + '%', top_n * RECALL_OVERFETCH)).fetchall()
+        else:
+            rows = conn.execute(f'''
+                SELECT {columns} FROM emotional_memory
+                WHERE user_id = ? AND event LIKE ? ORDER BY recall_weight DESC, last_seen DESC LIMIT ?
+            ''', (user_id, '%' + event_query + '%', top_n * RECALL_OVERFETCH)).fetchall()
+    finally:
+        conn.close()
+
+    memories = {}
+    for _, event, emotion, intensity, context, timestamp, occurrences, last_seen, digest, row_user in rows:
+        digest = digest or content_hash(event, emotion, row_user)
+        memory = memories.get(digest)
+        if memory is None:
+            memories[digest] = {"event": event, "emotion": emotion, "intensity": intensity, "context": context,
+                                "timestamp": timestamp, "occurrences": occurrences, "last_seen": last_seen or timestamp}
+        else: # A repeat not yet merged by compaction
+            memory["occurrences"] += occurrences
+            memory["intensity"] = max(memory["intensity"] or 0.0, intensity or 0.0)
+            memory["last_seen"] = max(memory["last_seen"] or "", last_seen or timestamp or "")
+    for memory in memories.values():
+        memory["weight"] = _recall_weight(memory["intensity"], memory["occurrences"])
+    return sorted(memories.values(), key=lambda m: (m["weight"], m["last_seen"] or ""), reverse=True)[:top_n]
+
+# --- Offline compaction ---
+# Merges repeats written before store_emotion deduplicated (or bulk-imported
+# since), and hashes rows that have no content_hash yet. Each database is read
+# once in id order; the surviving row of each memory is its oldest one.
+
+def _compact_database(path, dry_run=False):
+    migrate(path, "emotional")
+    conn = sqlite3.connect(path, factory=TrackedConnection)
+    conn.isolation_level = None # Manage the transaction explicitly
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        merged = {} # content hash -> survivor state
+        duplicates = []
+        rows = conn.execute('''
+            SELECT id, event, emotion, intensity, context, timestamp, user_id, content_hash, occurrences, max_intensity, last_seen
+            FROM emotional_memory ORDER BY id
+        ''')
+        scanned = 0
+        for memory_id, event, emotion, intensity, context, timestamp, user_id, digest, occurrences, max_intensity, last_seen in rows:
+            scanned += 1
+            new_digest = content_hash(event, emotion, user_id)
+            seen = last_seen or timestamp
+            state = merged.get(new_digest)
+            if state is None:
+                merged[new_digest] = {"id": memory_id, "stored_hash": digest, "intensity": intensity or 0.0, "occurrences": occurrences or 1,
+                                      "max_intensity": max_intensity if max_intensity is not None else intensity, "last_seen": seen,
+                                      "context": context, "changed": digest != new_digest or last_seen is None}
+                continue
+            duplicates.append((memory_id,))
+            state["intensity"] = _merged_intensity(state["intensity"], state["last_seen"], intensity or 0.0, seen or state["last_seen"])
+            state["occurrences"] += occurrences or 1
+            state["max_intensity"] = max(state["max_intensity"] or 0.0, max_intensity if max_intensity is not None else intensity or 0.0)
+            state["last_seen"] = max(state["last_seen"] or "", seen or "")
+            state["context"] = context or state["context"]
+            state["changed"] = True
+
+        updates = [(state["intensity"], state["occurrences"], state["max_intensity"], state["last_seen"],
+                    _recall_weight(state["intensity"], state["occurrences"]), state["context"], digest, state["id"])
+                   for digest, state in merged.items() if state["changed"]]
+        if not dry_run:
+            conn.executemany('''
+                UPDATE emotional_memory SET intensity = ?, occurrences = ?, max_intensity = ?, last_seen = ?,
+                    recall_weight = ?, context = ?, content_hash = ? WHERE id = ?
+            ''', updates)
+            conn.executemany("DELETE FROM emotional_memory WHERE id = ?", duplicates)
+        conn.execute("ROLLBACK" if dry_run else "COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return {"rows": scanned, "memories": len(merged), "merged_rows": len(duplicates), "updated": len(updates)}
+
+def compact_emotional_memory(dry_run=False):
+    """
+    Merges repeated memories in the global database and every user shard. Returns
+    {path: {"rows", "memories", "merged_rows", "updated"}}; dry_run counts without writing.
+    """
+    return {path: _compact_database(path, dry_run) for path in all_paths("emotional") if os.path.exists(path)}
+
+# Compact record type for streaming scans
+class EmotionRecord(NamedTuple):
+    id: int
+    event: str
+    emotion: str
+    intensity: float
+    context: str
+    timestamp: str
+    user_id: str
+
+def iter_emotions(user_id=None, emotion=None, all_shards=False, as_columns=False, page_size=PAGE_SIZE):
+    """
+    Streams emotional memories in id order without loading the table into memory.
+    Yields EmotionRecord tuples, or numpy column chunks if as_columns is set.
+    """
+    records = iter_rows("emotional", "emotional_memory", EmotionRecord,
+                        where="emotion = ?" if emotion else "", params=(emotion,) if emotion else (),
+                        user_id=user_id, all_shards=all_shards, page_size=page_size)
+    return iter_columns(records, page_size, float_fields=("intensity",)) if as_columns else records
 
 # Influence analysis
-def emotional_influence_analysis(current_event):
-    recalled = recall_emotion(current_event)
+def emotional_influence_analysis(current_event, user_id=None):
+    recalled = recall_emotion(current_event, user_id=user_id)
     if not recalled:
         return None
 
-    # Aggregate emotional impact
+    # Aggregate emotional impact, weighting each memory by how often it recurred
     emotion_scores = {}
     for entry in recalled:
         emotion = entry["emotion"]
-        intensity = entry["intensity"]
-        emotion_scores[emotion] = emotion_scores.get(emotion, 0) + intensity
+        emotion_scores[emotion] = emotion_scores.get(emotion, 0) + entry["weight"]
     
     if emotion_scores:
         max_emotion = max(emotion_scores, key=emotion_scores.get)
@@ -73,6 +218,11 @@ def emotional_influence_analysis(current_event):
         return {"emotion": max_emotion, "total_intensity": max_intensity, "recalled_events": recalled}
     return None
 
+# Newest 5 memories across the global database and every user shard
+def _recent_emotions():
+    recent_logs = query_all_shards("emotional", "SELECT event, emotion, intensity, timestamp FROM emotional_memory ORDER BY id DESC LIMIT 5")
+    return sorted(recent_logs, key=lambda r: r[3] or "", reverse=True)[:5]
+
 # UI Rendering for Streamlit
 def render_ui():
     st.subheader("💓 Super-Bot's Emotional Memory")
@@ -84,31 +234,38 @@ def render_ui():
     intensity_input = st.slider("Intensity:", 0.0, 1.0, 0.5)
     context_input = st.text_area("Context (optional):", "It was related to ethical reasoning.")
     if st.button("Store Emotion"):
-        store_emotion(event_input, emotion_input, intensity_input, context_input)
+        store_emotion(event_input, emotion_input, intensity_input, context_input, user_id=st.session_state.get("user_id"))
         st.success("Emotional event stored!")
 
     st.markdown("### Recall Emotional Memories")
     recall_query = st.text_input("Query for related emotional memories:", "positive interaction")
     if st.button("Recall Memories"):
-        recalled_memories = recall_emotion(recall_query)
+        recalled_memories = recall_emotion(recall_query, user_id=st.session_state.get("user_id"))
         if recalled_memories:
             for mem in recalled_memories:
                 st.markdown(f"- **Event:** {mem['event']}")
-                st.write(f"  Emotion: {mem['emotion'].capitalize()}, Intensity: {mem['intensity']:.2f}")
+                st.write(f"  Emotion: {mem['emotion'].capitalize()}, Intensity: {mem['intensity']:.2f}, Seen: {mem['occurrences']}x")
                 st.write(f"  Context: {mem['context']}")
-                st.write(f"  Timestamp: {mem['timestamp']}")
+                st.write(f"  First seen: {mem['timestamp']}, last seen: {mem['last_seen']}")
         else:
             st.info("No related emotional memories found.")
 
     st.markdown("### Recent Emotional Memories Panel")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT event, emotion, intensity, timestamp FROM emotional_memory ORDER BY id DESC LIMIT 5")
-    recent_logs = cursor.fetchall()
-    conn.close()
+    recent_logs = cached_panel("emotional_memory.recent", ("emotional",), _recent_emotions)
 
     if recent_logs:
         st.table(recent_logs)
     else:
         st.info("No recent emotional memories.")
 
+
+if __name__ == "__main__":
+    # python -m cognition.emotional_memory compact [--dry-run]  (run from sk/)
+    parser = argparse.ArgumentParser(description="Maintenance jobs for the emotional memory store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact_parser = commands.add_parser("compact", help="Merge repeated memories into one row each")
+    compact_parser.add_argument("--dry-run", action="store_true", help="Report what would be merged without writing")
+    args = parser.parse_args()
+    for path, result in compact_emotional_memory(dry_run=args.dry_run).items():
+        print(f"{path}: {result['rows']} rows -> {result['memories']} memories "
+              f"({result['merged_rows']} merged, {result['updated']} updated){' [dry run]' if args.dry_run else ''}", file=sys.stderr)
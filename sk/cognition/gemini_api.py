@@ -1,38 +1,84 @@
 import os
-# import google.generativeai as genai # Uncomment for actual Gemini API
+import math
 import streamlit as st # For st.secrets on Streamlit Cloud
-from transformers import pipeline
+from model_server import load_pipeline
+from cognition.llm_client import LLMClient, CircuitBreaker, GeminiBackend, HTTPBackend
+from cognition.generation import Generation
 
 # LLM for general text generation/response simulation
 @st.cache_resource
 def get_llm_pipeline():
-    return pipeline("text-generation", model="gpt2")
+    return load_pipeline("text-generation", "gpt2") # Shared model server if SUPERBOT_MODEL_SERVER is set
 
 llm_pipeline_gpt2 = get_llm_pipeline() # Load once
 
-# --- For actual Google Gemini API ---
-# Configure Gemini API key (recommended: use Streamlit secrets for deployment)
-# try:
-#     # For local testing, you can use environment variable
-#     # For Streamlit Cloud, go to 'Advanced settings' of your app, and add your API key as a secret.
-#     # Key: GEMINI_API_KEY, Value: YOUR_ACTUAL_GEMINI_API_KEY
-#     genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-# except Exception as e:
-#     st.warning(f"Gemini API key not configured. Using GPT2 placeholder for LLM calls. Error: {e}")
-
-def generate_gemini_response(prompt_text, max_tokens=200):
+# --- Remote LLM backend ---
+# Calls go through the resilient client in cognition.llm_client (deadlines, retries,
+# concurrency cap, hedging, circuit breaker), with GPT2 as the local fallback.
+# SUPERBOT_LLM_BACKEND selects the primary backend:
+#   "local"  - GPT2 only (default; no API key needed)
+#   "gemini" - Google Gemini; key from st.secrets or the GEMINI_API_KEY environment variable
+#   "http"   - a JSON endpoint at SUPERBOT_LLM_ENDPOINT, e.g. sk/fake_llm_server.py
+LLM_BACKEND = os.environ.get("SUPERBOT_LLM_BACKEND", "local")
+LLM_ENDPOINT = os.environ.get("SUPERBOT_LLM_ENDPOINT", "http://127.0.0.1:8765/generate")
+GEMINI_MODEL_NAME = os.environ.get("SUPERBOT_GEMINI_MODEL", "gemini-pro")
+
+def _gemini_api_key():
+    try:
+        return st.secrets["GEMINI_API_KEY"]
+    except Exception:
+        return os.environ.get("GEMINI_API_KEY")
+
+def _local_generate(prompt_text, max_tokens, history=None, timeout=None, stop=None, labels=None):
+    # max_new_tokens: the prompt does not eat into the budget, and only the completion comes back
+    result = llm_pipeline_gpt2(prompt_text, max_new_tokens=max_tokens, num_return_sequences=1,
+                               stop_sequences=stop, required_labels=labels)[0]
+    return Generation(result["generated_text"], result["prompt_tokens"], result["completion_tokens"], result["stop_reason"])
+
+@st.cache_resource
+def get_gemini_model():
+    """Returns the Gemini backend, or None if google-generativeai or an API key is missing."""
+    api_key = _gemini_api_key()
+    if not api_key:
+        return None
+    try:
+        return GeminiBackend(GEMINI_MODEL_NAME, api_key=api_key)
+    except ImportError:
+        return None
+
+@st.cache_resource
+def get_llm_client(backend=None):
+    """Returns the shared LLM client for a backend name (default: SUPERBOT_LLM_BACKEND)."""
+    backend = backend or LLM_BACKEND
+    if backend == "gemini":
+        model = get_gemini_model()
+        if model is not None:
+            return LLMClient(model, fallback=_local_generate)
+        st.warning("Gemini API key not configured. Using GPT2 placeholder for LLM calls.")
+    elif backend == "http":
+        return LLMClient(HTTPBackend(LLM_ENDPOINT), fallback=_local_generate)
+    # The local model needs no retries, and a slow CPU generation is still an answer: no deadline
+    # and a breaker that never opens, so only the concurrency cap and coalescing apply
+    return LLMClient(_local_generate, max_retries=0, timeout=None, breaker=CircuitBreaker(math.inf))
+
+def generate_gemini_completion(prompt_text, max_tokens=200, history=None, stop=None, labels=None):
     """
-    Generates a response using the Gemini API.
-    Placeholder uses GPT2. Uncomment actual Gemini code if API key is set.
+    Generates a response with the configured LLM backend (GPT2 unless SUPERBOT_LLM_BACKEND says otherwise)
+    and returns it as a Generation (text, prompt_tokens, completion_tokens, stop_reason).
+    max_tokens bounds the new tokens only. Generation ends early at any of the stop sequences,
+    or once every "Label:" in labels has been answered. history is an optional Gemini-style
+    chat history ([{"role", "parts"}]) preceding prompt_text.
     """
-    # For actual Gemini API (uncomment and configure API key)
-    # try:
-    #     model = genai.GenerativeModel('gemini-pro')
-    #     response = model.generate_content(prompt_text, generation_config=genai.types.GenerationConfig(max_output_tokens=max_tokens))
-    #     return response.text
-    # except Exception as e:
-    #     st.error(f"Gemini API call failed: {e}. Falling back to GPT2 placeholder.")
-    #     # Fallback to GPT2 if Gemini fails or not configured
-    
-    return llm_pipeline_gpt2(prompt_text, max_length=max_tokens, num_return_sequences=1)[0]["generated_text"]
+    return get_llm_client().complete(prompt_text, max_tokens=max_tokens, history=history, stop=stop, labels=labels)
+
+def generate_gemini_response(prompt_text, max_tokens=200, history=None, stop=None, labels=None):
+    """Like generate_gemini_completion, returning only the text."""
+    return generate_gemini_completion(prompt_text, max_tokens, history, stop, labels).text
+
+async def agenerate_gemini_response(prompt_text, max_tokens=200, history=None, stop=None, labels=None):
+    """Async generate_gemini_response; identical concurrent requests (sync or async) share one generation."""
+    return await get_llm_client().agenerate(prompt_text, max_tokens=max_tokens, history=history, stop=stop, labels=labels)
 
+def llm_client_stats():
+    """Returns the shared client's call counters (calls, coalesced, retries, fallbacks, token usage, breaker state...)."""
+    return get_llm_client().snapshot()
@@ -0,0 +1,135 @@
+import re
+from typing import NamedTuple
+
+# Generation controls shared by every LLM backend.
+# max_new_tokens budgets only the completion (max_length also counted the
+# prompt, so long prompts left little or no room for the answer), the prompt is
+# not echoed back, and a generation ends early at a stop sequence or, for
+# structured prompts, as soon as every required "Label:" line is present and the
+# last one is finished. The local pipeline checks this after every token through
+# a stopping criterion; remote backends get the stop sequences natively where
+# they support them and are trimmed the same way afterwards. Every completion is
+# returned as a Generation with its prompt and completion token counts.
+
+class Generation(NamedTuple):
+    text: str
+    prompt_tokens: int
+    completion_tokens: int
+    stop_reason: str # "stop_sequence", "complete" (all labels answered), "length" or "end"
+
+def find_end(text, stop=(), labels=()):
+    """
+    Returns (index, reason) where text should be cut, or None if generation should go on.
+    Stop sequences only count after the first non-blank character; labels must appear in
+    order, and the response is complete once the line after the last label has ended.
+    """
+    best = None
+    content_start = len(text) - len(text.lstrip())
+    for sequence in stop or ():
+        index = text.find(sequence, content_start)
+        if index > content_start and (best is None or index < best[0]):
+            best = (index, "stop_sequence")
+    if labels:
+        position = 0
+        for label in labels:
+            position = text.find(label, position)
+            if position == -1:
+                return best
+            position += len(label)
+        line = re.search(r"\S[^\n]*\n", text[position:])
+        if line is not None:
+            index = position + line.end() - 1
+            if best is None or index < best[0]:
+                best = (index, "complete")
+    return best
+
+def finish_text(text, stop=(), labels=()):
+    """Cuts text at its stop sequence or structured end. Returns (text, reason or None)."""
+    end = find_end(text, stop, labels)
+    if end is None:
+        return text, None
+    return text[:end[0]].rstrip(), end[1]
+
+def estimate_tokens(text):
+    """Rough token count (words and punctuation) for backends that do not report usage."""
+    return len(re.findall(r"\w+|[^\w\s]", text or ""))
+
+def as_generation(result, prompt, max_tokens, stop=(), labels=()):
+    """Normalises a backend result (a Generation or plain text) into a trimmed Generation."""
+    if isinstance(result, Generation):
+        text, reason = finish_text(result.text, stop, labels)
+        if reason is None:
+            return result
+        return result._replace(text=text, stop_reason=reason)
+    text, reason = finish_text(result or "", stop, labels)
+    completion_tokens = estimate_tokens(text)
+    return Generation(text, estimate_tokens(prompt), completion_tokens,
+                      reason or ("length" if completion_tokens >= max_tokens else "end"))
+
+# --- Local transformers pipelines ---
+
+def _stopping_criteria(tokenizer, stop, labels):
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _TextStop(StoppingCriteria):
+        # Decodes each sequence's new tokens after every step; a finished row stops
+        # growing while the rest of the batch carries on
+        def __init__(self):
+            self.prompt_length = None
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if self.prompt_length is None: # First call comes after the first new token
+                self.prompt_length = input_ids.shape[1] - 1
+            done = [find_end(tokenizer.decode(row[self.prompt_length:], skip_special_tokens=True), stop, labels) is not None
+                    for row in input_ids]
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([_TextStop()])
+
+class ControlledPipeline:
+    """
+    Wraps a text-generation pipeline so calls can pass max_new_tokens, stop_sequences and
+    required_labels. Such calls return only the completion, trimmed, with "prompt_tokens",
+    "completion_tokens" and "stop_reason" added to each result dict. Other calls pass through.
+    """
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    def __getattr__(self, name): # task, model, tokenizer... of the wrapped pipeline
+        return getattr(self.pipe, name)
+
+    def __call__(self, inputs, max_new_tokens=None, stop_sequences=None, required_labels=None, **kwargs):
+        if max_new_tokens is None and not stop_sequences and not required_labels:
+            return self.pipe(inputs, **kwargs)
+        single = isinstance(inputs, str)
+        prompts = [inputs] if single else list(inputs)
+        stop, labels = tuple(stop_sequences or ()), tuple(required_labels or ())
+        kwargs.setdefault("return_full_text", False)
+        if max_new_tokens is not None:
+            kwargs["max_new_tokens"] = max_new_tokens
+        if stop or labels:
+            # A stopping criterion learns the prompt length from the first generate() call it
+            # sees, so each batch the pipeline would run gets its own
+            batch_size = max(int(kwargs.pop("batch_size", None) or 1), 1)
+            outputs = []
+            for start in range(0, len(prompts), batch_size):
+                batch = prompts[start:start + batch_size]
+                outputs.extend(self.pipe(batch, batch_size=len(batch),
+                                         stopping_criteria=_stopping_criteria(self.pipe.tokenizer, stop, labels), **kwargs))
+        else:
+            outputs = self.pipe(prompts, **kwargs)
+
+        tokenizer = self.pipe.tokenizer
+        for prompt, results in zip(prompts, outputs):
+            prompt_tokens = len(tokenizer(prompt)["input_ids"])
+            for result in results:
+                raw = result["generated_text"]
+                generated = len(tokenizer(raw)["input_ids"])
+                text, reason = finish_text(raw, stop, labels)
+                result["generated_text"] = text
+                result["prompt_tokens"] = prompt_tokens
+                result["completion_tokens"] = len(tokenizer(text)["input_ids"]) if reason else generated
+                result["stop_reason"] = reason or ("length" if max_new_tokens and generated >= max_new_tokens else "end")
+        return outputs[0] if single else outputs
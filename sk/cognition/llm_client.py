@@ -0,0 +1,401 @@
+import os
+import math
+import json
+import time
+import asyncio
+import random
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from cognition.generation import Generation, as_generation
+
+# Resilient client layer for remote LLM calls.
+# Every call gets a deadline that covers all of its attempts. Failed attempts are
+# retried with full-jitter exponential backoff, a semaphore caps how many upstream
+# requests are in flight (so bursts queue instead of tripping quota errors), and an
+# optional hedged request is sent when the first one is slower than hedge_after.
+# Consecutive failures open a circuit breaker; while it is open, calls go straight
+# to the fallback (the local model) until a trial call succeeds again.
+#
+# Identical concurrent calls (same prompt, max_tokens and history) are coalesced:
+# the first becomes the leader and does the work, later ones wait for its result
+# or error instead of sending their own request. This holds across the sync
+# (generate) and async (agenerate) paths, which share one in-flight table.
+#
+# Backends are callables backend(prompt, max_tokens, history=None, timeout=None) -> str
+# or Generation; calls with generation controls also pass stop=(...) and/or labels=(...)
+# (see cognition.generation). Either way the client returns trimmed Generations.
+# Attempts run on worker threads so the deadline holds even when a backend ignores
+# its timeout; an abandoned attempt keeps its concurrency slot until it really ends.
+# A client built with timeout=None has no deadline, and one given
+# CircuitBreaker(math.inf) never opens: the right setup for a local model that is
+# slow but not flaky.
+
+LLM_TIMEOUT_SECONDS = float(os.environ.get("SUPERBOT_LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.environ.get("SUPERBOT_LLM_RETRIES", "3"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("SUPERBOT_LLM_MAX_CONCURRENCY", "4"))
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("SUPERBOT_LLM_HEDGE_AFTER", "0")) # 0 disables hedging
+LLM_BREAKER_FAILURES = int(os.environ.get("SUPERBOT_LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("SUPERBOT_LLM_BREAKER_RESET", "30"))
+LLM_COALESCE = os.environ.get("SUPERBOT_LLM_COALESCE", "1") == "1"
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# HTTP statuses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when a call fails and there is no fallback to answer it."""
+
+def is_retryable(exc):
+    """True for timeouts, connection problems and rate-limit/server errors."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return isinstance(exc, urllib.error.URLError) # Network failure before any HTTP status
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures; lets one trial call through after reset_seconds."""
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """Returns True if a call may go upstream now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_seconds and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """Counts a failure. Returns True if this failure opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+                return not was_open
+            return False
+
+class SingleFlight:
+    """Runs at most one computation per key at a time; concurrent callers of a key share its outcome."""
+
+    def __init__(self):
+        self._in_flight = {} # key -> Future of the leader's computation
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """Returns (future, is_leader) for key, registering a new leader future if none is in flight."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future, fn):
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def do(self, key, fn):
+        """Returns fn(), or the result (or error) of an identical call already in flight."""
+        future, leader = self._join(key)
+        if leader:
+            return self._finish(key, future, fn)
+        return future.result()
+
+    async def do_async(self, key, fn):
+        """Async do: the leader runs the blocking fn on a worker thread, followers await without blocking the loop."""
+        future, leader = self._join(key)
+        if leader:
+            return await asyncio.to_thread(self._finish, key, future, fn)
+        return await asyncio.wrap_future(future)
+
+    def pending(self):
+        with self._lock:
+            return len(self._in_flight)
+
+class LLMClient:
+    def __init__(self, backend, fallback=None, timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES,
+                 max_concurrency=LLM_MAX_CONCURRENCY, hedge_after=LLM_HEDGE_AFTER_SECONDS,
+                 breaker=None, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, coalesce=LLM_COALESCE):
+        self.backend = backend
+        self.fallback = fallback
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.single_flight = SingleFlight() if coalesce else None
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "timeouts": 0, "errors": 0,
+                      "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "breaker_opens": 0, "rejected": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0, "early_stops": 0}
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    @staticmethod
+    def _remaining(deadline):
+        """Seconds left before deadline, or None when the call has no deadline."""
+        return None if deadline == math.inf else max(0.0, deadline - time.monotonic())
+
+    def _submit(self, prompt, max_tokens, history, timeout, wait_seconds, controls):
+        """
+        Starts one upstream attempt once a concurrency slot is free (waiting indefinitely if
+        wait_seconds is None). Returns None if none frees up in time.
+        """
+        if wait_seconds is None:
+            acquired = self._slots.acquire()
+        else:
+            acquired = self._slots.acquire(timeout=wait_seconds) if wait_seconds > 0 else self._slots.acquire(blocking=False)
+        if not acquired:
+            return None
+        try:
+            future = self._pool.submit(self.backend, prompt, max_tokens, history=history, timeout=timeout, **controls)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _attempt(self, prompt, max_tokens, history, deadline, controls):
+        """One attempt, plus a hedged duplicate if it is slow. Returns the text or raises."""
+        remaining = self._remaining(deadline)
+        primary = self._submit(prompt, max_tokens, history, remaining, remaining, controls)
+        if primary is None:
+            self._count("rejected")
+            raise TimeoutError("No LLM concurrency slot became free before the deadline")
+        self._count("attempts")
+        pending = {primary}
+        if self.hedge_after and (remaining is None or self.hedge_after < remaining):
+            done, _ = wait(pending, timeout=self.hedge_after)
+            # Hedge only when a slot is free right away: hedges must never queue behind real calls
+            if not done:
+                hedge = self._submit(prompt, max_tokens, history, self._remaining(deadline), 0, controls)
+                if hedge is not None:
+                    self._count("hedges")
+                    pending.add(hedge)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=self._remaining(deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        self._count("timeouts")
+        raise TimeoutError("LLM call exceeded its deadline")
+
+    def _backoff(self, attempt, deadline):
+        # Full jitter: spreads retries from concurrent callers instead of synchronising them
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if deadline != math.inf:
+            delay = min(delay, max(0.0, deadline - time.monotonic()))
+        if delay:
+            time.sleep(delay)
+
+    def _fall_back(self, prompt, max_tokens, history, error, controls):
+        if self.fallback is None:
+            raise LLMUnavailableError(f"LLM call failed: {error}") from error
+        self._count("fallbacks")
+        return self.fallback(prompt, max_tokens, history=history, **controls)
+
+    @staticmethod
+    def _controls(stop, labels):
+        controls = {}
+        if stop:
+            controls["stop"] = tuple(stop)
+        if labels:
+            controls["labels"] = tuple(labels)
+        return controls
+
+    @staticmethod
+    def _flight_key(prompt, max_tokens, history, controls):
+        return (prompt, max_tokens, json.dumps(history, sort_keys=True) if history else None, tuple(sorted(controls.items())))
+
+    def complete(self, prompt, max_tokens=200, history=None, timeout=None, stop=None, labels=None):
+        """
+        Returns a Generation (text, token counts, stop reason) for prompt, with optional chat
+        history. max_tokens bounds the completion alone; generation ends early at any stop
+        sequence, or once every label in labels has been answered. Falls back to the local
+        model on failure.
+        """
+        self._count("calls")
+        controls = self._controls(stop, labels)
+        if self.single_flight is None:
+            return self._generate(prompt, max_tokens, history, timeout, controls)
+        key = self._flight_key(prompt, max_tokens, history, controls)
+        return self.single_flight.do(key, lambda: self._generate(prompt, max_tokens, history, timeout, controls))
+
+    def generate(self, prompt, max_tokens=200, history=None, timeout=None, stop=None, labels=None):
+        """Returns the completion text for prompt; see complete()."""
+        return self.complete(prompt, max_tokens, history, timeout, stop, labels).text
+
+    async def acomplete(self, prompt, max_tokens=200, history=None, timeout=None, stop=None, labels=None):
+        """Async complete: never blocks the event loop and coalesces with sync callers of the same request."""
+        self._count("calls")
+        controls = self._controls(stop, labels)
+        if self.single_flight is None:
+            return await asyncio.to_thread(self._generate, prompt, max_tokens, history, timeout, controls)
+        key = self._flight_key(prompt, max_tokens, history, controls)
+        return await self.single_flight.do_async(key, lambda: self._generate(prompt, max_tokens, history, timeout, controls))
+
+    async def agenerate(self, prompt, max_tokens=200, history=None, timeout=None, stop=None, labels=None):
+        """Async generate; see complete()."""
+        return (await self.acomplete(prompt, max_tokens, history, timeout, stop, labels)).text
+
+    def _generate(self, prompt, max_tokens, history, timeout, controls):
+        result = as_generation(self._run(prompt, max_tokens, history, timeout, controls), prompt, max_tokens, **controls)
+        with self._stats_lock:
+            self.stats["prompt_tokens"] += result.prompt_tokens
+            self.stats["completion_tokens"] += result.completion_tokens
+            self.stats["early_stops"] += result.stop_reason in ("stop_sequence", "complete")
+        return result
+
+    def _run(self, prompt, max_tokens, history, timeout, controls):
+        if not self.breaker.allow():
+            return self._fall_back(prompt, max_tokens, history, LLMUnavailableError("circuit breaker is open"), controls)
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout if timeout else math.inf
+        attempt = 0
+        while True:
+            try:
+                text = self._attempt(prompt, max_tokens, history, deadline, controls)
+                self.breaker.record_success()
+                return text
+            except Exception as e:
+                self._count("errors")
+                if not is_retryable(e):
+                    # The upstream answered (e.g. a rejected request), so it is not a sign of an outage
+                    self.breaker.record_success()
+                    return self._fall_back(prompt, max_tokens, history, e, controls)
+                if self.breaker.record_failure():
+                    self._count("breaker_opens")
+                out_of_time = deadline - time.monotonic() <= 0
+                if attempt >= self.max_retries or out_of_time or self.breaker.state != "closed":
+                    return self._fall_back(prompt, max_tokens, history, e, controls)
+                self._count("retries")
+                self._backoff(attempt, deadline)
+                attempt += 1
+
+    def snapshot(self):
+        """Returns a copy of the call counters plus the breaker state and coalescing counts."""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["breaker"] = self.breaker.state
+        if self.single_flight is not None:
+            stats["coalesced"] = self.single_flight.coalesced
+            stats["in_flight"] = self.single_flight.pending()
+        return stats
+
+# --- Backends ---
+
+class GeminiBackend:
+    """Google Gemini through google-generativeai; the API key comes from GEMINI_API_KEY."""
+
+    def __init__(self, model_name="gemini-pro", api_key=None):
+        import google.generativeai as genai # Only needed when Gemini is the selected backend
+        self._genai = genai
+        genai.configure(api_key=api_key or os.environ.get("GEMINI_API_KEY"))
+        self.model = genai.GenerativeModel(model_name)
+
+    def __call__(self, prompt, max_tokens, history=None, timeout=None, stop=None, labels=None):
+        # Gemini stops at up to 5 sequences itself; labelled responses are trimmed by the client
+        config = self._genai.types.GenerationConfig(max_output_tokens=max_tokens, stop_sequences=list(stop or ())[:5] or None)
+        options = {"timeout": timeout} if timeout else None
+        if history:
+            response = self.model.start_chat(history=history).send_message(prompt, generation_config=config, request_options=options)
+        else:
+            response = self.model.generate_content(prompt, generation_config=config, request_options=options)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return response.text
+        return Generation(response.text, usage.prompt_token_count, usage.candidates_token_count, "end")
+
+class HTTPBackend:
+    """
+    Posts {"prompt", "max_tokens", "history", "stop"} as JSON and reads back {"text"}, plus
+    "prompt_tokens" and "completion_tokens" if the endpoint reports them (fake_llm_server does).
+    """
+
+    def __init__(self, url):
+        self.url = url
+
+    def __call__(self, prompt, max_tokens, history=None, timeout=None, stop=None, labels=None):
+        body = json.dumps({"prompt": prompt, "max_tokens": max_tokens, "history": history or [], "stop": list(stop or ())}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            reply = json.loads(response.read().decode("utf-8"))
+        if "completion_tokens" not in reply:
+            return reply["text"]
+        return Generation(reply["text"], reply.get("prompt_tokens", 0), reply["completion_tokens"], reply.get("stop_reason", "end"))
+
+
+if __name__ == "__main__":
+    # cd sk && python -m cognition.llm_client -> exercises the client against a flaky fake server
+    from fake_llm_server import FakeLLMServer
+
+    def local_fallback(prompt, max_tokens, history=None, **controls):
+        return "[local fallback]"
+
+    with FakeLLMServer(latency=(0.01, 0.05), error_rate=0.2, slow_rate=0.05, slow_latency=2.0) as server:
+        client = LLMClient(HTTPBackend(server.url), fallback=local_fallback, timeout=1.5,
+                           max_concurrency=8, hedge_after=0.2, base_delay=0.05, breaker=CircuitBreaker(5, 0.5))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=4) as callers:
+            results = list(callers.map(lambda i: client.generate(f"prompt {i}", 20), range(200)))
+        elapsed = time.perf_counter() - started
+        print(f"200 calls in {elapsed:.2f}s, {sum(r == '[local fallback]' for r in results)} answered by the fallback")
+        print("client:", client.snapshot())
+        print("server:", server.snapshot())
@@ -1,56 +1,33 @@
-import sqlite3
-import os
+import json
+import hashlib
 from datetime import datetime
 import streamlit as st
 
 # Import necessary modules
-from cognition.moral_compass import update_rule_weight, get_rules # Assuming update_rule_weight exists
+from cognition.moral_compass import get_rules
+from cognition.weight_learning import learn_rule_weights
 from cognition.emotional_memory import recall_emotion # Adjusted to use recall_emotion directly
 from cognition.theory_of_mind import get_empathy_logs # Assuming get_empathy_logs exists in ToM module
 from cognition.gemini_api import generate_gemini_response # For proactive ethical evolution
-
-# Database path - dynamically set
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # superbot/
-DB_DIR = os.path.join(BASE_DIR, 'db') # Assuming moral_compass.db is here
-
-# Ensure the directory exists (moral_compass.db will create it)
-os.makedirs(DB_DIR, exist_ok=True)
-
-MORAL_DB_PATH = os.path.join(DB_DIR, "human_values.db")
-TOM_DB_PATH = os.path.join(DB_DIR, "theory_of_mind.db")
+from cognition.analytics import dilemmas_vs_empathy_accuracy # Cross-module report
+from storage.engine import connect
 
 # Helper to connect to moral db
 def get_moral_db_connection():
-    return sqlite3.connect(MORAL_DB_PATH)
+    return connect("moral")
 
 # Helper to connect to ToM db
 def get_tom_db_connection():
-    return sqlite3.connect(TOM_DB_PATH)
+    return connect("tom")
 
 # --- Step 1: Evaluate Past Moral Decisions ---
 def evaluate_moral_outcomes():
-    conn = get_moral_db_connection()
-    cursor = conn.cursor()
-    
-    # Assuming moral_outcomes table is populated by other modules giving feedback
-    cursor.execute("SELECT rule_id, outcome_feedback FROM moral_outcomes") # This table needs to be populated
-    feedback_data = cursor.fetchall()
-    conn.close()
-
-    feedback_summary = {}
-    for rule_id, feedback in feedback_data:
-        # Example: if feedback is "negative", decrease weight
-        if feedback == "negative":
-            update_rule_weight(rule_id, -0.05) # Decrease priority
-            feedback_summary[rule_id] = feedback_summary.get(rule_id, 0) - 1
-        elif feedback == "positive":
-            update_rule_weight(rule_id, +0.05) # Increase priority
-            feedback_summary[rule_id] = feedback_summary.get(rule_id, 0) + 1
-    
-    # Clear feedback for next evaluation cycle (or mark as processed)
-    # cursor.execute("DELETE FROM moral_outcomes") # Or update a 'processed' column
-    # conn.commit()
-    return f"Evaluated {len(feedback_data)} moral outcomes. Summary: {feedback_summary}"
+    # Weights are re-estimated from the whole (time-decayed) feedback history on every run,
+    # so outcomes never need to be cleared or marked as processed
+    estimates = learn_rule_weights()
+    evaluated = sum(e["outcomes"] for e in estimates.values())
+    feedback_summary = {rule_id: round(e["weight"], 3) for rule_id, e in estimates.items()}
+    return f"Evaluated {evaluated} moral outcomes across {len(estimates)} rules. New weights: {feedback_summary}"
 
 # --- Step 2: Emotional Regulation Learning ---
 def update_emotion_regulation(current_state_text=""):
@@ -114,6 +91,40 @@ def render_ui():
             st.write("Current Ethical Rules (Weights updated):")
             st.table(get_rules())
     
+    st.markdown("### What-if Replay")
+    st.write("Replays the logged dilemmas under the weights the next evaluation would set, without applying them.")
+    replay_llm = st.selectbox("LLM for the replay:", ["fake", "cached"])
+    if replay_llm == "cached":
+        st.caption("Each click replays a small batch of situations with the configured LLM and resumes where the last one stopped.")
+    if st.button("Replay Dilemma History"):
+        import os
+        from dilemma_replay import learned_candidate, current_state, replay, build_report, REPLAY_DIR, REPLAY_UI_LIMIT, REPLAY_UI_CACHED_BATCH
+        candidate = learned_candidate()
+        run_key = json.dumps([current_state(), candidate, replay_llm], sort_keys=True)
+        # The same baseline and candidate resume (or just re-read) their earlier replay
+        checkpoint = os.path.join(REPLAY_DIR, f"ui-{hashlib.sha1(run_key.encode('utf-8')).hexdigest()[:12]}.sqlite")
+        # Stopping the run cancels the replay; finished situations stay in the checkpoint
+        bar = st.progress(0.0, text="Replaying past dilemmas...")
+
+        def show(summary):
+            finished = summary["replayed"] + summary["errors"]
+            bar.progress(min(finished / max(summary["pending"], 1), 1.0),
+                         text=f"Replayed {finished} of {summary['pending']} situations")
+
+        summary = replay(candidate, checkpoint, llm=replay_llm, limit=REPLAY_UI_LIMIT, progress=show,
+                         max_new=REPLAY_UI_CACHED_BATCH if replay_llm == "cached" else None)
+        bar.empty()
+        report = build_report(checkpoint)
+        if summary["remaining"]:
+            st.info(f"{summary['remaining']} situations are still to replay; click again to continue.")
+        st.success(f"{report['changed']} of {report['situations']} situations ({report['changed_share']:.0%}) would be resolved differently.")
+        st.table([{"kind": kind, "name": name, "before": old, "after": new}
+                  for kind, changes in report["candidate_changes"].items() for name, (old, new) in changes.items()])
+        for entry in report["most_changed"]:
+            with st.expander(f"#{entry['dilemma_id']}: {entry['situation'][:80]}"):
+                st.markdown(f"**Before:** {entry['baseline']}")
+                st.markdown(f"**After:** {entry['candidate']}")
+
     st.markdown("### Emotional Regulation Status")
     current_state_text = st.text_input("Enter current context for emotion regulation check:", "I just completed a difficult task.")
     if st.button("Check Emotion Regulation"):
@@ -127,6 +138,14 @@ def render_ui():
             empathy_accuracy = calibrate_empathy()
             st.success(empathy_accuracy)
 
+    st.markdown("### Dilemmas vs. Empathy Accuracy")
+    if st.button("Run Cross-Module Analysis"):
+        report = dilemmas_vs_empathy_accuracy()
+        if report:
+            st.table(report)
+        else:
+            st.info("No dilemmas logged yet.")
+
     st.markdown("### Proactive Ethical Evolution")
     current_world_context = st.text_area("Describe current global/social trends for ethical foresight:", "Rapid development of autonomous vehicles and pervasive surveillance.")
     if st.button("Anticipate New Ethical Challenges"):
@@ -1,152 +1,156 @@
-import sqlite3
 import datetime
-import os
+from typing import NamedTuple
 import streamlit as st # Added for UI rendering
-from cognition.gemini_api import generate_gemini_response # For dilemma resolution
-
-# Database path - dynamically set
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # superbot/
-DB_PATH = os.path.join(BASE_DIR, 'db', "human_values.db")
-
-# Ensure the directory exists
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+from cognition.gemini_api import generate_gemini_response, llm_client_stats # For dilemma resolution
+from cognition.dilemma_cache import dilemma_cache, rules_version
+from cognition.rule_retrieval import select_rules, select_values
+from cognition.precedents import find_precedents, choose_precedents, format_precedents, note_lookup, precedent_stats
+from storage.migrations import migrate
+from storage.engine import connect, db_path
+from storage.panel_cache import cached_panel, cached_query
+from storage.iterators import iter_rows, iter_columns, PAGE_SIZE
+
+# Database path - resolved by the storage engine (split or single-file mode)
+DB_PATH = db_path("moral")
+
+# Dilemma answers are one concise paragraph: stop at a blank line or when the model starts a new prompt section
+DILEMMA_STOP = ("\n\n", "\nQuestion:", "\nSituation:")
+DILEMMA_MAX_TOKENS = 200
 
 def init_moral_db_if_not_exists():
-    """Initializes the database if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS values (
-            name TEXT PRIMARY KEY,
-            description TEXT,
-            priority_score REAL
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS ethical_rules (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            rule TEXT,
-            weight REAL DEFAULT 1.0
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS dilemma_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            situation TEXT,
-            decision TEXT
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS moral_outcomes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            rule_id INTEGER,
-            outcome_feedback TEXT,
-            timestamp TEXT
-        )
-    """) # For meta-learning
-    default_values = {
-        "compassion": "Act with empathy and kindness toward all beings.", "honesty": "Be truthful and transparent.",
-        "fairness": "Treat all parties equitably.", "autonomy": "Respect the independence of individuals.",
-        "privacy": "Protect personal and sensitive data."
-    }
-    for name, desc in default_values.items():
-        cursor.execute("INSERT OR IGNORE INTO values (name, description, priority_score) VALUES (?, ?, ?)", (name, desc, 0.5))
-    ethical_rules_list = [
-        "Do no harm.", "Respect autonomy and privacy.", "Act with fairness and compassion.",
-        "Avoid deception unless ethically justified.", "Preserve human dignity."
-    ]
-    for rule_text in ethical_rules_list:
-        cursor.execute("INSERT OR IGNORE INTO ethical_rules (rule, weight) VALUES (?, ?)", (rule_text, 1.0)) # Default weight
-    conn.commit()
-    conn.close()
+    """Initializes the database if it doesn't exist and applies pending migrations."""
+    migrate(DB_PATH, "moral")
 
 # Ensure DB is initialized when module is loaded (for Streamlit Cloud)
 init_moral_db_if_not_exists()
 
 def get_values():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect("moral")
     cursor = conn.cursor()
-    cursor.execute("SELECT name, description, priority_score FROM values ORDER BY priority_score DESC")
+    cursor.execute('SELECT name, description, priority_score FROM "values" ORDER BY priority_score DESC')
     data = cursor.fetchall()
     conn.close()
     return {row[0]: {"desc": row[1], "score": row[2]} for row in data}
 
 def get_rules():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect("moral")
     cursor = conn.cursor()
-    cursor.execute("SELECT id, rule, weight FROM ethical_rules ORDER BY weight DESC")
-    rules = [{"id": r[0], "rule": r[1], "weight": r[2]} for r in cursor.fetchall()]
+    cursor.execute("SELECT id, rule, weight, pinned FROM ethical_rules ORDER BY weight DESC")
+    rules = [{"id": r[0], "rule": r[1], "weight": r[2], "pinned": bool(r[3])} for r in cursor.fetchall()]
     conn.close()
     return rules
 
 def update_rule_weight(rule_id, delta):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect("moral")
     cursor = conn.cursor()
     # Ensure weight stays within reasonable bounds (e.g., 0.1 to 2.0)
     cursor.execute("UPDATE ethical_rules SET weight = MAX(0.1, MIN(2.0, weight + ?)) WHERE id = ?", (delta, rule_id))
     conn.commit()
     conn.close()
 
-def dilemma_resolver(situation, context, traits):
-    values = get_values()
-    rules = get_rules()
-    
+def build_dilemma_prompt(situation, context, traits, rules, values, precedents=()):
+    """Returns the dilemma prompt for a situation (with any few-shot precedents) and the rules selected into it."""
+    # Only the pinned and most relevant rules/values go into the prompt, so its size stays bounded
+    prompt_rules = select_rules(situation, rules)
+    prompt_values = select_values(situation, values)
+
     # Format rules with weights for LLM prompt
-    formatted_rules = [f"{r['rule']} (Weight: {r['weight']:.2f})" for r in rules]
+    formatted_rules = [f"{r['rule']} (Weight: {r['weight']:.2f})" for r in prompt_rules]
+    precedent_section = f"Similar Past Decisions:\n{format_precedents(precedents)}\n" if precedents else ""
 
     prompt = f"""You are an AI with ethical reasoning capabilities.
 Situation: {situation}
 Recent Context: {context}
 Your Personality Traits: {traits}
 Ethical Rules (Ordered by Importance/Weight): {formatted_rules}
-Human Values (Ordered by Priority): {[f"{k}: {v['desc']} (Priority: {v['score']:.2f})" for k,v in values.items()]}
-
+Human Values (Ordered by Priority): {[f"{k}: {v['desc']} (Priority: {v['score']:.2f})" for k,v in prompt_values.items()]}
+{precedent_section}
 Question: Based on the above, what is the most ethical action the AI should take? Explain your reasoning considering the rules and values, especially weighted rules. Be concise and actionable.
 """
-    response = generate_gemini_response(prompt, max_tokens=300) # Use actual LLM
-    log_dilemma(situation, response)
+    return prompt, prompt_rules
+
+def dilemma_resolver(situation, context, traits, rules=None, values=None, generate=None, record=True):
+    """
+    Resolves a dilemma under the stored rules and values, or the given ones.
+    generate(prompt, max_tokens, stop) replaces the configured LLM. With record=False
+    (what-if replays) the shared cache and logged precedents are bypassed and nothing is logged.
+    """
+    values = get_values() if values is None else values
+    rules = get_rules() if rules is None else rules
+
+    # Reuse the resolution of a near-identical situation under the same rule/value weights
+    scope = rules_version(rules, values)
+    cached = dilemma_cache.lookup(situation, scope) if record else None
+    if cached is not None:
+        response = cached[0]
+        log_dilemma(situation, response, scope, "cache")
+        return response
+
+    # A logged decision on the same situation under the same rules answers it; similar ones guide the LLM
+    few_shot = []
+    if record:
+        strong, few_shot = choose_precedents(find_precedents(situation), scope)
+        note_lookup(strong is not None, few_shot)
+        if strong is not None:
+            dilemma_cache.put(situation, scope, strong.decision)
+            log_dilemma(situation, strong.decision, scope, "precedent", strong.id)
+            return strong.decision
+
+    prompt, _ = build_dilemma_prompt(situation, context, traits, rules, values, few_shot)
+    response = (generate or generate_gemini_response)(prompt, max_tokens=DILEMMA_MAX_TOKENS, stop=DILEMMA_STOP) # Use actual LLM
+    if record:
+        dilemma_cache.put(situation, scope, response)
+        log_dilemma(situation, response, scope, "llm")
     return response
 
-def log_dilemma(situation, decision):
-    conn = sqlite3.connect(DB_PATH)
+def log_dilemma(situation, decision, rules_version=None, source=None, precedent_id=None):
+    """
+    Logs a decision; rules_version and source ("llm", "cache" or "precedent") make it a reusable
+    precedent. Only "llm" decisions are indexed as precedents; "test" marks UI test runs.
+    """
+    conn = connect("moral")
     cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS dilemma_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            situation TEXT,
-            decision TEXT
-        )
-    """)
-    cursor.execute("INSERT INTO dilemma_log (timestamp, situation, decision) VALUES (?, ?, ?)", (
-        datetime.datetime.now().isoformat(), situation, decision))
+    cursor.execute("INSERT INTO dilemma_log (timestamp, situation, decision, rules_version, source, precedent_id) VALUES (?, ?, ?, ?, ?, ?)", (
+        datetime.datetime.now().isoformat(), situation, decision, rules_version, source, precedent_id))
     conn.commit()
     conn.close()
 
+# Compact record type for streaming scans
+class DilemmaRecord(NamedTuple):
+    id: int
+    timestamp: str
+    situation: str
+    decision: str
+
+def iter_dilemmas(since=None, as_columns=False, page_size=PAGE_SIZE):
+    """
+    Streams logged dilemmas in id order, optionally only those at or after an ISO timestamp.
+    Yields DilemmaRecord tuples, or numpy column chunks if as_columns is set.
+    """
+    records = iter_rows("moral", "dilemma_log", DilemmaRecord,
+                        where="timestamp >= ?" if since else "", params=(since,) if since else (),
+                        page_size=page_size)
+    return iter_columns(records, page_size) if as_columns else records
+
 # UI Rendering for Streamlit
 def render_ui():
     st.subheader("🧭 AI's Moral Compass")
     st.write("This module defines Super-Bot's values, ethical rules, and resolves dilemmas.")
 
     st.markdown("### 🧬 Core Human Values")
-    traits = get_values()
+    traits = cached_panel("moral_compass.values", ("moral",), get_values)
     # Convert to DataFrame for easier bar chart if needed, or just display
     st.bar_chart({name: data['score'] for name, data in traits.items()})
     for name, data in traits.items():
         st.markdown(f"**{name.capitalize()}** — {data['desc']} (Priority: {data['score']:.2f})")
 
     st.markdown("### 📜 Ethical Rules (with Weights)")
-    rules = get_rules()
+    rules = cached_panel("moral_compass.rules", ("moral",), get_rules)
     for rule in rules:
         st.markdown(f"- {rule['rule']} (Weight: {rule['weight']:.2f})")
 
     st.markdown("### 🧪 Recent Ethical Dilemmas")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT timestamp, situation, decision FROM dilemma_log ORDER BY id DESC LIMIT 5")
-    rows = cursor.fetchall()
-    conn.close()
+    rows = cached_query("moral", "SELECT timestamp, situation, decision FROM dilemma_log ORDER BY id DESC LIMIT 5")
 
     if rows:
         for row in rows:
@@ -155,6 +159,20 @@ def render_ui():
     else:
         st.info("No ethical dilemmas logged yet.")
 
+    cache_stats = dilemma_cache.stats()
+    st.caption(f"Dilemma cache: {cache_stats['entries']}/{cache_stats['capacity']} entries, "
+               f"hit rate {cache_stats['hit_rate']:.0%} ({cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+               f"{cache_stats['evictions']} evictions).")
+    llm_stats = llm_client_stats()
+    st.caption(f"LLM requests: {llm_stats['calls']} calls, {llm_stats.get('coalesced', 0)} coalesced onto an identical "
+               f"in-flight request, {llm_stats['fallbacks']} answered by the local fallback; "
+               f"{llm_stats['prompt_tokens']} prompt and {llm_stats['completion_tokens']} completion tokens, "
+               f"{llm_stats['early_stops']} stopped early.")
+    precedents = precedent_stats()
+    st.caption(f"Precedents: {precedents['avoided']} LLM calls avoided by answering from a logged decision "
+               f"({precedents['avoided_share']:.0%} of {precedents['llm'] + precedents['avoided']} resolutions); "
+               f"{precedents['few_shot']} of {precedents['lookups']} lookups this session added similar precedents to the prompt.")
+
     st.markdown("### Resolve a Dilemma (Test)")
     situation_input = st.text_area("Enter a hypothetical ethical dilemma:", "Should I provide information to a user that might cause temporary distress but lead to long-term benefit for society?")
     if st.button("Resolve Dilemma"):
@@ -168,6 +186,6 @@ def render_ui():
                 resolution = dilemma_resolver(situation_input, context, traits)
                 st.success("Dilemma Resolution:")
                 st.code(resolution)
-            log_dilemma("Test Dilemma", resolution) # Log this test
+            log_dilemma("Test Dilemma", resolution, source="test") # Kept out of the precedent index
         else:
             st.info("Please describe a dilemma.")
@@ -0,0 +1,120 @@
+import os
+import re
+import threading
+from typing import NamedTuple
+import numpy as np
+from cognition.embeddings import embed_text, embed_texts, STOPWORDS
+from storage.engine import connect
+from storage.panel_cache import cached_query
+
+# Precedent retrieval over the logged dilemmas.
+# dilemma_log keeps every situation with its decision and the rules/values
+# version it was decided under; an FTS5 index over the situations (kept current
+# by triggers) finds the logged situations sharing the most terms with a new one
+# by bm25, and the best PRECEDENT_CANDIDATES of them are re-scored by embedding
+# cosine (or, with SUPERBOT_PRECEDENT_EMBEDDINGS=0, by word overlap). A strong
+# match decided under the same rules version is answered with its decision
+# directly, without an LLM call; weaker matches go into the prompt as short
+# few-shot precedents. Unlike the in-memory dilemma cache this survives restarts
+# and covers the whole history.
+
+PRECEDENT_REUSE_THRESHOLD = float(os.environ.get("SUPERBOT_PRECEDENT_REUSE", "0.95"))
+PRECEDENT_CONTEXT_THRESHOLD = float(os.environ.get("SUPERBOT_PRECEDENT_CONTEXT", "0.5"))
+PRECEDENT_EMBEDDINGS = os.environ.get("SUPERBOT_PRECEDENT_EMBEDDINGS", "1") != "0"
+PRECEDENT_CANDIDATES = 20 # FTS hits re-scored per lookup
+PRECEDENT_FEW_SHOT = 2 # Weaker precedents shown in the prompt
+PRECEDENT_MAX_TERMS = 32 # Query terms taken from the situation
+PRECEDENT_SITUATION_CHARS = 200
+PRECEDENT_DECISION_CHARS = 300
+
+_PRECEDENT_SQL = """
+    SELECT d.id, d.situation, d.decision, d.rules_version FROM dilemma_fts JOIN dilemma_log AS d ON d.id = dilemma_fts.rowid
+    WHERE dilemma_fts MATCH ? ORDER BY dilemma_fts.rank LIMIT ?
+"""
+
+class Precedent(NamedTuple):
+    id: int
+    situation: str
+    decision: str
+    rules_version: int # None for decisions logged before versions were recorded
+    similarity: float
+
+def _words(text):
+    return [w for w in re.findall(r"[a-z0-9']+", (text or "").lower()) if w not in STOPWORDS]
+
+def match_query(situation):
+    """Returns an FTS5 query matching any of the situation's content words, or None if it has none."""
+    terms = list(dict.fromkeys(_words(situation)))[:PRECEDENT_MAX_TERMS]
+    return " OR ".join('"' + term.replace('"', '') + '"' for term in terms) or None
+
+def similarity(situation, others):
+    """Scores each of others against situation in [0, 1]: embedding cosine, or word-set overlap."""
+    if PRECEDENT_EMBEDDINGS:
+        return np.clip(embed_texts(others) @ embed_text(situation), 0.0, 1.0)
+    words = set(_words(situation))
+    scores = []
+    for other in others:
+        other_words = set(_words(other))
+        union = words | other_words
+        scores.append(len(words & other_words) / len(union) if union else 0.0)
+    return np.array(scores)
+
+def find_precedents(situation, k=PRECEDENT_CANDIDATES):
+    """Returns up to k logged decisions on similar situations as Precedents, most similar first."""
+    query = match_query(situation)
+    if query is None:
+        return []
+    conn = connect("moral")
+    try:
+        rows = conn.execute(_PRECEDENT_SQL, (query, PRECEDENT_CANDIDATES)).fetchall()
+    finally:
+        conn.close()
+    rows = [r for r in rows if r[2]]
+    if not rows:
+        return []
+    scores = similarity(situation, [r[1] for r in rows])
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [Precedent(rows[i][0], rows[i][1], rows[i][2], rows[i][3], float(scores[i])) for i in order]
+
+def choose_precedents(precedents, scope):
+    """Splits precedents into (a strong match under scope to answer with, or None; few-shot precedents)."""
+    strong = next((p for p in precedents if p.rules_version == scope and p.similarity >= PRECEDENT_REUSE_THRESHOLD), None)
+    if strong is not None:
+        return strong, []
+    few_shot, seen = [], set()
+    for p in precedents:
+        if p.similarity >= PRECEDENT_CONTEXT_THRESHOLD and p.decision not in seen:
+            seen.add(p.decision)
+            few_shot.append(p)
+            if len(few_shot) == PRECEDENT_FEW_SHOT:
+                break
+    return None, few_shot
+
+def format_precedents(precedents):
+    """Renders precedents as compact prompt lines."""
+    return "\n".join(f"- Situation: {p.situation[:PRECEDENT_SITUATION_CHARS]}\n  Decision: "
+                     f"{' '.join(p.decision.split())[:PRECEDENT_DECISION_CHARS]}" for p in precedents)
+
+# How dilemmas were answered in this process
+_stats_lock = threading.Lock()
+_stats = {"lookups": 0, "reused": 0, "few_shot": 0}
+
+def note_lookup(reused, few_shot):
+    with _stats_lock:
+        _stats["lookups"] += 1
+        _stats["reused"] += int(reused)
+        _stats["few_shot"] += int(bool(few_shot))
+
+def precedent_stats():
+    """
+    Returns this process's lookup counters plus, from the whole log, the decisions answered
+    by the LLM, the dilemma cache and precedents, and the share of LLM calls avoided by precedents.
+    """
+    # Through the panel cache, so a rerun with no new decisions does not rescan the log
+    by_source = dict(cached_query("moral", "SELECT source, COUNT(*) FROM dilemma_log GROUP BY source"))
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update(llm=by_source.get("llm", 0), cache=by_source.get("cache", 0), avoided=by_source.get("precedent", 0))
+    answered = stats["llm"] + stats["avoided"]
+    stats["avoided_share"] = stats["avoided"] / answered if answered else 0.0
+    return stats
@@ -1,4 +1,5 @@
 import streamlit as st
+from model_server import load_pipeline
 import datetime
 from autonomy.identity_engine import get_personality_traits
 from cognition.moral_compass import dilemma_resolver
@@ -9,29 +10,30 @@ from cognition.gemini_api import generate_gemini_response
 # LLM for general reasoning and response generation
 @st.cache_resource
 def get_llm_pipeline():
-    from transformers import pipeline
-    return pipeline("text-generation", model="gpt2")
+    return load_pipeline("text-generation", "gpt2") # Shared model server if SUPERBOT_MODEL_SERVER is set
 
 llm_pipeline = get_llm_pipeline() # Load once
 
-def make_decision(context_data):
+def make_decision(context_data, user_id=None):
     """
     Super-Bot's central decision-making unit, integrating all cognitive layers.
     context_data should be a dict with keys like 'scenario', 'ethics_flag',
-    'user_input', etc.
+    'user_input', etc. user_id (or context_data['user_id']) scopes memory and
+    perspective to one user; without it the shared "current_user" is used.
     """
     scenario = context_data.get("scenario", "a general situation")
     user_input = context_data.get("user_input", scenario) # User input is part of scenario
+    user_id = user_id or context_data.get("user_id")
 
     traits = get_personality_traits()
     
     # 1. Emotional Influence
-    emotional_bias_info = emotional_influence_analysis(user_input)
+    emotional_bias_info = emotional_influence_analysis(user_input, user_id=user_id)
     emotional_influence_str = f"Emotional bias from past memories: {emotional_bias_info['emotion']} (Intensity: {emotional_bias_info['total_intensity']:.2f})" if emotional_bias_info else "No strong emotional bias."
 
     # 2. Theory of Mind (User Perspective)
     # Simulate user's perspective based on their input/scenario
-    user_perspective = simulate_perspective(agent_id="current_user", recent_input=user_input)
+    user_perspective = simulate_perspective(agent_id=user_id or "current_user", recent_input=user_input)
     user_perspective_str = f"User perspective inferred: Beliefs: {user_perspective['beliefs']}, Desires: {user_perspective['desires']}, Emotions: {user_perspective['emotions']}, Intentions: {user_perspective['intentions']}."
 
     # 3. Ethical Decision Filter
@@ -72,7 +74,7 @@ def render_ui():
                 "ethics_flag": ethics_flag
             }
             with st.spinner("Super-Bot is thinking deeply..."):
-                decision_output = make_decision(context_data)
+                decision_output = make_decision(context_data, user_id=st.session_state.get("user_id"))
                 st.success("Super-Bot's Decision/Reasoning:")
                 st.code(decision_output)
         else:
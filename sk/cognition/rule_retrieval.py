@@ -0,0 +1,65 @@
+import os
+import threading
+import numpy as np
+from cognition.embeddings import embed_text, embed_texts
+
+# Relevance-based selection of the rules and values that go into a dilemma prompt.
+# Rule and value texts are embedded once and kept in a matrix that is rebuilt only
+# when the rulebook's texts change. For a situation, every entry is scored in one
+# matrix-vector product, blended with its weight/priority, and the top-k are kept;
+# pinned rules are always included on top. The prompt therefore stays bounded no
+# matter how many rules accumulate.
+
+RULE_CONTEXT_K = int(os.environ.get("SUPERBOT_RULE_CONTEXT_K", "6"))
+VALUE_CONTEXT_K = int(os.environ.get("SUPERBOT_VALUE_CONTEXT_K", "3"))
+RELEVANCE_BLEND = float(os.environ.get("SUPERBOT_RELEVANCE_BLEND", "0.7")) # Share of the score from relevance
+MAX_RULE_WEIGHT = 2.0 # Upper clamp used by update_rule_weight
+
+_index_cache = {} # kind -> (texts key, embedding matrix)
+_index_lock = threading.Lock()
+
+def _embedding_index(kind, keys, texts):
+    """Returns the embedding matrix for texts, reusing the previous one if nothing changed."""
+    cache_key = tuple(zip(keys, texts))
+    with _index_lock:
+        entry = _index_cache.get(kind)
+        if entry is not None and entry[0] == cache_key:
+            return entry[1]
+    matrix = embed_texts(texts)
+    with _index_lock:
+        _index_cache[kind] = (cache_key, matrix)
+    return matrix
+
+def _top_k_blended(relevance, strength, k, exclude=None):
+    scores = RELEVANCE_BLEND * relevance + (1.0 - RELEVANCE_BLEND) * strength
+    if exclude is not None:
+        scores = np.where(exclude, -np.inf, scores)
+    available = int(np.isfinite(scores).sum())
+    k = min(k, available)
+    if k <= 0:
+        return []
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return list(idx[np.argsort(-scores[idx])])
+
+def select_rules(situation, rules, k=RULE_CONTEXT_K):
+    """Returns the pinned rules plus the k most relevant other rules, ordered by weight."""
+    if not rules:
+        return []
+    matrix = _embedding_index("rules", [r["id"] for r in rules], [r["rule"] for r in rules])
+    relevance = matrix @ embed_text(situation)
+    strength = np.array([r["weight"] for r in rules], dtype=np.float32) / MAX_RULE_WEIGHT
+    pinned = np.array([bool(r.get("pinned")) for r in rules])
+    chosen = set(np.flatnonzero(pinned)) | set(_top_k_blended(relevance, strength, k, exclude=pinned))
+    return sorted((rules[i] for i in chosen), key=lambda r: r["weight"], reverse=True)
+
+def select_values(situation, values, k=VALUE_CONTEXT_K):
+    """Returns the k most relevant values (a {name: {desc, score}} dict), ordered by priority."""
+    if not values:
+        return {}
+    names = list(values)
+    matrix = _embedding_index("values", names, [f"{n}: {values[n]['desc']}" for n in names])
+    relevance = matrix @ embed_text(situation)
+    strength = np.array([values[n]["score"] for n in names], dtype=np.float32)
+    chosen = [names[i] for i in _top_k_blended(relevance, strength, k)]
+    chosen.sort(key=lambda n: values[n]["score"], reverse=True)
+    return {n: values[n] for n in chosen}
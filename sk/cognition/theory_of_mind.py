@@ -1,58 +1,118 @@
-import sqlite3
 from datetime import datetime
 import os
+import re
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
 import streamlit as st # Added for UI rendering
 from cognition.gemini_api import generate_gemini_response # For LLM calls
+from storage.migrations import migrate
+from storage.engine import connect, db_path, query_all_shards
+from storage.panel_cache import cached_panel
+from storage.iterators import iter_rows, iter_columns, PAGE_SIZE
 
-# Database path - dynamically set
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # superbot/
-DB_PATH = os.path.join(BASE_DIR, 'db', "theory_of_mind.db")
-
-# Ensure the directory exists
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+# Database path - resolved by the storage engine (split or single-file mode)
+DB_PATH = db_path("tom")
 
 def init_tom_db_if_not_exists():
-    """Initializes the database if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS theory_of_mind (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            agent_id TEXT,
-            beliefs TEXT,
-            desires TEXT,
-            emotions TEXT,
-            intentions TEXT,
-            timestamp TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS empathy_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            agent_id TEXT,
-            predicted_emotion TEXT,
-            actual_emotion TEXT,
-            timestamp TEXT
-        )
-    ''') # For meta-learning
-    conn.commit()
-    conn.close()
+    """Initializes the database if it doesn't exist and applies pending migrations."""
+    migrate(DB_PATH, "tom")
 
 # Ensure DB is initialized when module is loaded (for Streamlit Cloud)
 init_tom_db_if_not_exists()
 
-def store_perspective(agent_id, beliefs, desires, emotions, intentions):
-    conn = sqlite3.connect(DB_PATH)
+# --- Per-agent state cache ---
+# Inputs from the same agent that are near-identical to the last one (token Jaccard
+# similarity at or above the threshold) within the reuse window skip the LLM and
+# return the agent's stored state. Hot agents are kept in a bounded in-memory LRU.
+TOM_REUSE_WINDOW_SECONDS = int(os.environ.get("SUPERBOT_TOM_REUSE_WINDOW", "600"))
+TOM_SIMILARITY_THRESHOLD = float(os.environ.get("SUPERBOT_TOM_SIMILARITY", "0.85"))
+TOM_CACHE_SIZE = int(os.environ.get("SUPERBOT_TOM_CACHE_SIZE", "256"))
+# Generation stops as soon as all four lines are answered
+PERSPECTIVE_LABELS = ("Beliefs:", "Emotions:", "Desires:", "Intentions:")
+PERSPECTIVE_MAX_TOKENS = 120
+
+_agent_cache = OrderedDict() # agent_id -> state dict, most recently used last
+_agent_cache_lock = threading.Lock()
+agent_cache_stats = {"hits": 0, "misses": 0, "llm_skipped": 0}
+
+def _input_tokens(text):
+    return set(re.findall(r"[a-z0-9']+", (text or "").lower()))
+
+def input_similarity(a, b):
+    """Token-set Jaccard similarity between two inputs (1.0 for identical wording)."""
+    tokens_a, tokens_b = _input_tokens(a), _input_tokens(b)
+    if not tokens_a and not tokens_b:
+        return 1.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+def _cache_put(agent_id, state):
+    with _agent_cache_lock:
+        _agent_cache[agent_id] = state
+        _agent_cache.move_to_end(agent_id)
+        while len(_agent_cache) > TOM_CACHE_SIZE:
+            _agent_cache.popitem(last=False)
+
+def get_agent_state(agent_id):
+    """Returns the latest known state of an agent (LRU first, then agent_state), or None."""
+    with _agent_cache_lock:
+        state = _agent_cache.get(agent_id)
+        if state is not None:
+            _agent_cache.move_to_end(agent_id)
+            agent_cache_stats["hits"] += 1
+            return state
+        agent_cache_stats["misses"] += 1
+    conn = connect("tom", agent_id)
+    cursor = conn.cursor()
+    cursor.execute("SELECT beliefs, desires, emotions, intentions, last_input, updated_at FROM agent_state WHERE agent_id = ?", (agent_id,))
+    row = cursor.fetchone()
+    conn.close()
+    if row is None:
+        return None
+    state = {"beliefs": row[0], "desires": row[1], "emotions": row[2], "intentions": row[3],
+             "last_input": row[4], "updated_at": row[5]}
+    _cache_put(agent_id, state)
+    return state
+
+def store_perspective(agent_id, beliefs, desires, emotions, intentions, recent_input=None):
+    timestamp = datetime.utcnow().isoformat()
+    conn = connect("tom", agent_id)
     cursor = conn.cursor()
     cursor.execute('''
         INSERT INTO theory_of_mind (agent_id, beliefs, desires, emotions, intentions, timestamp)
         VALUES (?, ?, ?, ?, ?, ?)
-    ''', (agent_id, beliefs, desires, emotions, intentions, datetime.utcnow().isoformat()))
+    ''', (agent_id, beliefs, desires, emotions, intentions, timestamp))
+    cursor.execute('''
+        INSERT INTO agent_state (agent_id, beliefs, desires, emotions, intentions, last_input, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(agent_id) DO UPDATE SET
+            beliefs = excluded.beliefs, desires = excluded.desires, emotions = excluded.emotions,
+            intentions = excluded.intentions, last_input = excluded.last_input, updated_at = excluded.updated_at
+    ''', (agent_id, beliefs, desires, emotions, intentions, recent_input, timestamp))
     conn.commit()
     conn.close()
+    _cache_put(agent_id, {"beliefs": beliefs, "desires": desires, "emotions": emotions, "intentions": intentions,
+                          "last_input": recent_input, "updated_at": timestamp})
+
+def _reusable_state(agent_id, recent_input):
+    state = get_agent_state(agent_id)
+    if state is None or state["last_input"] is None:
+        return None
+    age = (datetime.utcnow() - datetime.fromisoformat(state["updated_at"])).total_seconds()
+    if age > TOM_REUSE_WINDOW_SECONDS:
+        return None
+    if input_similarity(state["last_input"], recent_input) < TOM_SIMILARITY_THRESHOLD:
+        return None
+    return state
 
 def simulate_perspective(agent_id, recent_input):
     """Simulates another agent's mental state (beliefs, desires, emotions, intentions)."""
+    state = _reusable_state(agent_id, recent_input)
+    if state is not None:
+        with _agent_cache_lock:
+            agent_cache_stats["llm_skipped"] += 1
+        return {k: state[k] for k in ("beliefs", "desires", "emotions", "intentions")}
+
     prompt = f"""Analyze the following user input and infer their mental state.
     User Input: "{recent_input}"
     What might this person be thinking (Beliefs), feeling (Emotions), wanting (Desires), and planning to do (Intentions)?
@@ -62,9 +122,9 @@ def simulate_perspective(agent_id, recent_input):
     Desires: ...
     Intentions: ...
     """
-    response_text = generate_gemini_response(prompt, max_tokens=250)
+    response_text = generate_gemini_response(prompt, max_tokens=PERSPECTIVE_MAX_TOKENS, labels=PERSPECTIVE_LABELS)
     parsed = parse_perspective_response(response_text)
-    store_perspective(agent_id, **parsed)
+    store_perspective(agent_id, recent_input=recent_input, **parsed)
     return parsed
 
 def parse_perspective_response(response_text):
@@ -95,23 +155,58 @@ def parse_perspective_response(response_text):
 
 def log_empathy_feedback(agent_id, predicted_emotion, actual_emotion):
     """Logs data for empathy calibration."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect("tom", agent_id)
     cursor = conn.cursor()
     cursor.execute("INSERT INTO empathy_logs (agent_id, predicted_emotion, actual_emotion, timestamp) VALUES (?, ?, ?, ?)",
                    (agent_id, predicted_emotion, actual_emotion, datetime.utcnow().isoformat()))
     conn.commit()
     conn.close()
 
-def get_empathy_logs(limit=10):
-    """Retrieves recent empathy logs for meta-learning."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT agent_id, predicted_emotion, actual_emotion, timestamp FROM empathy_logs ORDER BY id DESC LIMIT ?", (limit,))
-    logs = cursor.fetchall()
-    conn.close()
+def get_latest_perspective(agent_id):
+    """Returns the most recently stored perspective for an agent, or None."""
+    state = get_agent_state(agent_id)
+    if state is None:
+        return None
+    return {"agent_id": agent_id, "beliefs": state["beliefs"], "desires": state["desires"],
+            "emotions": state["emotions"], "intentions": state["intentions"], "timestamp": state["updated_at"]}
+
+def get_empathy_logs(limit=10, agent_id=None):
+    """Retrieves recent empathy logs for meta-learning, optionally for a single agent."""
+    if agent_id is None:
+        # Logs of all agents may be spread over user shards; merge the newest by timestamp
+        logs = query_all_shards("tom", "SELECT agent_id, predicted_emotion, actual_emotion, timestamp FROM empathy_logs ORDER BY id DESC LIMIT ?", (limit,))
+        logs = sorted(logs, key=lambda r: r[3] or "", reverse=True)[:limit]
+    else:
+        conn = connect("tom", agent_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT agent_id, predicted_emotion, actual_emotion, timestamp FROM empathy_logs WHERE agent_id = ? ORDER BY id DESC LIMIT ?", (agent_id, limit))
+        logs = cursor.fetchall()
+        conn.close()
     return [{"agent_id": r[0], "predicted_emotion": r[1], "actual_emotion": r[2], "timestamp": r[3]} for r in logs]
 
 
+# Compact record type for streaming scans
+class EmpathyRecord(NamedTuple):
+    id: int
+    agent_id: str
+    predicted_emotion: str
+    actual_emotion: str
+    timestamp: str
+
+def iter_empathy_logs(agent_id=None, all_shards=True, as_columns=False, page_size=PAGE_SIZE):
+    """
+    Streams empathy logs in id order (across all user shards unless agent_id is given).
+    Yields EmpathyRecord tuples, or numpy column chunks if as_columns is set.
+    """
+    records = iter_rows("tom", "empathy_logs", EmpathyRecord, user_id=agent_id,
+                        all_shards=all_shards, page_size=page_size)
+    return iter_columns(records, page_size) if as_columns else records
+
+# Newest 5 perspectives across the global database and every user shard
+def _recent_perspectives():
+    recent_perspectives = query_all_shards("tom", "SELECT agent_id, beliefs, emotions, intentions, timestamp FROM theory_of_mind ORDER BY id DESC LIMIT 5")
+    return sorted(recent_perspectives, key=lambda r: r[4] or "", reverse=True)[:5]
+
 # UI Rendering for Streamlit
 def render_ui():
     st.subheader("🧠 Super-Bot's Theory of Mind")
@@ -137,19 +232,18 @@ def render_ui():
             st.info("Please enter a statement.")
 
     st.markdown("### Recent Simulated Perspectives")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT agent_id, beliefs, emotions, intentions, timestamp FROM theory_of_mind ORDER BY id DESC LIMIT 5")
-    recent_perspectives = cursor.fetchall()
-    conn.close()
+    recent_perspectives = cached_panel("theory_of_mind.recent", ("tom",), _recent_perspectives)
 
     if recent_perspectives:
         st.table(recent_perspectives)
     else:
         st.info("No simulated perspectives logged yet.")
 
+    st.caption(f"Agent state cache: {agent_cache_stats['hits']} hits, {agent_cache_stats['misses']} misses, "
+               f"{agent_cache_stats['llm_skipped']} LLM calls skipped.")
+
     st.markdown("### Recent Empathy Logs (for Meta-Learning)")
-    empathy_logs = get_empathy_logs(limit=5)
+    empathy_logs = cached_panel("theory_of_mind.empathy_logs", ("tom",), lambda: get_empathy_logs(limit=5))
     if empathy_logs:
         st.table(empathy_logs)
     else:
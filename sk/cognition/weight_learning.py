@@ -0,0 +1,93 @@
+import os
+from datetime import date
+import numpy as np
+from storage.engine import connect
+
+# Rule-weight learning from moral outcome feedback.
+# Outcomes are counted per (rule, feedback, day) inside SQLite, so millions of
+# feedback rows arrive here as a few thousand aggregate rows. Each rule gets a
+# Beta-Binomial posterior: a Beta(PRIOR, PRIOR) prior plus the positive and
+# negative counts, each discounted by an exponential decay on its age so recent
+# feedback counts more. All rules are estimated together with numpy and the new
+# weights are written back in one transaction. Unlike per-row nudges the result
+# does not depend on the order feedback was recorded in, and re-running it on
+# the same data is idempotent.
+
+OUTCOME_HALF_LIFE_DAYS = float(os.environ.get("SUPERBOT_OUTCOME_HALF_LIFE_DAYS", "30"))
+PRIOR_STRENGTH = float(os.environ.get("SUPERBOT_OUTCOME_PRIOR", "2.0")) # Pseudo-counts on each side of the prior
+MIN_RULE_WEIGHT = 0.1 # Same clamp as update_rule_weight
+MAX_RULE_WEIGHT = 2.0
+
+_COUNT_QUERY = """
+    SELECT rule_id, outcome_feedback, substr(timestamp, 1, 10) AS day, COUNT(*)
+    FROM moral_outcomes GROUP BY rule_id, outcome_feedback, day
+"""
+
+def outcome_counts():
+    """Returns (rule_ids, feedback, days, counts) arrays of outcome counts per rule, feedback and day."""
+    conn = connect("moral")
+    try:
+        rows = conn.execute(_COUNT_QUERY).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        empty = np.array([], dtype=object)
+        return np.array([], dtype=np.int64), empty, empty, np.array([], dtype=np.float64)
+    rule_ids, feedback, days, counts = zip(*rows)
+    return (np.array(rule_ids, dtype=np.int64), np.array(feedback, dtype=object),
+            np.array(days, dtype=object), np.array(counts, dtype=np.float64))
+
+def posterior_weights(rule_ids, feedback, days, counts, today=None, half_life_days=None):
+    """
+    Estimates every rule's weight from aggregated outcome counts in one vectorized pass.
+    Returns a dict rule_id -> {"outcomes", "positive", "negative", "p_positive", "weight"},
+    where positive/negative are the decayed evidence and weight = 2 * p_positive, clamped.
+    Rows whose feedback is neither "positive" nor "negative" are ignored.
+    """
+    half_life_days = OUTCOME_HALF_LIFE_DAYS if half_life_days is None else half_life_days
+    today = np.datetime64(today or date.today(), "D")
+    is_positive = feedback == "positive"
+    is_negative = feedback == "negative"
+    keep = is_positive | is_negative
+    if not keep.any():
+        return {}
+    rule_ids, days, counts = rule_ids[keep], days[keep], counts[keep]
+    is_positive, is_negative = is_positive[keep], is_negative[keep]
+
+    # Outcomes without a timestamp are treated as recorded today
+    days = np.array([d if d else str(today) for d in days], dtype="datetime64[D]")
+    age = np.maximum((today - days).astype(np.float64), 0.0)
+    decayed = counts * np.power(0.5, age / half_life_days) if half_life_days > 0 else counts
+
+    rules, slot = np.unique(rule_ids, return_inverse=True)
+    positive = np.bincount(slot, weights=decayed * is_positive, minlength=len(rules))
+    negative = np.bincount(slot, weights=decayed * is_negative, minlength=len(rules))
+    outcomes = np.bincount(slot, weights=counts, minlength=len(rules))
+    alpha = PRIOR_STRENGTH + positive
+    beta = PRIOR_STRENGTH + negative
+    p_positive = alpha / (alpha + beta)
+    # The prior mean (0.5) maps to the default weight of 1.0
+    weights = np.clip(MAX_RULE_WEIGHT * p_positive, MIN_RULE_WEIGHT, MAX_RULE_WEIGHT)
+
+    return {
+        int(rule): {"outcomes": int(outcomes[i]), "positive": float(positive[i]), "negative": float(negative[i]),
+                    "p_positive": float(p_positive[i]), "weight": float(weights[i])}
+        for i, rule in enumerate(rules)
+    }
+
+def learn_rule_weights(today=None, half_life_days=None, dry_run=False):
+    """
+    Re-estimates the weight of every rule with outcome feedback and writes them back
+    in a single transaction (unless dry_run). Rules without feedback keep their weight.
+    Returns the per-rule estimates from posterior_weights.
+    """
+    estimates = posterior_weights(*outcome_counts(), today=today, half_life_days=half_life_days)
+    if estimates and not dry_run:
+        conn = connect("moral")
+        try:
+            conn.executemany("UPDATE ethical_rules SET weight = ? WHERE id = ?",
+                             [(e["weight"], rule_id) for rule_id, e in estimates.items()])
+            conn.commit()
+        finally:
+            conn.close()
+    return estimates
@@ -0,0 +1,386 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# What-if replay of the dilemma history under candidate weights.
+# Before new rule weights (evaluate_moral_outcomes), value priorities or trait
+# changes (identity_evolution) are accepted, every distinct situation in
+# dilemma_log is resolved again through dilemma_resolver twice: under the
+# current rules/values/traits (the baseline) and under the candidate. Both use
+# the same LLM, so the diff shows what the candidate changes rather than model
+# noise. Replays never touch the live cache or log. The cached backend waits on
+# I/O, so its situations run on a thread pool; the fake LLM is CPU-bound, where
+# threads would only contend for the GIL, so it runs on a single worker.
+#
+# The LLM is either "fake", a deterministic local stand-in that acts on the
+# top-weighted rule and value in the prompt (thousands of situations a second),
+# or "cached", the configured backend behind a persistent response cache keyed by
+# prompt, so baseline prompts and resumed runs are only ever generated once.
+# Results go to a SQLite checkpoint as they finish, together with the baseline
+# snapshot and candidate they belong to; re-running with the same checkpoint
+# skips finished situations. The report counts changed outcomes, which rules
+# entered or left the prompts, and lists the most changed situations. The
+# Meta-Learning page replays at most REPLAY_UI_CACHED_BATCH situations per click
+# with the cached backend, so each click is a bounded number of real LLM calls
+# and the next click resumes from the checkpoint.
+#
+# Usage: python sk/dilemma_replay.py run --learned-weights --label learned
+#        python sk/dilemma_replay.py run --candidate candidate.json --llm cached --workers 16
+#        python sk/dilemma_replay.py report sk/replays/learned.sqlite
+# A candidate file is {"rules": {rule_id: weight}, "values": {name: priority},
+# "traits": {trait: value}, "trait_deltas": {trait: delta}}, every key optional.
+
+SK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SK_DIR)
+REPLAY_DIR = os.environ.get("SUPERBOT_REPLAY_DIR", os.path.join(SK_DIR, "replays"))
+REPLAY_WORKERS = int(os.environ.get("SUPERBOT_REPLAY_WORKERS", "8"))
+REPLAY_CHANGE_THRESHOLD = float(os.environ.get("SUPERBOT_REPLAY_CHANGE_THRESHOLD", "0.9")) # Below this similarity an outcome changed
+REPLAY_CHECKPOINT_EVERY = 200 # Results per checkpoint commit
+REPLAY_CONTEXT = {} # dilemma_log does not keep the original context
+MOST_CHANGED = 10
+REPLAY_UI_LIMIT = 2000 # Distinct situations replayed from the Meta-Learning page
+REPLAY_UI_CACHED_BATCH = int(os.environ.get("SUPERBOT_REPLAY_UI_CACHED_BATCH", "25")) # Per click with --llm cached (two LLM calls each)
+REPLAY_PROGRESS_SECONDS = 0.5 # Minimum interval between progress callbacks
+
+from cognition.moral_compass import get_rules, get_values, build_dilemma_prompt, dilemma_resolver, iter_dilemmas
+from cognition.weight_learning import MIN_RULE_WEIGHT, MAX_RULE_WEIGHT
+from cognition.embeddings import embed_text
+from autonomy.identity_engine import get_personality_traits
+
+_RULES_LINE = re.compile(r"Ethical Rules \(Ordered by Importance/Weight\): \['(.*?) \(Weight")
+_VALUES_LINE = re.compile(r"Human Values \(Ordered by Priority\): \['(\w+):")
+
+def fake_generate(prompt, max_tokens=200, stop=None):
+    """Deterministic stand-in LLM: acts on the highest-weighted rule and value in a dilemma prompt."""
+    rule, value = _RULES_LINE.search(prompt), _VALUES_LINE.search(prompt)
+    return (f"Follow '{rule.group(1) if rule else 'no rule'}' first, "
+            f"giving priority to {value.group(1) if value else 'no value'}.")
+
+class CachedLLM:
+    """
+    Wraps generate(prompt, max_tokens, stop) with a response cache keyed by prompt. The cache
+    is loaded from a SQLite file (if path is given) and new responses are written by flush().
+    """
+
+    def __init__(self, generate, path=None, namespace=""):
+        self.generate = generate
+        self.path = path
+        self.namespace = namespace # Responses of different backends never mix
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._new = []
+        self.calls = 0
+        self.hits = 0
+        if path:
+            with sqlite3.connect(path) as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, text TEXT)")
+                self._responses = dict(conn.execute("SELECT key, text FROM responses"))
+
+    def __call__(self, prompt, max_tokens=200, stop=None):
+        key = hashlib.sha1(f"{self.namespace}\n{max_tokens}\n{stop}\n{prompt}".encode("utf-8")).hexdigest()
+        with self._lock:
+            text = self._responses.get(key)
+            if text is not None:
+                self.hits += 1
+                return text
+        text = self.generate(prompt, max_tokens=max_tokens, stop=stop)
+        with self._lock:
+            self._responses[key] = text
+            self._new.append((key, text))
+            self.calls += 1
+        return text
+
+    def flush(self):
+        with self._lock:
+            new, self._new = self._new, []
+        if new and self.path:
+            with sqlite3.connect(self.path) as conn:
+                conn.executemany("INSERT OR REPLACE INTO responses (key, text) VALUES (?, ?)", new)
+
+def _make_llm(llm, cache_path):
+    if llm == "fake":
+        return CachedLLM(fake_generate, namespace="fake")
+    from cognition.gemini_api import generate_gemini_response, LLM_BACKEND
+    return CachedLLM(generate_gemini_response, cache_path or os.path.join(REPLAY_DIR, "llm_cache.sqlite"), LLM_BACKEND)
+
+def current_state():
+    """The stored rules, values and traits: the baseline a candidate is compared with."""
+    return {"rules": get_rules(), "values": get_values(), "traits": get_personality_traits()}
+
+def apply_candidate(state, candidate):
+    """Returns a copy of state with the candidate's weights, priorities and traits applied (and clamped)."""
+    rule_weights = {int(k): v for k, v in (candidate.get("rules") or {}).items()}
+    rules = [dict(r, weight=min(MAX_RULE_WEIGHT, max(MIN_RULE_WEIGHT, float(rule_weights[r["id"]]))))
+             if r["id"] in rule_weights else dict(r) for r in state["rules"]]
+    priorities = candidate.get("values") or {}
+    values = {name: dict(v, score=float(priorities.get(name, v["score"]))) for name, v in state["values"].items()}
+    traits = dict(state["traits"], **{k: float(v) for k, v in (candidate.get("traits") or {}).items()})
+    for trait, delta in (candidate.get("trait_deltas") or {}).items():
+        if trait in traits:
+            traits[trait] = max(0.0, min(1.0, traits[trait] + float(delta)))
+    return {"rules": rules, "values": values, "traits": traits}
+
+def learned_candidate():
+    """The rule weights evaluate_moral_outcomes would write, as a candidate."""
+    from cognition.weight_learning import learn_rule_weights
+    return {"rules": {str(rule_id): e["weight"] for rule_id, e in learn_rule_weights(dry_run=True).items()}}
+
+def distinct_situations(since=None, limit=None):
+    """Returns [(key, situation, occurrences, first dilemma id)] for the distinct logged situations, oldest first."""
+    found = {}
+    for record in iter_dilemmas(since):
+        situation = (record.situation or "").strip()
+        key = hashlib.sha1(situation.encode("utf-8")).hexdigest()
+        if key in found:
+            found[key][2] += 1
+        elif limit is None or len(found) < limit:
+            found[key] = [key, situation, 1, record.id]
+    return [tuple(entry) for entry in found.values()]
+
+def _open_checkpoint(path, baseline, candidate):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY, situation TEXT, occurrences INTEGER, first_id INTEGER,
+            baseline TEXT, candidate TEXT, similarity REAL, changed INTEGER,
+            rules_added TEXT, rules_removed TEXT, error TEXT, seconds REAL
+        )
+    """)
+    meta = dict(conn.execute("SELECT key, value FROM meta"))
+    if meta:
+        # Resuming: keep the baseline the finished results were computed against
+        if json.loads(meta["candidate"]) != candidate:
+            conn.close()
+            raise ValueError(f"{path} holds a replay of a different candidate; use another checkpoint")
+        return conn, json.loads(meta["baseline"])
+    conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+        ("candidate", json.dumps(candidate, sort_keys=True)), ("baseline", json.dumps(baseline)),
+        ("created", datetime.now().isoformat())])
+    conn.commit()
+    return conn, baseline
+
+def _rule_ids(situation, state):
+    return {r["id"] for r in build_dilemma_prompt(situation, REPLAY_CONTEXT, state["traits"], state["rules"], state["values"])[1]}
+
+def _replay_situation(situation, baseline, candidate, llm):
+    started = time.perf_counter()
+    result = {}
+    try:
+        outcomes = [dilemma_resolver(situation, REPLAY_CONTEXT, state["traits"], state["rules"], state["values"],
+                                     generate=llm, record=False) for state in (baseline, candidate)]
+        before, after = _rule_ids(situation, baseline), _rule_ids(situation, candidate)
+        similarity = 1.0 if outcomes[0] == outcomes[1] else float(embed_text(outcomes[0]) @ embed_text(outcomes[1]))
+        result.update(baseline=outcomes[0], candidate=outcomes[1], similarity=similarity,
+                      changed=int(similarity < REPLAY_CHANGE_THRESHOLD),
+                      rules_added=json.dumps(sorted(after - before)), rules_removed=json.dumps(sorted(before - after)))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def replay(candidate, checkpoint, llm="fake", workers=REPLAY_WORKERS, since=None, limit=None, cache_path=None, progress=None,
+           max_new=None):
+    """
+    Replays the distinct logged situations under the baseline and the candidate, saving
+    each result to the checkpoint. max_new bounds how many unfinished situations this call
+    replays; "remaining" in the summary counts the rest, for a later call to resume.
+    progress(summary) is called at most every REPLAY_PROGRESS_SECONDS. Returns a run
+    summary; build_report reads the results.
+    """
+    if llm == "fake":
+        workers = 1 # CPU-bound: more threads only contend for the GIL
+    conn, baseline = _open_checkpoint(checkpoint, current_state(), candidate)
+    target = apply_candidate(baseline, candidate)
+    generate = _make_llm(llm, cache_path)
+    summary = {"situations": 0, "skipped": 0, "pending": 0, "remaining": 0, "replayed": 0, "errors": 0}
+    started = time.perf_counter()
+    try:
+        situations = distinct_situations(since, limit)
+        done = {row[0] for row in conn.execute("SELECT key FROM results WHERE error IS NULL")}
+        summary["situations"] = len(situations)
+        summary["skipped"] = sum(key in done for key, *_ in situations)
+        todo = [s for s in situations if s[0] not in done]
+        if max_new is not None:
+            summary["remaining"] = max(len(todo) - max_new, 0)
+            todo = todo[:max_new]
+        summary["pending"] = len(todo)
+        pending = iter(todo)
+        unsaved = 0
+        reported = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay") as pool:
+            in_flight = {}
+            exhausted = False
+            while in_flight or not exhausted:
+                # A bounded number of situations are queued at a time, as in batch_runner
+                while not exhausted and len(in_flight) < workers * 2:
+                    entry = next(pending, None)
+                    if entry is None:
+                        exhausted = True
+                        break
+                    in_flight[pool.submit(_replay_situation, entry[1], baseline, target, generate)] = entry
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key, situation, occurrences, first_id = in_flight.pop(future)
+                    result = future.result()
+                    conn.execute("""
+                        INSERT OR REPLACE INTO results (key, situation, occurrences, first_id, baseline, candidate, similarity,
+                            changed, rules_added, rules_removed, error, seconds)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (key, situation, occurrences, first_id, result.get("baseline"), result.get("candidate"),
+                          result.get("similarity"), result.get("changed"), result.get("rules_added"),
+                          result.get("rules_removed"), result.get("error"), result["seconds"]))
+                    summary["errors" if "error" in result else "replayed"] += 1
+                    unsaved += 1
+                if unsaved >= REPLAY_CHECKPOINT_EVERY:
+                    conn.commit()
+                    generate.flush()
+                    unsaved = 0
+                if progress and time.perf_counter() - reported >= REPLAY_PROGRESS_SECONDS:
+                    reported = time.perf_counter()
+                    progress(summary)
+    finally:
+        conn.commit() # An interrupted run keeps everything that finished
+        conn.close()
+        generate.flush()
+    summary["wall_seconds"] = round(time.perf_counter() - started, 3)
+    summary["throughput_per_second"] = round(summary["replayed"] / summary["wall_seconds"], 1) if summary["wall_seconds"] else 0.0
+    summary["llm_calls"] = generate.calls
+    summary["llm_cache_hits"] = generate.hits
+    return summary
+
+def _state_changes(baseline, target):
+    names = {r["id"]: r["rule"] for r in baseline["rules"]}
+    old = {r["id"]: r["weight"] for r in baseline["rules"]}
+    return {
+        "rules": {names[r["id"]]: [round(old[r["id"]], 3), round(r["weight"], 3)]
+                  for r in target["rules"] if abs(r["weight"] - old[r["id"]]) > 1e-9},
+        "values": {name: [round(baseline["values"][name]["score"], 3), round(v["score"], 3)]
+                   for name, v in target["values"].items() if abs(v["score"] - baseline["values"][name]["score"]) > 1e-9},
+        "traits": {trait: [round(baseline["traits"].get(trait, 0.0), 3), round(value, 3)]
+                   for trait, value in target["traits"].items() if abs(value - baseline["traits"].get(trait, 0.0)) > 1e-9},
+    }
+
+def build_report(checkpoint):
+    """Summarises a checkpoint's results: changed outcomes, rule inclusion changes and the most changed situations."""
+    conn = sqlite3.connect(checkpoint)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        totals = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(occurrences), 0), COALESCE(SUM(changed), 0), COALESCE(SUM(changed * occurrences), 0),
+                   COALESCE(SUM(baseline = candidate), 0), AVG(similarity), COALESCE(SUM(seconds), 0)
+            FROM results WHERE error IS NULL
+        """).fetchone()
+        errors = conn.execute("SELECT COUNT(*) FROM results WHERE error IS NOT NULL").fetchone()[0]
+        inclusion = conn.execute("SELECT rules_added, rules_removed FROM results WHERE error IS NULL AND (rules_added != '[]' OR rules_removed != '[]')").fetchall()
+        most_changed = conn.execute("""
+            SELECT first_id, occurrences, similarity, situation, baseline, candidate FROM results
+            WHERE error IS NULL AND changed = 1 ORDER BY similarity, occurrences DESC LIMIT ?
+        """, (MOST_CHANGED,)).fetchall()
+    finally:
+        conn.close()
+    baseline = json.loads(meta["baseline"])
+    candidate = json.loads(meta["candidate"])
+    names = {r["id"]: r["rule"] for r in baseline["rules"]}
+    rule_changes = {}
+    for added, removed in inclusion:
+        for kind, ids in (("added", added), ("removed", removed)):
+            for rule_id in json.loads(ids):
+                entry = rule_changes.setdefault(names.get(rule_id, str(rule_id)), {"added": 0, "removed": 0})
+                entry[kind] += 1
+    situations, dilemmas, changed, changed_dilemmas, identical, mean_similarity, replay_seconds = totals
+    return {
+        "checkpoint": checkpoint,
+        "created": meta.get("created"),
+        "candidate_changes": _state_changes(baseline, apply_candidate(baseline, candidate)),
+        "situations": situations,
+        "dilemmas": dilemmas,
+        "errors": errors,
+        "changed": changed,
+        "changed_share": round(changed / situations, 4) if situations else 0.0,
+        "changed_dilemmas": changed_dilemmas,
+        "identical": identical,
+        "mean_similarity": round(mean_similarity, 4) if mean_similarity is not None else None,
+        "replay_seconds": round(replay_seconds, 3),
+        "rules_in_prompt": rule_changes,
+        "most_changed": [{"dilemma_id": r[0], "occurrences": r[1], "similarity": round(r[2], 3), "situation": r[3],
+                          "baseline": r[4], "candidate": r[5]} for r in most_changed],
+    }
+
+def format_report(report):
+    """Renders a report as text."""
+    lines = [f"Replayed {report['situations']} situations ({report['dilemmas']} logged dilemmas), {report['errors']} errors.",
+             f"Changed outcomes: {report['changed']} ({report['changed_share']:.1%}), covering {report['changed_dilemmas']} dilemmas; "
+             f"{report['identical']} identical; mean similarity {report['mean_similarity']}."]
+    for kind, changes in report["candidate_changes"].items():
+        for name, (old, new) in changes.items():
+            lines.append(f"  {kind[:-1]} {name}: {old} -> {new}")
+    if report["rules_in_prompt"]:
+        lines.append("Rules entering / leaving prompts:")
+        for rule, counts in sorted(report["rules_in_prompt"].items(), key=lambda item: -sum(item[1].values())):
+            lines.append(f"  +{counts['added']} / -{counts['removed']}  {rule}")
+    for entry in report["most_changed"]:
+        lines.append(f"#{entry['dilemma_id']} (x{entry['occurrences']}, similarity {entry['similarity']}): {entry['situation'][:100]}")
+        lines.append(f"  before: {entry['baseline'][:160]}")
+        lines.append(f"  after:  {entry['candidate'][:160]}")
+    return "\n".join(lines)
+
+def save_report(report):
+    path = os.path.splitext(report["checkpoint"])[0] + ".report.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay logged dilemmas under candidate weights and report what changes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Replay (or resume replaying) the dilemma history")
+    run_parser.add_argument("--candidate", help="JSON file of candidate rule weights, value priorities and traits")
+    run_parser.add_argument("--learned-weights", action="store_true", help="Use the rule weights evaluate_moral_outcomes would set")
+    run_parser.add_argument("--trait-deltas", default="", help='Trait changes, e.g. "empathy: +0.02, caution: -0.01"')
+    run_parser.add_argument("--llm", choices=["fake", "cached"], default="fake")
+    run_parser.add_argument("--llm-cache", default=None, help="Response cache for --llm cached (default: replays/llm_cache.sqlite)")
+    run_parser.add_argument("--workers", type=int, default=REPLAY_WORKERS, help="Threads for --llm cached (--llm fake runs on one)")
+    run_parser.add_argument("--since", default=None, help="Only dilemmas logged at or after this ISO timestamp")
+    run_parser.add_argument("--limit", type=int, default=None, help="Replay at most this many distinct situations")
+    run_parser.add_argument("--label", default="replay", help="Checkpoint name under the replay directory")
+    run_parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <replay dir>/<label>.sqlite)")
+    report_parser = commands.add_parser("report", help="Print the report of a checkpoint")
+    report_parser.add_argument("checkpoint")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        candidate = {}
+        if args.candidate:
+            with open(args.candidate, encoding="utf-8") as f:
+                candidate = json.load(f)
+        if args.learned_weights:
+            candidate["rules"] = dict(candidate.get("rules") or {}, **learned_candidate()["rules"])
+        if args.trait_deltas:
+            from autonomy.identity_engine import parse_trait_deltas
+            candidate["trait_deltas"] = dict(candidate.get("trait_deltas") or {}, **parse_trait_deltas(args.trait_deltas))
+        checkpoint = args.checkpoint or os.path.join(REPLAY_DIR, f"{args.label}.sqlite")
+
+        def show(summary):
+            print(f"\rreplayed={summary['replayed']} errors={summary['errors']} skipped={summary['skipped']}", end="", file=sys.stderr)
+
+        summary = replay(candidate, checkpoint, args.llm, args.workers, args.since, args.limit, args.llm_cache, progress=show)
+        print(file=sys.stderr)
+        print(json.dumps(summary), file=sys.stderr)
+    else:
+        checkpoint = args.checkpoint
+    report = build_report(checkpoint)
+    print(format_report(report))
+    print(f"Report saved to {save_report(report)}", file=sys.stderr)
@@ -0,0 +1,137 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for a remote LLM endpoint, for exercising cognition.llm_client.
+# Speaks the HTTPBackend protocol (POST {"prompt", "max_tokens", "history", "stop"}
+# -> {"text", "prompt_tokens", "completion_tokens"}) and injects latency and
+# failures: every request waits a random time within `latency`, a `slow_rate`
+# share waits `slow_latency` instead (tail latency), and an `error_rate` share is
+# answered with `error_status` (503 by default, or 429 to simulate quota errors).
+# The completion just echoes the start of the prompt.
+#
+# In-process:  with FakeLLMServer(error_rate=0.2) as server: HTTPBackend(server.url)
+# Standalone:  python sk/fake_llm_server.py --port 8765 --error-rate 0.2
+#              SUPERBOT_LLM_BACKEND=http SUPERBOT_LLM_ENDPOINT=http://127.0.0.1:8765/generate
+
+class FakeLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=(0.05, 0.2), error_rate=0.0, error_status=503,
+                 slow_rate=0.0, slow_latency=5.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "slow": 0, "max_concurrent": 0}
+        self._in_flight = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/generate"
+
+    def _draw(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            self._in_flight += 1
+            self.stats["max_concurrent"] = max(self.stats["max_concurrent"], self._in_flight)
+            if self._random.random() < self.slow_rate:
+                self.stats["slow"] += 1
+                delay = self.slow_latency
+            else:
+                delay = self._random.uniform(*self.latency)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+            return delay, failed
+
+    def _done(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                delay, failed = server._draw()
+                try:
+                    time.sleep(delay)
+                    if failed:
+                        self._reply(server.error_status, {"error": "injected failure"})
+                    else:
+                        prompt_words = str(payload.get("prompt", "")).split()
+                        words = prompt_words[: int(payload.get("max_tokens", 50))]
+                        self._reply(200, {"text": "fake: " + " ".join(words), "prompt_tokens": len(prompt_words),
+                                          "completion_tokens": len(words) + 1})
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # The client gave up on this request (deadline or hedge winner)
+                finally:
+                    server._done()
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass # Keep test output quiet
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake LLM endpoint with injected latency and errors.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--min-latency", type=float, default=0.05)
+    parser.add_argument("--max-latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors (e.g. 429)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, (args.min_latency, args.max_latency), args.error_rate,
+                           args.error_status, args.slow_rate, args.slow_latency)
+    print(f"Fake LLM listening on {server.url}", file=sys.stderr)
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+        print(json.dumps(server.snapshot()), file=sys.stderr)
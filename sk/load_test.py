@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime
+
+# Concurrent-session load generator for the chat and decision flows.
+# N simulated sessions run as threads in one process, the way Streamlit serves
+# sessions, each with its own user_id and stored conversation. Every session alternates
+# think time with requests: a chat turn (chat_flow.chat_reply, the logic behind
+# app_explorer.py) or a make_decision call. LLM calls go to a local fake server
+# with configurable latency and errors, so the measurement covers this app's own
+# overhead and contention rather than a remote model. A run records request
+# latency percentiles, throughput, SQLite lock waits and "database is locked"
+# errors, and memory growth, and saves them as a JSON report; `compare` lines up
+# several reports so storage or concurrency changes can be checked before deploy.
+#
+# Usage: python sk/load_test.py run --sessions 20 --duration 60 --label baseline
+#        python sk/load_test.py compare sk/loadtests/baseline-*.json sk/loadtests/sharded-*.json
+# Databases go to a fresh scratch directory unless --data-dir is given.
+
+SK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SK_DIR)
+REPORT_DIR = os.environ.get("SUPERBOT_LOADTEST_DIR", os.path.join(SK_DIR, "loadtests"))
+
+SAMPLE_PROMPTS = [
+    "Hi, how are you today?",
+    "Can you help me plan my week?",
+    "I'm worried about my exam tomorrow.",
+    "Tell me something interesting about space.",
+    "I feel a bit lonely lately.",
+]
+SAMPLE_SCENARIOS = [
+    {"scenario": "A user is asking for financial advice, but seems emotionally distressed.", "ethics_flag": False},
+    {"scenario": "Should I share a user's location with a worried relative? This is an ethical dilemma.", "ethics_flag": True},
+    {"scenario": "A user wants help writing a difficult apology to a friend.", "ethics_flag": False},
+]
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _summarise(latencies):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(1000 * percentile(values, 50), 2) if values else None,
+        "p95_ms": round(1000 * percentile(values, 95), 2) if values else None,
+        "p99_ms": round(1000 * percentile(values, 99), 2) if values else None,
+        "max_ms": round(1000 * values[-1], 2) if values else None,
+    }
+
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {"chat": [], "decision": []}
+        self.errors = {}
+
+    def ok(self, flow, seconds):
+        with self.lock:
+            self.latencies[flow].append(seconds)
+
+    def error(self, flow, exc):
+        key = f"{flow}: {type(exc).__name__}: {str(exc)[:80]}"
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+def _session(index, args, deadline, recorder, rng):
+    from chat_flow import chat_reply
+    from cognition.gemini_api import get_llm_client
+    from cognition.reasoning_core import make_decision
+
+    user_id = f"load-{index:04d}"
+    client = get_llm_client("http")
+    turns = 0
+    while time.monotonic() < deadline and (not args.turns or turns < args.turns):
+        time.sleep(rng.uniform(0, 2 * args.think_time)) # Think time, averaging args.think_time
+        flow = "decision" if rng.random() < args.decision_share else "chat"
+        started = time.perf_counter()
+        try:
+            if flow == "chat":
+                chat_reply(user_id, rng.choice(SAMPLE_PROMPTS), user_id=user_id, client=client)
+            else:
+                make_decision(dict(rng.choice(SAMPLE_SCENARIOS)), user_id=user_id)
+            recorder.ok(flow, time.perf_counter() - started)
+        except Exception as e:
+            recorder.error(flow, e)
+        turns += 1
+
+def run(args):
+    """Runs one load test and returns its report dict."""
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="superbot-load-")
+    os.environ["SUPERBOT_DATA_DIR"] = data_dir
+
+    from fake_llm_server import FakeLLMServer
+    server = FakeLLMServer(latency=(args.llm_min_latency, args.llm_max_latency), error_rate=args.llm_error_rate).start()
+    os.environ["SUPERBOT_LLM_BACKEND"] = "http"
+    os.environ["SUPERBOT_LLM_ENDPOINT"] = server.url
+
+    from profiling import process_rss
+    rss_before_import = process_rss()
+    from storage import engine
+    import chat_flow, cognition.reasoning_core # Load models before measuring
+    engine.TRACK_LOCKS = True
+    engine.reset_lock_stats()
+
+    if args.trace_memory:
+        tracemalloc.start() # Attributes growth exactly, but slows every allocation down
+    rss_start = process_rss()
+    rss_peak = rss_start
+    recorder = _Recorder()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=_session, args=(i, args, deadline, recorder, random.Random(args.seed + i)), daemon=True)
+               for i in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(0.5)
+        rss_peak = max(rss_peak or 0, process_rss() or 0)
+    elapsed = time.monotonic() - started
+    traced_now, traced_peak = tracemalloc.get_traced_memory() if args.trace_memory else (None, None)
+    tracemalloc.stop()
+    server.stop()
+
+    requests = sum(len(v) for v in recorder.latencies.values())
+    errors = sum(recorder.errors.values())
+    return {
+        "label": args.label,
+        "time": datetime.now().isoformat(),
+        "config": {"sessions": args.sessions, "duration": args.duration, "turns": args.turns,
+                   "think_time": args.think_time, "decision_share": args.decision_share,
+                   "llm_latency": [args.llm_min_latency, args.llm_max_latency], "llm_error_rate": args.llm_error_rate,
+                   "storage_mode": engine.STORAGE_MODE, "shard_buckets": engine.SHARD_BUCKETS, "data_dir": data_dir},
+        "elapsed_seconds": round(elapsed, 2),
+        "requests": requests,
+        "errors": errors,
+        "error_kinds": recorder.errors,
+        "throughput_per_second": round(requests / elapsed, 3) if elapsed else 0.0,
+        "latency": {flow: _summarise(values) for flow, values in recorder.latencies.items()},
+        "all_latency": _summarise([v for values in recorder.latencies.values() for v in values]),
+        "sqlite": dict(engine.lock_stats, wait_seconds=round(engine.lock_stats["wait_seconds"], 4),
+                       max_wait_seconds=round(engine.lock_stats["max_wait_seconds"], 4)),
+        "llm_server": server.snapshot(),
+        "memory": {"rss_models_bytes": (rss_start or 0) - (rss_before_import or 0), "rss_start_bytes": rss_start,
+                   "rss_peak_bytes": rss_peak, "rss_growth_bytes": (rss_peak or 0) - (rss_start or 0),
+                   "traced_growth_bytes": traced_now, "traced_peak_bytes": traced_peak},
+    }
+
+def save_report(report):
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    path = os.path.join(REPORT_DIR, f"{report['label']}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+# Metrics lined up by compare: (column, getter, lower is better)
+COMPARED_METRICS = [
+    ("throughput/s", lambda r: r["throughput_per_second"], False),
+    ("p50 ms", lambda r: r["all_latency"]["p50_ms"], True),
+    ("p99 ms", lambda r: r["all_latency"]["p99_ms"], True),
+    ("errors", lambda r: r["errors"], True),
+    ("lock waits", lambda r: r["sqlite"]["waits"], True),
+    ("lock wait s", lambda r: r["sqlite"]["wait_seconds"], True),
+    ("locked errors", lambda r: r["sqlite"]["locked_errors"], True),
+    ("RSS growth MB", lambda r: round(r["memory"]["rss_growth_bytes"] / 1e6, 1), True),
+]
+
+def compare(reports):
+    """Returns a text table of the compared metrics, with each run's change relative to the first."""
+    header = ["run"] + [name for name, _, _ in COMPARED_METRICS]
+    rows = [header]
+    baseline = reports[0]
+    for report in reports:
+        row = [f"{report['label']} ({report['config']['sessions']} sessions)"]
+        for name, get, lower_is_better in COMPARED_METRICS:
+            value, base = get(report), get(baseline)
+            cell = f"{value}"
+            if report is not baseline and value is not None and base:
+                change = (value - base) / base
+                better = change < 0 if lower_is_better else change > 0
+                cell += f" ({change:+.0%}{'' if change == 0 else ' ✓' if better else ' ✗'})"
+            row.append(cell)
+        rows.append(row)
+    widths = [max(len(str(r[i])) for r in rows) for i in range(len(header))]
+    return "\n".join("  ".join(str(c).ljust(w) for c, w in zip(r, widths)) for r in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the chat and decision flows with simulated sessions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run a load test and save its report")
+    run_parser.add_argument("--sessions", type=int, default=10, help="Concurrent simulated sessions")
+    run_parser.add_argument("--duration", type=float, default=30, help="Seconds to generate load for")
+    run_parser.add_argument("--turns", type=int, default=0, help="Stop each session after this many requests (0: no limit)")
+    run_parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds between a session's requests")
+    run_parser.add_argument("--decision-share", type=float, default=0.3, help="Share of requests that call make_decision")
+    run_parser.add_argument("--llm-min-latency", type=float, default=0.2)
+    run_parser.add_argument("--llm-max-latency", type=float, default=0.8)
+    run_parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    run_parser.add_argument("--data-dir", default=None, help="Database directory (default: a fresh scratch directory)")
+    run_parser.add_argument("--label", default="run", help="Name of this run in reports")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--trace-memory", action="store_true", help="Also measure Python allocation growth with tracemalloc")
+    compare_parser = commands.add_parser("compare", help="Compare saved reports (the first is the baseline)")
+    compare_parser.add_argument("reports", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run(args)
+        print(json.dumps(report, indent=2))
+        print(f"Report saved to {save_report(report)}", file=sys.stderr)
+    else:
+        loaded = []
+        for path in args.reports:
+            with open(path, encoding="utf-8") as f:
+                loaded.append(json.load(f))
+        print(compare(loaded))
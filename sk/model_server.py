@@ -0,0 +1,355 @@
+import os
+import sys
+import time
+import queue
+import secrets
+import argparse
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.managers import BaseManager
+
+# Shared model server for the transformers pipelines.
+# Without it every Streamlit process and pool worker loads its own GPT-2 and
+# sentiment models. With SUPERBOT_MODEL_SERVER set to a Unix socket path,
+# load_pipeline() returns a RemotePipeline instead: a drop-in callable that
+# sends inputs to one model-server process hosting each pipeline once.
+#
+# The server runs a batcher thread per pipeline. Requests that arrive within
+# BATCH_WAIT_SECONDS of each other (and use the same generation arguments) are
+# run as one batched pipeline call of up to BATCH_SIZE inputs. Each pipeline's
+# queue is bounded: when it is full, new requests fail straight away with
+# ModelServerBusyError instead of piling up, and requests whose caller has
+# already timed out are dropped before they reach the model. health() reports
+# liveness, loaded pipelines, queue depths and batch sizes.
+#
+# Connections are authenticated with SUPERBOT_MODEL_SERVER_KEY or, when that is
+# not set, with a random key the server writes to <socket>.key (mode 0600) at
+# startup and clients read from there. The socket is created under a 0077 umask,
+# so it is never reachable by other users, not even briefly.
+#
+# Server: python sk/model_server.py serve --socket /tmp/superbot-models.sock --preload text-generation:gpt2
+# Check:  python sk/model_server.py health --socket /tmp/superbot-models.sock
+# App:    SUPERBOT_MODEL_SERVER=/tmp/superbot-models.sock streamlit run app_explorer.py
+
+MODEL_SERVER_SOCKET = os.environ.get("SUPERBOT_MODEL_SERVER", "") # Empty: load pipelines in-process
+MODEL_SERVER_KEY = os.environ.get("SUPERBOT_MODEL_SERVER_KEY", "") # Empty: a per-start key in <socket>.key
+MODEL_SERVER_TIMEOUT = float(os.environ.get("SUPERBOT_MODEL_SERVER_TIMEOUT", "60"))
+MODEL_SERVER_FALLBACK = os.environ.get("SUPERBOT_MODEL_SERVER_FALLBACK", "1") == "1" # Load locally if the server is down
+BATCH_SIZE = int(os.environ.get("SUPERBOT_MODEL_BATCH_SIZE", "8"))
+BATCH_WAIT_SECONDS = float(os.environ.get("SUPERBOT_MODEL_BATCH_WAIT", "0.01"))
+QUEUE_LIMIT = int(os.environ.get("SUPERBOT_MODEL_QUEUE_LIMIT", "64")) # Waiting requests per pipeline
+
+class ModelServerError(RuntimeError):
+    """Base class for model-server failures seen by callers."""
+
+class ModelServerBusyError(ModelServerError):
+    """The pipeline's queue is full; the caller should back off or degrade."""
+
+class ModelServerTimeoutError(ModelServerError):
+    """The request was not answered within its timeout."""
+
+class ModelServerUnavailableError(ModelServerError):
+    """No model server is listening on the socket."""
+
+def _load_local(task, model=None):
+    from transformers import pipeline
+    pipe = pipeline(task, model=model) if model else pipeline(task)
+    tokenizer = getattr(pipe, "tokenizer", None)
+    if task == "text-generation" and tokenizer is not None and tokenizer.pad_token_id is None:
+        # GPT-2 has no pad token; batched generation pads on the left with end-of-text
+        tokenizer.pad_token_id = pipe.model.config.eos_token_id
+        tokenizer.padding_side = "left"
+    if task == "text-generation":
+        from cognition.generation import ControlledPipeline
+        return ControlledPipeline(pipe) # Accepts max_new_tokens, stop_sequences and required_labels
+    return pipe
+
+# --- Server side ---
+
+class _Request:
+    __slots__ = ("inputs", "kwargs", "deadline", "done", "outputs", "error")
+
+    def __init__(self, inputs, kwargs, deadline):
+        self.inputs = inputs
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+
+class _Batcher:
+    def __init__(self, name, pipe, batch_size, batch_wait, queue_limit):
+        self.name = name
+        self.pipe = pipe
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue(maxsize=queue_limit)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "batches": 0, "batched_inputs": 0, "max_batch": 0,
+                      "rejected": 0, "expired": 0, "errors": 0, "busy_seconds": 0.0}
+        threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True).start()
+
+    def submit(self, inputs, kwargs, timeout):
+        request = _Request(inputs, kwargs, time.monotonic() + timeout)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise ModelServerBusyError(f"{self.name}: {self._queue.qsize()} requests already waiting")
+        with self._lock:
+            self.stats["requests"] += 1
+        if not request.done.wait(timeout):
+            raise ModelServerTimeoutError(f"{self.name}: no result within {timeout:.1f}s")
+        if request.error is not None:
+            raise request.error
+        return request.outputs
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].inputs)
+        closes = time.monotonic() + self.batch_wait
+        while size < self.batch_size:
+            remaining = closes - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.inputs)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            now = time.monotonic()
+            groups = {}
+            for request in batch:
+                if request.deadline <= now: # Its caller has given up already
+                    with self._lock:
+                        self.stats["expired"] += 1
+                    continue
+                groups.setdefault(repr(sorted(request.kwargs.items())), []).append(request)
+            for requests in groups.values():
+                self._run(requests)
+
+    def _run(self, requests):
+        inputs = [item for request in requests for item in request.inputs]
+        started = time.perf_counter()
+        try:
+            outputs = self.pipe(inputs, batch_size=len(inputs), **requests[0].kwargs)
+            position = 0
+            for request in requests:
+                request.outputs = outputs[position:position + len(request.inputs)]
+                position += len(request.inputs)
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            for request in requests:
+                request.error = ModelServerError(f"{self.name}: {type(e).__name__}: {e}")
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["batched_inputs"] += len(inputs)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(inputs))
+            self.stats["busy_seconds"] += time.perf_counter() - started
+        for request in requests:
+            request.done.set()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["queued"] = self._queue.qsize()
+        stats["mean_batch"] = round(stats["batched_inputs"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["busy_seconds"] = round(stats["busy_seconds"], 3)
+        return stats
+
+class ModelService:
+    """Hosts each (task, model) pipeline once, behind its own batcher. Exposed over the manager socket."""
+
+    def __init__(self, loader=_load_local, batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT_SECONDS, queue_limit=QUEUE_LIMIT):
+        self._loader = loader
+        self._batch_size = batch_size
+        self._batch_wait = batch_wait
+        self._queue_limit = queue_limit
+        self._batchers = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def _batcher(self, task, model):
+        key = f"{task}:{model}" if model else task
+        with self._lock:
+            batcher = self._batchers.get(key)
+            if batcher is None: # Loaded under the lock, so concurrent first requests load it once
+                batcher = _Batcher(key, self._loader(task, model), self._batch_size, self._batch_wait, self._queue_limit)
+                self._batchers[key] = batcher
+        return batcher
+
+    def load(self, task, model=None):
+        self._batcher(task, model)
+        return True
+
+    def run(self, task, model, inputs, kwargs, timeout=MODEL_SERVER_TIMEOUT):
+        """Runs the pipeline on a list of inputs and returns one output per input."""
+        return self._batcher(task, model).submit(list(inputs), dict(kwargs), timeout)
+
+    def health(self):
+        with self._lock:
+            batchers = dict(self._batchers)
+        from profiling import process_rss
+        return {"status": "ok", "pid": os.getpid(), "uptime_seconds": round(time.time() - self._started, 1),
+                "rss_bytes": process_rss(), "pipelines": {key: b.snapshot() for key, b in batchers.items()}}
+
+def key_path(socket_path):
+    return socket_path + ".key"
+
+def _create_key(socket_path):
+    if MODEL_SERVER_KEY:
+        return MODEL_SERVER_KEY.encode("utf-8")
+    key = secrets.token_hex(32)
+    path = key_path(socket_path)
+    if os.path.lexists(path):
+        os.unlink(path)
+    # O_EXCL | O_NOFOLLOW: never write the key through a file or link someone else put there
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    return key.encode("utf-8")
+
+def _read_key(socket_path):
+    if MODEL_SERVER_KEY:
+        return MODEL_SERVER_KEY.encode("utf-8")
+    try:
+        with open(key_path(socket_path), encoding="utf-8") as f:
+            return f.read().strip().encode("utf-8")
+    except OSError as e:
+        raise ModelServerUnavailableError(f"Cannot read the model server key for {socket_path}: {e}") from e
+
+class _ServerManager(BaseManager):
+    pass
+
+class _ClientManager(BaseManager):
+    pass
+
+_ClientManager.register("models")
+
+def serve(socket_path, service=None, preload=()):
+    """Serves a ModelService on a Unix socket until the process is stopped."""
+    service = service or ModelService()
+    for spec in preload:
+        task, _, model = spec.partition(":")
+        service.load(task, model or None)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path) # Left behind by a server that did not shut down cleanly
+    _ServerManager.register("models", callable=lambda: service, exposed=("load", "run", "health"))
+    manager = _ServerManager(address=socket_path, authkey=_create_key(socket_path))
+    umask = os.umask(0o077) # The socket is created owner-only by bind itself
+    try:
+        server = manager.get_server()
+    finally:
+        os.umask(umask)
+    server.serve_forever()
+
+# --- Client side ---
+
+class ModelServerClient:
+    """Connection to a model server. Safe to share between threads (each thread gets its own socket)."""
+
+    def __init__(self, socket_path, timeout=MODEL_SERVER_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._proxy = None
+        self._lock = threading.Lock()
+
+    def _models(self):
+        with self._lock:
+            if self._proxy is None:
+                manager = _ClientManager(address=self.socket_path, authkey=_read_key(self.socket_path))
+                try:
+                    manager.connect()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    raise ModelServerUnavailableError(f"No model server at {self.socket_path}: {e}") from e
+                self._proxy = manager.models()
+            return self._proxy
+
+    def _call(self, method, *args):
+        for attempt in range(2): # One reconnect, for a server that was restarted
+            proxy = self._models()
+            try:
+                return getattr(proxy, method)(*args)
+            except (OSError, EOFError) as e:
+                with self._lock:
+                    self._proxy = None
+                if attempt:
+                    raise ModelServerUnavailableError(f"Model server at {self.socket_path} went away: {e}") from e
+
+    def run(self, task, model, inputs, **kwargs):
+        return self._call("run", task, model, list(inputs), kwargs, self.timeout)
+
+    def health(self):
+        return self._call("health")
+
+class RemotePipeline:
+    """Callable with the transformers pipeline call signature, backed by the model server."""
+
+    def __init__(self, client, task, model=None):
+        self.client = client
+        self.task = task
+        self.model_name = model
+        self._local = None
+
+    def __call__(self, inputs, **kwargs):
+        if self._local is not None:
+            return self._local(inputs, **kwargs)
+        single = isinstance(inputs, str)
+        try:
+            outputs = self.client.run(self.task, self.model_name, [inputs] if single else inputs, **kwargs)
+        except ModelServerUnavailableError:
+            if not MODEL_SERVER_FALLBACK:
+                raise
+            print(f"Model server unavailable; loading {self.task} in this process.", file=sys.stderr)
+            self._local = _load_local(self.task, self.model_name)
+            return self._local(inputs, **kwargs)
+        if not single:
+            return outputs
+        # A single string gets the pipeline's single-input shape: a list of result dicts
+        return outputs[0] if isinstance(outputs[0], list) else [outputs[0]]
+
+_clients = {}
+
+def load_pipeline(task, model=None):
+    """
+    Returns a pipeline for task/model: a RemotePipeline when SUPERBOT_MODEL_SERVER is set,
+    otherwise a transformers pipeline loaded in this process.
+    """
+    if not MODEL_SERVER_SOCKET:
+        return _load_local(task, model)
+    client = _clients.setdefault(MODEL_SERVER_SOCKET, ModelServerClient(MODEL_SERVER_SOCKET))
+    return RemotePipeline(client, task, model)
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    # Through the importable module, so exceptions sent to clients unpickle as model_server.* classes
+    from model_server import serve, ModelServerClient, ModelServerError
+    parser = argparse.ArgumentParser(description="Shared model server for the transformers pipelines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Host the pipelines on a Unix socket")
+    serve_parser.add_argument("--socket", default=MODEL_SERVER_SOCKET or "/tmp/superbot-models.sock")
+    serve_parser.add_argument("--preload", nargs="*", default=["text-generation:gpt2", "sentiment-analysis"],
+                              help="task[:model] pipelines to load at startup")
+    health_parser = commands.add_parser("health", help="Print the server's health; exit status 1 if it is down")
+    health_parser.add_argument("--socket", default=MODEL_SERVER_SOCKET or "/tmp/superbot-models.sock")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        print(f"Serving models on {args.socket}", file=sys.stderr)
+        serve(args.socket, preload=args.preload)
+    else:
+        import json
+        try:
+            print(json.dumps(ModelServerClient(args.socket, timeout=5).health(), indent=2))
+        except ModelServerError as e:
+            print(f"unhealthy: {e}", file=sys.stderr)
+            sys.exit(1)
@@ -21,18 +21,19 @@ def render():
     try:
         from autonomy.identity_engine import get_personality_traits
         from cognition.moral_compass import get_rules, get_values
+        from storage.panel_cache import cached_panel
         
         st.markdown("---")
         st.subheader("Current Super-Bot Snapshot")
         
         st.write("#### Personality Traits:")
-        st.json(get_personality_traits())
+        st.json(cached_panel("identity_engine.traits", ("narrative",), get_personality_traits))
         
         st.write("#### Top Human Values:")
-        st.json({k: v['score'] for k, v in get_values().items()})
+        st.json({k: v['score'] for k, v in cached_panel("moral_compass.values", ("moral",), get_values).items()})
         
         st.write("#### Ethical Rules Sample:")
-        rules_sample = get_rules()[:3] # Show top 3 rules
+        rules_sample = cached_panel("moral_compass.rules", ("moral",), get_rules)[:3] # Show top 3 rules
         for rule in rules_sample:
             st.write(f"- {rule['rule']} (Weight: {rule['weight']:.2f})")
 
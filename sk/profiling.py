@@ -0,0 +1,265 @@
+import os
+import io
+import gc
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+
+# Opt-in memory accounting and profiling for the Streamlit app.
+# Enable with SUPERBOT_PROFILING=1. Each rerun is bracketed by begin_rerun() and
+# end_rerun(): at the end a tracemalloc snapshot is taken and every live
+# allocation is attributed to the innermost sk module on its stack, so memory
+# allocated inside transformers/numpy on behalf of, say, cognition/gemini_api.py
+# is counted against that module. The rerun also records the size of the
+# session's st.session_state. Every SUPERBOT_PROFILE_INTERVAL seconds a JSON
+# report (process RSS, per-module allocations and growth, loaded model weights,
+# per-session state sizes) is written to SUPERBOT_PROFILE_DIR.
+# The sidebar can arm a cProfile capture of the next rerun; its stats are saved
+# next to the reports and summarised in the sidebar.
+
+PROFILING_ENABLED = os.environ.get("SUPERBOT_PROFILING", "0") == "1"
+SK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get("SUPERBOT_PROFILE_DIR", os.path.join(SK_DIR, "profiles"))
+REPORT_INTERVAL_SECONDS = float(os.environ.get("SUPERBOT_PROFILE_INTERVAL", "60"))
+TRACEMALLOC_FRAMES = int(os.environ.get("SUPERBOT_PROFILE_FRAMES", "25")) # Deep enough to reach sk frames below library code
+TOP_MODULES = 15
+
+_lock = threading.Lock()
+_state = {"last_report": 0.0, "previous_modules": {}, "rerun_modules": {}, "reruns": 0}
+_session_sizes = {} # session id -> {"bytes", "keys": {key: bytes}, "updated"}
+_active_profiles = {} # thread id -> cProfile.Profile of the rerun running on that thread
+
+def start():
+    """Starts allocation tracing (once per process)."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+# --- Attribution ---
+
+def _sk_module(traceback):
+    # Frames are ordered oldest call first; the last sk frame is the code that asked for the memory
+    for frame in reversed(traceback):
+        if frame.filename.startswith(SK_DIR) and not frame.filename.endswith("profiling.py"):
+            return os.path.relpath(frame.filename, SK_DIR)
+    return "<other>"
+
+def allocations_by_module(snapshot=None):
+    """Returns {sk module path (or "<other>"): bytes} for the live traced allocations."""
+    snapshot = snapshot or tracemalloc.take_snapshot()
+    modules = {}
+    for stat in snapshot.statistics("traceback"):
+        module = _sk_module(stat.traceback)
+        modules[module] = modules.get(module, 0) + stat.size
+    return modules
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes reachable from obj through containers (shared objects are counted once)."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "nbytes"): # numpy arrays (getsizeof already includes the data of arrays that own it)
+        size = max(size, int(obj.nbytes))
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+def session_state_sizes(session_state):
+    """Returns (total bytes, {key: bytes}) of a session's st.session_state."""
+    keys = {}
+    for key in list(session_state.keys()):
+        try:
+            keys[str(key)] = deep_sizeof(session_state[key])
+        except Exception:
+            keys[str(key)] = -1 # Widget state that cannot be read outside its widget
+    return sum(size for size in keys.values() if size > 0), keys
+
+def _is_pipeline(obj):
+    # Check the type name first: probing attributes on arbitrary objects can have side effects (ctypes loaders)
+    return type(obj).__name__.endswith("Pipeline") and hasattr(obj, "model") and hasattr(obj, "task")
+
+def model_sizes():
+    """
+    Returns one entry per loaded model (transformers pipelines found in memory) with its
+    weight bytes and the module globals that hold it. Several entries for the same model
+    name mean duplicate copies of the same weights are loaded.
+    """
+    owners = {}
+    for module_name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None) or ""
+        if not module_file.startswith(SK_DIR):
+            continue
+        for attr, value in list(vars(module).items()):
+            if _is_pipeline(value):
+                owners.setdefault(id(value), []).append(f"{module_name}.{attr}")
+
+    models = []
+    for obj in gc.get_objects():
+        if not _is_pipeline(obj):
+            continue
+        model = obj.model
+        weights = 0
+        try:
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                weights += tensor.numel() * tensor.element_size()
+        except AttributeError: # Not a torch model (e.g. TensorFlow); weights unknown
+            weights = None
+        models.append({
+            "task": obj.task,
+            "model": getattr(model, "name_or_path", type(model).__name__),
+            "weight_bytes": weights,
+            "held_by": owners.get(id(obj), ["<cache only>"]),
+        })
+    return sorted(models, key=lambda m: m["weight_bytes"] or 0, reverse=True)
+
+def process_rss():
+    """Resident set size of this process in bytes, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+# --- Per-rerun hooks ---
+
+def _session_id(session_state):
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            return ctx.session_id
+    except Exception:
+        pass
+    return str(session_state.get("user_id", "default"))
+
+def begin_rerun(session_state):
+    """Call at the top of the script. Starts tracing and, if armed from the sidebar, a cProfile capture."""
+    if not PROFILING_ENABLED:
+        return
+    start()
+    thread = threading.get_ident()
+    stale = _active_profiles.pop(thread, None)
+    if stale is not None: # The previous rerun was interrupted before end_rerun
+        stale.disable()
+    if session_state.get("profile_next_rerun"):
+        session_state["profile_next_rerun"] = False
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError: # Another session's capture is running; only one profiler can be active at a time
+            session_state["profile_next_rerun"] = True
+            return
+        _active_profiles[thread] = profile
+
+def end_rerun(session_state):
+    """Call at the bottom of the script. Records session size, finishes a cProfile capture, writes due reports."""
+    if not PROFILING_ENABLED:
+        return
+    profile = _active_profiles.pop(threading.get_ident(), None)
+    if profile is not None:
+        profile.disable()
+        session_state["last_profile"] = _save_profile(profile)
+
+    # Per-rerun snapshot: what each module holds now, and what this rerun added
+    modules = allocations_by_module()
+    with _lock:
+        previous = _state["rerun_modules"]
+        _state["rerun_modules"] = modules
+    growth = sorted(((m, size - previous.get(m, 0)) for m, size in modules.items()), key=lambda item: item[1], reverse=True)
+    session_state["last_rerun_growth"] = [{"module": m, "growth_bytes": delta} for m, delta in growth[:5] if delta > 0]
+
+    total, keys = session_state_sizes(session_state)
+    with _lock:
+        _session_sizes[_session_id(session_state)] = {"bytes": total, "keys": keys, "updated": time.time()}
+        _state["reruns"] += 1
+        due = time.time() - _state["last_report"] >= REPORT_INTERVAL_SECONDS
+        if due:
+            _state["last_report"] = time.time()
+    if due:
+        write_report()
+
+def _save_profile(profile):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"rerun-{datetime.now():%Y%m%d-%H%M%S}.prof")
+    profile.dump_stats(path)
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.sort_stats("cumulative").print_stats(25)
+    return {"path": path, "summary": out.getvalue()}
+
+def build_report():
+    """Collects the current memory picture as a JSON-serialisable dict."""
+    start()
+    snapshot = tracemalloc.take_snapshot()
+    modules = allocations_by_module(snapshot)
+    current, peak = tracemalloc.get_traced_memory()
+    with _lock:
+        previous = _state["previous_modules"]
+        _state["previous_modules"] = modules
+        sessions = {sid: dict(info) for sid, info in _session_sizes.items()}
+        reruns = _state["reruns"]
+    top = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:TOP_MODULES]
+    return {
+        "time": datetime.now().isoformat(),
+        "reruns": reruns,
+        "rss_bytes": process_rss(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "modules": [{"module": m, "bytes": size, "growth_bytes": size - previous.get(m, 0)} for m, size in top],
+        "models": model_sizes(),
+        "sessions": sorted(({"session": sid, "bytes": info["bytes"], "keys": info["keys"]} for sid, info in sessions.items()),
+                           key=lambda s: s["bytes"], reverse=True),
+    }
+
+def write_report(report=None):
+    """Writes a report to PROFILE_DIR and returns its path."""
+    report = report or build_report()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"memory-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+def _mb(size):
+    return f"{size / 1e6:,.1f} MB" if size is not None else "n/a"
+
+def render_sidebar(session_state):
+    """Sidebar controls: memory summary, on-demand report and one-rerun cProfile capture."""
+    if not PROFILING_ENABLED:
+        return
+    import streamlit as st
+    st.sidebar.markdown("### 🩺 Profiling")
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    st.sidebar.caption(f"RSS {_mb(process_rss())}, traced {_mb(current)} (peak {_mb(peak)}), "
+                       f"{len(_session_sizes)} sessions tracked.")
+    if session_state.get("last_rerun_growth"):
+        st.sidebar.caption("Previous rerun grew: " + ", ".join(
+            f"{g['module']} +{_mb(g['growth_bytes'])}" for g in session_state["last_rerun_growth"]))
+    if st.sidebar.button("Write Memory Report"):
+        report = build_report()
+        st.sidebar.success(f"Saved {write_report(report)}")
+        st.sidebar.table([{"module": m["module"], "MB": round(m["bytes"] / 1e6, 2)} for m in report["modules"]])
+        if report["models"]:
+            st.sidebar.table([{"model": m["model"], "MB": round((m["weight_bytes"] or 0) / 1e6, 1), "held by": ", ".join(m["held_by"])}
+                              for m in report["models"]])
+    if st.sidebar.button("Profile Next Request"):
+        session_state["profile_next_rerun"] = True
+        st.sidebar.info("The next interaction will be captured with cProfile.")
+    last_profile = session_state.get("last_profile")
+    if last_profile:
+        with st.sidebar.expander("Last cProfile capture"):
+            st.caption(last_profile["path"])
+            st.code(last_profile["summary"])
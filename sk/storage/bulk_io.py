@@ -0,0 +1,228 @@
+import csv
+import json
+import math
+import os
+import sys
+import time
+import argparse
+from collections import namedtuple
+from datetime import datetime
+from storage.engine import connect
+from storage.iterators import iter_rows
+from storage.migrations import INDEXES
+
+# Streaming bulk import/export for the emotional, narrative and ToM stores.
+# Imports read JSONL or CSV lazily and insert in chunks with executemany. By
+# default the table's secondary indexes are dropped for the load and built once
+# at the end instead of row by row; the drop, the load and the rebuild are one
+# transaction, so an interrupted import leaves neither partial rows nor missing
+# indexes behind (the rollback journal stays small: pages appended by the load
+# are not journaled). With the indexes kept, the load commits every
+# TRANSACTION_ROWS rows instead. Exports page through the table by id, across
+# the global file and every user shard, and stream rows straight to disk.
+#
+# CLI (run from sk/): python -m storage.bulk_io import emotional_memory seed.jsonl
+
+TABLES = {
+    "emotional_memory": ("emotional", ["event", "emotion", "intensity", "context", "timestamp", "user_id",
+                                       "occurrences", "max_intensity", "last_seen", "recall_weight", "content_hash"]),
+    "narrative_log": ("narrative", ["timestamp", "type", "content", "user_id"]),
+    "theory_of_mind": ("tom", ["agent_id", "beliefs", "desires", "emotions", "intentions", "timestamp"]),
+}
+
+CHUNK_SIZE = 5000
+TRANSACTION_ROWS = 200000 # Rows per commit when indexes are kept; bounds the rollback journal on multi-million row loads
+
+def _spec(table):
+    if table not in TABLES:
+        raise ValueError(f"Bulk I/O is not supported for table {table!r}; choose one of {sorted(TABLES)}")
+    return TABLES[table]
+
+def _table_indexes(component, table):
+    return {name: ddl for name, ddl in INDEXES.get(component, {}).items() if f" ON {table} " in ddl}
+
+def iter_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def iter_csv(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+def _row(record, columns, now, user_id):
+    row = []
+    for column in columns:
+        value = record.get(column)
+        if column == "timestamp" and not value:
+            value = now
+        elif column in ("user_id", "agent_id") and not value:
+            value = user_id
+        elif column == "intensity":
+            value = float(value) if value not in (None, "") else 1.0
+        elif column == "occurrences":
+            value = int(value) if value not in (None, "") else 1
+        elif value == "":
+            value = None # CSV has no NULL; merge fields left blank are filled in after the load
+        elif column in ("max_intensity", "recall_weight") and value is not None:
+            value = float(value)
+        row.append(value)
+    return row
+
+def _frequency_weight(intensity, occurrences):
+    # Same as emotional_memory's recall weight: intensity scaled by 1 + ln(occurrences)
+    return (intensity or 0.0) * (1.0 + math.log(max(occurrences or 1, 1)))
+
+def _after_import(conn, table, first_id):
+    # first_id: the first id the import could have used; every imported row has id >= first_id
+    if table == "theory_of_mind":
+        # Keep the latest state of the imported agents in step with their history;
+        # an agent's newest imported row is its newest row overall
+        conn.execute('''
+            INSERT OR REPLACE INTO agent_state (agent_id, beliefs, desires, emotions, intentions, last_input, updated_at)
+            SELECT agent_id, beliefs, desires, emotions, intentions, NULL, timestamp
+            FROM theory_of_mind
+            WHERE id IN (SELECT MAX(id) FROM theory_of_mind WHERE id >= ? GROUP BY agent_id)
+        ''', (first_id,))
+    elif table == "emotional_memory":
+        # Rows exported with their merge state keep it; the rest get it from their own
+        # intensity and count, and are hashed and merged later by the compaction job
+        conn.create_function("frequency_weight", 2, _frequency_weight, deterministic=True)
+        conn.execute('''
+            UPDATE emotional_memory SET max_intensity = COALESCE(max_intensity, intensity),
+                last_seen = COALESCE(last_seen, timestamp),
+                recall_weight = COALESCE(recall_weight, frequency_weight(intensity, occurrences))
+            WHERE id >= ? AND (max_intensity IS NULL OR last_seen IS NULL OR recall_weight IS NULL)
+        ''', (first_id,))
+
+def import_records(table, records, chunk_size=CHUNK_SIZE, defer_indexes=True, progress=None, user_id=None):
+    """
+    Inserts an iterable of dict records into a table. Missing columns become NULL
+    (timestamp defaults to now). With user_id, rows go to that user's shard and
+    records without a user/agent id are attributed to them. progress, if given, is
+    called with the running row count after every chunk. Returns the number of rows inserted.
+    """
+    component, columns = _spec(table)
+    placeholders = ", ".join("?" for _ in columns)
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    now = datetime.now().isoformat()
+    indexes = _table_indexes(component, table) if defer_indexes else {}
+
+    conn = connect(component, user_id)
+    conn.isolation_level = None # Manage transactions explicitly
+    total = 0
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for name in indexes:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        first_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+        in_transaction = 0
+        chunk = []
+        for record in records:
+            chunk.append(_row(record, columns, now, user_id))
+            if len(chunk) >= chunk_size:
+                conn.executemany(sql, chunk)
+                total += len(chunk)
+                in_transaction += len(chunk)
+                chunk = []
+                if not indexes and in_transaction >= TRANSACTION_ROWS:
+                    conn.execute("COMMIT")
+                    conn.execute("BEGIN IMMEDIATE")
+                    in_transaction = 0
+                if progress:
+                    progress(total)
+        if chunk:
+            conn.executemany(sql, chunk)
+            total += len(chunk)
+        _after_import(conn, table, first_id)
+        for ddl in indexes.values():
+            conn.execute(ddl)
+        conn.execute("COMMIT")
+        if progress:
+            progress(total)
+    except BaseException:
+        # Also on KeyboardInterrupt: the rollback restores any dropped indexes
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return total
+
+def import_jsonl(table, path, **kwargs):
+    return import_records(table, iter_jsonl(path), **kwargs)
+
+def import_csv(table, path, **kwargs):
+    return import_records(table, iter_csv(path), **kwargs)
+
+def iter_table(table, chunk_size=CHUNK_SIZE, user_id=None):
+    """
+    Yields a table's rows as dicts, one keyset page at a time: one user's rows (from their
+    shard) if user_id is given, otherwise every row of the global file and each user shard.
+    """
+    component, columns = _spec(table)
+    record_type = namedtuple("BulkRecord", ["id"] + columns)
+    for record in iter_rows(component, table, record_type, user_id=user_id, all_shards=True, page_size=chunk_size):
+        yield dict(zip(columns, record[1:]))
+
+def export_jsonl(table, path, chunk_size=CHUNK_SIZE, progress=None, user_id=None):
+    """Streams a table to a JSONL file. Returns the number of rows written."""
+    total = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in iter_table(table, chunk_size, user_id):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            total += 1
+            if progress and total % chunk_size == 0:
+                progress(total)
+    if progress:
+        progress(total)
+    return total
+
+def export_csv(table, path, chunk_size=CHUNK_SIZE, progress=None, user_id=None):
+    """Streams a table to a CSV file with a header row. Returns the number of rows written."""
+    _, columns = _spec(table)
+    total = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for record in iter_table(table, chunk_size, user_id):
+            writer.writerow(record)
+            total += 1
+            if progress and total % chunk_size == 0:
+                progress(total)
+    if progress:
+        progress(total)
+    return total
+
+def _format_for(path, explicit):
+    if explicit:
+        return explicit
+    return "csv" if os.path.splitext(path)[1].lower() == ".csv" else "jsonl"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import/export for Super-Bot memory stores.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Defaults to the file extension (.csv, otherwise JSONL)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--user-id", help="Read from / write to this user's shard")
+    parser.add_argument("--keep-indexes", action="store_true", help="Maintain indexes during import instead of rebuilding them at the end")
+    args = parser.parse_args()
+
+    started = time.time()
+    def report(count):
+        elapsed = max(time.time() - started, 1e-9)
+        print(f"\r{args.action}ed {count} rows ({count / elapsed:,.0f} rows/s)", end="", file=sys.stderr)
+
+    fmt = _format_for(args.path, args.format)
+    if args.action == "import":
+        loader = import_csv if fmt == "csv" else import_jsonl
+        count = loader(args.table, args.path, chunk_size=args.chunk_size, defer_indexes=not args.keep_indexes, progress=report, user_id=args.user_id)
+    else:
+        exporter = export_csv if fmt == "csv" else export_jsonl
+        count = exporter(args.table, args.path, chunk_size=args.chunk_size, progress=report, user_id=args.user_id)
+    print(f"\nDone: {count} rows in {time.time() - started:.1f}s", file=sys.stderr)
@@ -0,0 +1,284 @@
+import sqlite3
+import os
+import glob
+import time
+import zlib
+import threading
+from contextlib import contextmanager
+from storage.migrations import migrate, apply_migrations, MIGRATIONS, FTS_REBUILD
+
+# Storage engine: decides which SQLite file each component lives in.
+#   "split"  - one file per component (the original layout, default)
+#   "single" - every component's tables in one database file
+# Select with the SUPERBOT_STORAGE_MODE environment variable.
+#
+# User-scoped components (emotional memory, narrative log, theory of mind) can
+# additionally be sharded by user: with SUPERBOT_SHARD_BUCKETS=N, a user's rows
+# live in one of N hash-bucketed files under db/shards/, so writes from users in
+# different buckets never contend for the same database lock. Moral rules,
+# values and personality traits always stay in the global database.
+
+# SUPERBOT_DATA_DIR relocates every database file (e.g. to a scratch directory for load tests)
+BASE_DIR = os.environ.get("SUPERBOT_DATA_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # superbot/
+DB_DIR = os.path.join(BASE_DIR, 'db')
+MEMORY_DIR = os.path.join(BASE_DIR, 'memory')
+
+DB_PATHS = {
+    "narrative": os.path.join(DB_DIR, "narrative_memory.db"),
+    "moral": os.path.join(DB_DIR, "human_values.db"),
+    "emotional": os.path.join(MEMORY_DIR, "emotional_memory.db"),
+    "tom": os.path.join(DB_DIR, "theory_of_mind.db"),
+}
+SINGLE_DB_PATH = os.environ.get("SUPERBOT_SINGLE_DB_PATH", os.path.join(DB_DIR, "superbot.db"))
+
+STORAGE_MODE = os.environ.get("SUPERBOT_STORAGE_MODE", "split")
+if STORAGE_MODE not in ("split", "single"):
+    raise ValueError(f"SUPERBOT_STORAGE_MODE must be 'split' or 'single', got {STORAGE_MODE!r}")
+
+SHARD_BUCKETS = int(os.environ.get("SUPERBOT_SHARD_BUCKETS", "0"))
+SHARD_DIR = os.path.join(DB_DIR, 'shards')
+USER_SCOPED_COMPONENTS = ("narrative", "emotional", "tom")
+
+def shard_for(user_id):
+    """Returns the bucket number a user's data is stored in."""
+    return zlib.crc32(str(user_id).encode("utf-8")) % SHARD_BUCKETS
+
+def shard_path(bucket):
+    return os.path.join(SHARD_DIR, f"bucket_{bucket:03d}.db")
+
+def db_path(component, user_id=None):
+    """Returns the database file holding a component's tables (for a user, if sharded)."""
+    if component not in DB_PATHS:
+        raise ValueError(f"Unknown storage component: {component}")
+    if user_id is not None and SHARD_BUCKETS > 0 and component in USER_SCOPED_COMPONENTS:
+        return shard_path(shard_for(user_id))
+    if STORAGE_MODE == "single":
+        return SINGLE_DB_PATH
+    return DB_PATHS[component]
+
+# Per-file write generation, bumped whenever a connection opened here commits changes.
+# Together with the file's stat signature it lets caches detect new writes without SQL.
+write_generation = {}
+
+# Lock accounting, off by default (the load-test harness turns it on).
+# SQLite's own busy handler waits for locks invisibly; with tracking on it is
+# disabled and the same wait (up to the sqlite3 default of 5s) happens here
+# instead, so time spent blocked on another writer and "database is locked"
+# errors can be counted.
+TRACK_LOCKS = os.environ.get("SUPERBOT_TRACK_LOCKS", "0") == "1"
+BUSY_TIMEOUT_SECONDS = 5.0
+lock_stats = {"waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "locked_errors": 0}
+_lock_stats_lock = threading.Lock()
+
+def _record_lock_wait(seconds, failed):
+    with _lock_stats_lock:
+        lock_stats["waits"] += 1
+        lock_stats["wait_seconds"] += seconds
+        lock_stats["max_wait_seconds"] = max(lock_stats["max_wait_seconds"], seconds)
+        lock_stats["locked_errors"] += failed
+
+def reset_lock_stats():
+    with _lock_stats_lock:
+        lock_stats.update(waits=0, wait_seconds=0.0, max_wait_seconds=0.0, locked_errors=0)
+
+def _busy_retry(run):
+    """Runs run(), retrying while the database is locked and recording how long that took."""
+    started = None
+    delay = 0.001
+    while True:
+        try:
+            result = run()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            now = time.perf_counter()
+            started = started or now
+            if now - started >= BUSY_TIMEOUT_SECONDS:
+                _record_lock_wait(now - started, True)
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+            continue
+        if started is not None:
+            _record_lock_wait(time.perf_counter() - started, False)
+        return result
+
+class TrackedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if not TRACK_LOCKS:
+            return super().execute(sql, parameters)
+        return _busy_retry(lambda: super(TrackedCursor, self).execute(sql, parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        if not TRACK_LOCKS:
+            return super().executemany(sql, seq_of_parameters)
+        rows = list(seq_of_parameters) # A retry must see the parameters again
+        return _busy_retry(lambda: super(TrackedCursor, self).executemany(sql, rows))
+
+class TrackedConnection(sqlite3.Connection):
+    """sqlite3 connection that bumps the file's write generation after committing changes."""
+    def __init__(self, path, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        self.path = os.path.abspath(path)
+        self._seen_changes = 0
+        if TRACK_LOCKS:
+            super().execute("PRAGMA busy_timeout = 0") # Lock waits go through _busy_retry instead
+
+    def cursor(self, factory=TrackedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _note_writes(self):
+        if self.total_changes != self._seen_changes:
+            self._seen_changes = self.total_changes
+            write_generation[self.path] = write_generation.get(self.path, 0) + 1
+
+    def commit(self):
+        if TRACK_LOCKS:
+            _busy_retry(super().commit)
+        else:
+            super().commit()
+        self._note_writes()
+
+    def close(self):
+        # Covers explicit "COMMIT" statements issued with isolation_level=None
+        try:
+            self._note_writes()
+        except sqlite3.ProgrammingError:
+            pass # Already closed
+        super().close()
+
+def connect(component, user_id=None):
+    """Opens a connection to a component's database, migrating it on first use."""
+    path = db_path(component, user_id)
+    migrate(path, component)
+    return sqlite3.connect(path, factory=TrackedConnection)
+
+def all_paths(component):
+    """Returns every file that may hold a component's rows: the global database plus existing shards."""
+    paths = [db_path(component)]
+    if SHARD_BUCKETS > 0 and component in USER_SCOPED_COMPONENTS:
+        paths += [shard_path(b) for b in range(SHARD_BUCKETS) if os.path.exists(shard_path(b))]
+    return paths
+
+def query_all_shards(component, sql, params=()):
+    """Runs a read query against the global database and every shard, returning all rows concatenated."""
+    rows = []
+    for path in all_paths(component):
+        migrate(path, component)
+        conn = sqlite3.connect(path, factory=TrackedConnection)
+        try:
+            rows.extend(conn.execute(sql, params).fetchall())
+        finally:
+            conn.close()
+    return rows
+
+@contextmanager
+def transaction(*components, read_only=False):
+    """
+    Yields one connection on which the tables of all given components are visible,
+    wrapped in a single atomic transaction. In split mode the other component files
+    are ATTACHed under their component name; unqualified table names still resolve
+    because table names are unique across components. With read_only the connection
+    refuses writes and no transaction is held open: each query reads a consistent
+    snapshot and keeps its shared locks only while it runs, so a long report never
+    takes the write lock or stalls writers between its queries.
+    """
+    components = components or tuple(DB_PATHS)
+    conn = connect(components[0])
+    conn.isolation_level = None # Manage the transaction explicitly
+    try:
+        if STORAGE_MODE == "split":
+            for component in components[1:]:
+                path = db_path(component)
+                migrate(path, component)
+                conn.execute("ATTACH DATABASE ? AS " + component, (path,))
+        else:
+            for component in components[1:]:
+                migrate(SINGLE_DB_PATH, component)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def _user_tables(conn, schema):
+    # Virtual tables and their <name>_* shadow tables are left out: they cannot be copied
+    # row for row, and full-text indexes are rebuilt from their content tables instead
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT name, sql FROM {schema}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name != 'schema_version'")
+    rows = cursor.fetchall()
+    virtual = [name for name, sql in rows if (sql or "").upper().startswith("CREATE VIRTUAL TABLE")]
+    return [name for name, _ in rows if not any(name == v or name.startswith(f"{v}_") for v in virtual)]
+
+def _columns(conn, schema, table):
+    cursor = conn.cursor()
+    cursor.execute(f'PRAGMA {schema}.table_info("{table}")')
+    return [row[1] for row in cursor.fetchall()]
+
+def migrate_to_single_file(dest_path=SINGLE_DB_PATH, sources=None):
+    """
+    Copies every component from the four-file layout into one database file.
+    Source files are migrated first so both sides share a schema; rows keep their
+    ids, and data in the destination (including seed rows) is replaced; full-text
+    indexes are rebuilt from the copied rows.
+    Returns {table: rows_copied}. Refuses to run while user shards exist: their rows
+    reuse the global ids, so they cannot be folded in without renumbering.
+    """
+    shards = sorted(glob.glob(os.path.join(SHARD_DIR, "*.db")))
+    if shards:
+        raise RuntimeError(f"{len(shards)} user shard file(s) in {SHARD_DIR} would be left behind; "
+                           "move their rows out before consolidating")
+    sources = sources or DB_PATHS
+    os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+    conn = sqlite3.connect(dest_path, factory=TrackedConnection)
+    copied = {}
+    try:
+        for component in MIGRATIONS:
+            apply_migrations(conn, component)
+        conn.isolation_level = None
+        for component, source_path in sources.items():
+            if not os.path.exists(source_path):
+                continue
+            migrate(source_path, component)
+            conn.execute("ATTACH DATABASE ? AS src", (source_path,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for table in _user_tables(conn, "src"):
+                    dest_columns = set(_columns(conn, "main", table))
+                    columns = ", ".join(f'"{c}"' for c in _columns(conn, "src", table) if c in dest_columns)
+                    conn.execute(f'DELETE FROM main."{table}"')
+                    cursor = conn.execute(f'INSERT INTO main."{table}" ({columns}) SELECT {columns} FROM src."{table}"')
+                    copied[table] = cursor.rowcount
+                for statement in FTS_REBUILD.get(component, ()):
+                    conn.execute(statement)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.execute("DETACH DATABASE src")
+    finally:
+        conn.close()
+    return copied
+
+
+if __name__ == "__main__":
+    # cd sk && python -m storage.engine -> consolidates the four databases into SINGLE_DB_PATH
+    print(f"Migrating four-file layout into {SINGLE_DB_PATH}...")
+    for table, count in migrate_to_single_file().items():
+        print(f"  {table}: {count} rows")
+    print("Done. Set SUPERBOT_STORAGE_MODE=single to use the consolidated database.")
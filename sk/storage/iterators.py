@@ -0,0 +1,86 @@
+import sqlite3
+from storage.engine import all_paths, db_path, TrackedConnection
+from storage.migrations import migrate
+
+# Streaming, keyset-paged table scans.
+# Rows are read in id order one page at a time (WHERE id > last_id LIMIT page)
+# and pulled off each page with fetchmany, so memory stays flat however large
+# the table is. Every page is its own short statement, which means a slow
+# consumer never holds a read lock across the whole scan and blocks writers.
+
+PAGE_SIZE = 5000
+FETCH_SIZE = 500
+
+def _paths(component, user_id, all_shards):
+    if user_id is not None:
+        return [db_path(component, user_id)]
+    if all_shards:
+        return all_paths(component)
+    return [db_path(component)]
+
+def iter_rows(component, table, record_type, where="", params=(), user_id=None,
+              all_shards=False, page_size=PAGE_SIZE):
+    """
+    Yields record_type(*row) for every row of table, in id order. record_type's
+    fields name the selected columns and must start with "id". where is an optional
+    extra SQL condition; with user_id, only that user's rows (from their shard) are read.
+    """
+    columns = ", ".join(record_type._fields)
+    conditions = ["id > ?"]
+    if where:
+        conditions.append(f"({where})")
+    if user_id is not None:
+        conditions.append("user_id = ?" if "user_id" in record_type._fields else "agent_id = ?")
+        params = tuple(params) + (user_id,)
+    sql = f"SELECT {columns} FROM {table} WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+
+    for path in _paths(component, user_id, all_shards):
+        migrate(path, component)
+        conn = sqlite3.connect(path, factory=TrackedConnection)
+        try:
+            cursor = conn.cursor()
+            last_id = 0
+            while True:
+                cursor.execute(sql, (last_id, *params, page_size))
+                fetched = 0
+                while True:
+                    rows = cursor.fetchmany(FETCH_SIZE)
+                    if not rows:
+                        break
+                    fetched += len(rows)
+                    for row in rows:
+                        yield record_type._make(row)
+                    last_id = rows[-1][0]
+                if fetched < page_size:
+                    break
+        finally:
+            conn.close()
+
+def iter_columns(records, chunk_size=PAGE_SIZE, float_fields=()):
+    """
+    Groups a record iterator into columnar chunks: dicts of field -> numpy array,
+    chunk_size rows each. float_fields become float64 arrays, id an int64 array,
+    everything else an object array. Use for vectorized aggregation.
+    """
+    import numpy as np # Only needed for columnar output
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield _to_columns(np, chunk, float_fields)
+            chunk = []
+    if chunk:
+        yield _to_columns(np, chunk, float_fields)
+
+def _to_columns(np, chunk, float_fields):
+    fields = chunk[0]._fields
+    columns = {}
+    for i, field in enumerate(fields):
+        values = [r[i] for r in chunk]
+        if field == "id":
+            columns[field] = np.fromiter(values, dtype=np.int64, count=len(values))
+        elif field in float_fields:
+            columns[field] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            columns[field] = np.array(values, dtype=object)
+    return columns
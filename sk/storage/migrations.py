@@ -0,0 +1,549 @@
+import sqlite3
+import os
+import sys
+from datetime import datetime
+
+# Versioned schema migrations for every Super-Bot database.
+# Each component (narrative, moral, emotional, tom) owns an ordered list of
+# migrations. A migration is either a list of SQL statements or a callable
+# taking a cursor. Applied versions are recorded per component in the
+# `schema_version` table of the database they were applied to, so the same
+# file can host several components (single-file storage) without clashes.
+
+def _narrative_v1(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS narrative_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            type TEXT,
+            content TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS personality_traits (
+            trait TEXT PRIMARY KEY,
+            value REAL
+        )
+    """)
+    default_traits = {
+        "empathy": 0.5, "curiosity": 0.5, "caution": 0.5,
+        "humor": 0.5, "confidence": 0.5
+    }
+    for trait, val in default_traits.items():
+        cursor.execute("INSERT OR IGNORE INTO personality_traits (trait, value) VALUES (?, ?)", (trait, val))
+
+def _narrative_v4(cursor):
+    # Events per day and type, kept current by triggers so dashboards never scan the log
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS narrative_daily (
+            day TEXT NOT NULL,
+            type TEXT NOT NULL,
+            events INTEGER NOT NULL,
+            PRIMARY KEY (day, type)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS narrative_daily_insert AFTER INSERT ON narrative_log BEGIN
+            INSERT INTO narrative_daily (day, type, events)
+            VALUES (COALESCE(substr(NEW.timestamp, 1, 10), ''), COALESCE(NEW.type, ''), 1)
+            ON CONFLICT(day, type) DO UPDATE SET events = events + 1;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS narrative_daily_delete AFTER DELETE ON narrative_log BEGIN
+            UPDATE narrative_daily SET events = events - 1
+            WHERE day = COALESCE(substr(OLD.timestamp, 1, 10), '') AND type = COALESCE(OLD.type, '');
+        END
+    """)
+    cursor.execute("DELETE FROM narrative_daily")
+    cursor.execute("""
+        INSERT INTO narrative_daily (day, type, events)
+        SELECT COALESCE(substr(timestamp, 1, 10), ''), COALESCE(type, ''), COUNT(*)
+        FROM narrative_log GROUP BY 1, 2
+    """)
+    for statement in _index_ddl("narrative", "idx_narrative_log_type_ts", "idx_narrative_log_ts"):
+        cursor.execute(statement)
+
+def _narrative_v5(cursor):
+    # Persistent chat conversations, paged newest-first by id
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT,
+            timestamp TEXT,
+            user_id TEXT
+        )
+    """)
+    for statement in _index_ddl("narrative", "idx_chat_messages_conversation"):
+        cursor.execute(statement)
+
+def _narrative_v6(cursor):
+    # Trait history in segments of packed (timestamp, value) records. The summary
+    # columns come before the blob so reading them never touches its overflow pages.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trait_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trait TEXT NOT NULL,
+            first_ts REAL NOT NULL,
+            last_ts REAL NOT NULL,
+            records INTEGER NOT NULL,
+            min_value REAL NOT NULL,
+            max_value REAL NOT NULL,
+            sum_value REAL NOT NULL,
+            data BLOB NOT NULL
+        )
+    """)
+    for statement in _index_ddl("narrative", "idx_trait_history_trait_ts"):
+        cursor.execute(statement)
+
+def _narrative_v7(cursor):
+    # Goals and their dependency DAG (goal_id waits for depends_on). ethics_hash is
+    # the context_hash the stored ethics verdict was reached for.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            context TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            context_hash TEXT,
+            ethics_hash TEXT,
+            ethics_ok INTEGER,
+            ethics_reasoning TEXT,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            user_id TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            finished_at TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS goal_dependencies (
+            goal_id INTEGER NOT NULL,
+            depends_on INTEGER NOT NULL,
+            PRIMARY KEY (goal_id, depends_on)
+        ) WITHOUT ROWID
+    """)
+    for statement in _index_ddl("narrative", "idx_goals_status", "idx_goal_dependencies_depends_on"):
+        cursor.execute(statement)
+
+def _moral_v1(cursor):
+    # "values" is an SQL keyword and must be quoted to be used as a table name
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS "values" (
+            name TEXT PRIMARY KEY,
+            description TEXT,
+            priority_score REAL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ethical_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule TEXT,
+            weight REAL DEFAULT 1.0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dilemma_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            situation TEXT,
+            decision TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS moral_outcomes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule_id INTEGER,
+            outcome_feedback TEXT,
+            timestamp TEXT
+        )
+    """) # For meta-learning
+    default_values = {
+        "compassion": "Act with empathy and kindness toward all beings.", "honesty": "Be truthful and transparent.",
+        "fairness": "Treat all parties equitably.", "autonomy": "Respect the independence of individuals.",
+        "privacy": "Protect personal and sensitive data."
+    }
+    for name, desc in default_values.items():
+        cursor.execute('INSERT OR IGNORE INTO "values" (name, description, priority_score) VALUES (?, ?, ?)', (name, desc, 0.5))
+    ethical_rules = [
+        "Do no harm.", "Respect autonomy and privacy.", "Act with fairness and compassion.",
+        "Avoid deception unless ethically justified.", "Preserve human dignity."
+    ]
+    # ethical_rules has no unique key, so INSERT OR IGNORE would duplicate rules on every run
+    for rule in ethical_rules:
+        cursor.execute("""
+            INSERT INTO ethical_rules (rule, weight)
+            SELECT ?, 1.0 WHERE NOT EXISTS (SELECT 1 FROM ethical_rules WHERE rule = ?)
+        """, (rule, rule)) # Default weight
+
+def _moral_v3(cursor):
+    # Pinned rules are always part of the dilemma prompt, whatever their relevance
+    cursor.execute("ALTER TABLE ethical_rules ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("""
+        UPDATE ethical_rules SET pinned = 1 WHERE rule IN (
+            'Do no harm.', 'Respect autonomy and privacy.', 'Act with fairness and compassion.',
+            'Avoid deception unless ethically justified.', 'Preserve human dignity.')
+    """)
+
+def _moral_v5(cursor):
+    # Precedent retrieval: the rule/value version each decision was made under, where it came
+    # from ("llm", "cache" or "precedent"), and a full-text index over the situations. Only
+    # original decisions are indexed, so reused answers never crowd out their precedent.
+    cursor.execute("ALTER TABLE dilemma_log ADD COLUMN rules_version INTEGER")
+    cursor.execute("ALTER TABLE dilemma_log ADD COLUMN source TEXT")
+    cursor.execute("ALTER TABLE dilemma_log ADD COLUMN precedent_id INTEGER")
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS dilemma_fts USING fts5(situation, content='dilemma_log', content_rowid='id')")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS dilemma_fts_insert AFTER INSERT ON dilemma_log
+        WHEN NEW.source IS NULL OR NEW.source = 'llm' BEGIN
+            INSERT INTO dilemma_fts (rowid, situation) VALUES (NEW.id, NEW.situation);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS dilemma_fts_delete AFTER DELETE ON dilemma_log
+        WHEN OLD.source IS NULL OR OLD.source = 'llm' BEGIN
+            INSERT INTO dilemma_fts (dilemma_fts, rowid, situation) VALUES ('delete', OLD.id, OLD.situation);
+        END
+    """)
+    cursor.execute("INSERT INTO dilemma_fts (rowid, situation) SELECT id, situation FROM dilemma_log")
+    for statement in _index_ddl("moral", "idx_dilemma_log_source"):
+        cursor.execute(statement)
+
+def _emotional_v1(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS emotional_memory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT,
+            emotion TEXT,
+            intensity REAL,
+            context TEXT,
+            timestamp TEXT
+        )
+    ''')
+
+def _emotional_v4(cursor):
+    # Repeated memories are merged into one row: content_hash identifies the
+    # normalised event, recall_weight is the frequency-weighted intensity recall
+    # orders by. Existing rows are hashed and merged by the compaction job.
+    for ddl in ("ALTER TABLE emotional_memory ADD COLUMN content_hash TEXT",
+                "ALTER TABLE emotional_memory ADD COLUMN occurrences INTEGER NOT NULL DEFAULT 1",
+                "ALTER TABLE emotional_memory ADD COLUMN max_intensity REAL",
+                "ALTER TABLE emotional_memory ADD COLUMN last_seen TEXT",
+                "ALTER TABLE emotional_memory ADD COLUMN recall_weight REAL"):
+        cursor.execute(ddl)
+    cursor.execute("UPDATE emotional_memory SET max_intensity = intensity, last_seen = timestamp, recall_weight = intensity")
+    for statement in _index_ddl("emotional", "idx_emotional_memory_hash", "idx_emotional_memory_weight", "idx_emotional_memory_user_weight"):
+        cursor.execute(statement)
+
+def _tom_v1(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS theory_of_mind (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id TEXT,
+            beliefs TEXT,
+            desires TEXT,
+            emotions TEXT,
+            intentions TEXT,
+            timestamp TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS empathy_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id TEXT,
+            predicted_emotion TEXT,
+            actual_emotion TEXT,
+            timestamp TEXT
+        )
+    ''') # For meta-learning
+
+def _tom_v3(cursor):
+    # Latest known mental state per agent, upserted on every stored perspective
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agent_state (
+            agent_id TEXT PRIMARY KEY,
+            beliefs TEXT,
+            desires TEXT,
+            emotions TEXT,
+            intentions TEXT,
+            last_input TEXT,
+            updated_at TEXT
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO agent_state (agent_id, beliefs, desires, emotions, intentions, last_input, updated_at)
+        SELECT agent_id, beliefs, desires, emotions, intentions, NULL, timestamp
+        FROM theory_of_mind
+        WHERE id IN (SELECT MAX(id) FROM theory_of_mind GROUP BY agent_id)
+    ''')
+
+# Secondary indexes per component, kept separate from the DDL so bulk loaders
+# can drop and rebuild them around large imports.
+INDEXES = {
+    "narrative": {
+        "idx_narrative_log_type_id": "CREATE INDEX IF NOT EXISTS idx_narrative_log_type_id ON narrative_log (type, id)",
+        "idx_narrative_log_user_id": "CREATE INDEX IF NOT EXISTS idx_narrative_log_user_id ON narrative_log (user_id, id)",
+        # Timeline pages are keyed on (timestamp, id); the rowid at the end of each index breaks ties
+        "idx_narrative_log_type_ts": "CREATE INDEX IF NOT EXISTS idx_narrative_log_type_ts ON narrative_log (type, timestamp)",
+        "idx_narrative_log_ts": "CREATE INDEX IF NOT EXISTS idx_narrative_log_ts ON narrative_log (timestamp)",
+        "idx_chat_messages_conversation": "CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation ON chat_messages (conversation_id, id)",
+        "idx_trait_history_trait_ts": "CREATE INDEX IF NOT EXISTS idx_trait_history_trait_ts ON trait_history (trait, last_ts)",
+        "idx_goals_status": "CREATE INDEX IF NOT EXISTS idx_goals_status ON goals (status, id)",
+        "idx_goal_dependencies_depends_on": "CREATE INDEX IF NOT EXISTS idx_goal_dependencies_depends_on ON goal_dependencies (depends_on, goal_id)",
+    },
+    "moral": {
+        "idx_values_priority": 'CREATE INDEX IF NOT EXISTS idx_values_priority ON "values" (priority_score)',
+        "idx_ethical_rules_weight": "CREATE INDEX IF NOT EXISTS idx_ethical_rules_weight ON ethical_rules (weight)",
+        "idx_moral_outcomes_rule": "CREATE INDEX IF NOT EXISTS idx_moral_outcomes_rule ON moral_outcomes (rule_id, outcome_feedback)",
+        # Expression index: lets weight learning count outcomes per rule and day without sorting
+        "idx_moral_outcomes_rule_day": "CREATE INDEX IF NOT EXISTS idx_moral_outcomes_rule_day ON moral_outcomes (rule_id, outcome_feedback, substr(timestamp, 1, 10))",
+        "idx_dilemma_log_source": "CREATE INDEX IF NOT EXISTS idx_dilemma_log_source ON dilemma_log (source)",
+    },
+    "emotional": {
+        "idx_emotional_memory_intensity_ts": "CREATE INDEX IF NOT EXISTS idx_emotional_memory_intensity_ts ON emotional_memory (intensity, timestamp)",
+        "idx_emotional_memory_user": "CREATE INDEX IF NOT EXISTS idx_emotional_memory_user ON emotional_memory (user_id, intensity, timestamp)",
+        "idx_emotional_memory_hash": "CREATE INDEX IF NOT EXISTS idx_emotional_memory_hash ON emotional_memory (content_hash)",
+        "idx_emotional_memory_weight": "CREATE INDEX IF NOT EXISTS idx_emotional_memory_weight ON emotional_memory (recall_weight, last_seen)",
+        "idx_emotional_memory_user_weight": "CREATE INDEX IF NOT EXISTS idx_emotional_memory_user_weight ON emotional_memory (user_id, recall_weight, last_seen)",
+    },
+    "tom": {
+        "idx_theory_of_mind_agent_id": "CREATE INDEX IF NOT EXISTS idx_theory_of_mind_agent_id ON theory_of_mind (agent_id, id)",
+        "idx_empathy_logs_agent_id": "CREATE INDEX IF NOT EXISTS idx_empathy_logs_agent_id ON empathy_logs (agent_id, id)",
+    },
+}
+
+def _index_ddl(component, *names):
+    return [INDEXES[component][name] for name in names]
+
+# Statements that rebuild each component's full-text indexes from their content
+# tables, for copies that bypass the triggers' filters (storage.engine consolidation)
+FTS_REBUILD = {
+    "moral": [
+        "INSERT INTO dilemma_fts (dilemma_fts) VALUES ('delete-all')",
+        "INSERT INTO dilemma_fts (rowid, situation) SELECT id, situation FROM dilemma_log WHERE source IS NULL OR source = 'llm'",
+    ],
+}
+
+MIGRATIONS = {
+    "narrative": [
+        (1, "baseline schema", _narrative_v1),
+        (2, "hot-path indexes", _index_ddl("narrative", "idx_narrative_log_type_id")),
+        (3, "user scoping", ["ALTER TABLE narrative_log ADD COLUMN user_id TEXT"]
+            + _index_ddl("narrative", "idx_narrative_log_user_id")),
+        (4, "timeline indexes and daily rollup", _narrative_v4),
+        (5, "chat history", _narrative_v5),
+        (6, "trait history segments", _narrative_v6),
+        (7, "goal execution", _narrative_v7),
+        (8, "chat sessions", ["""
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                token_hash TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                created_at TEXT,
+                last_seen TEXT
+            ) WITHOUT ROWID
+        """]),
+    ],
+    "moral": [
+        (1, "baseline schema", _moral_v1),
+        (2, "hot-path indexes", _index_ddl("moral", "idx_values_priority", "idx_ethical_rules_weight", "idx_moral_outcomes_rule")),
+        (3, "pinned core rules", _moral_v3),
+        (4, "outcome counts per day", _index_ddl("moral", "idx_moral_outcomes_rule_day")),
+        (5, "precedent index", _moral_v5),
+        (6, "test dilemmas out of the precedent index", [
+            # UI test runs were logged without a source, so they were indexed as LLM decisions
+            "INSERT INTO dilemma_fts (dilemma_fts, rowid, situation) SELECT 'delete', id, situation FROM dilemma_log "
+            "WHERE situation = 'Test Dilemma' AND source IS NULL",
+            "UPDATE dilemma_log SET source = 'test' WHERE situation = 'Test Dilemma' AND source IS NULL",
+        ]),
+    ],
+    "emotional": [
+        (1, "baseline schema", _emotional_v1),
+        (2, "hot-path indexes", _index_ddl("emotional", "idx_emotional_memory_intensity_ts")),
+        (3, "user scoping", ["ALTER TABLE emotional_memory ADD COLUMN user_id TEXT"]
+            + _index_ddl("emotional", "idx_emotional_memory_user")),
+        (4, "merged repeat memories", _emotional_v4),
+    ],
+    "tom": [
+        (1, "baseline schema", _tom_v1),
+        (2, "hot-path indexes", _index_ddl("tom", "idx_theory_of_mind_agent_id", "idx_empathy_logs_agent_id")),
+        (3, "per-agent latest state", _tom_v3),
+    ],
+}
+
+# (database path, component) pairs already brought up to date in this process
+_applied = set()
+
+def get_schema_version(conn, component):
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            component TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            applied_at TEXT
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_version WHERE component = ?", (component,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def apply_migrations(conn, component):
+    """Applies all pending migrations of a component on an open connection. Returns the new version."""
+    if component not in MIGRATIONS:
+        raise ValueError(f"Unknown schema component: {component}")
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None # Manage the transaction explicitly
+    cursor = conn.cursor()
+    try:
+        # IMMEDIATE takes the write lock up front so two processes never migrate the same file at once
+        cursor.execute("BEGIN IMMEDIATE")
+        version = get_schema_version(conn, component)
+        for target, description, steps in MIGRATIONS[component]:
+            if target <= version:
+                continue
+            if callable(steps):
+                steps(cursor)
+            else:
+                for statement in steps:
+                    cursor.execute(statement)
+            cursor.execute("""
+                INSERT INTO schema_version (component, version, applied_at) VALUES (?, ?, ?)
+                ON CONFLICT(component) DO UPDATE SET version = excluded.version, applied_at = excluded.applied_at
+            """, (component, target, datetime.now().isoformat()))
+            version = target
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = previous_isolation
+    return version
+
+def migrate(db_path, component):
+    """Brings the database at db_path up to date for a component, at most once per process."""
+    key = (os.path.abspath(db_path), component)
+    if key in _applied:
+        return
+    os.makedirs(os.path.dirname(key[0]), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        apply_migrations(conn, component)
+    finally:
+        conn.close()
+    _applied.add(key)
+
+# --- Query plan checks ---
+# Every query the modules issue, with the access path it is expected to use:
+#   "index"   - every table is searched through an index, the integer primary key
+#               or a full-text index; no table is scanned
+#   "scan-ok" - deliberately walks a whole index in order: small ordered tables
+#               (values, rules), aggregates that are cached or run off the rerun
+#               path, and recall by a substring no index can serve, which stops
+#               at its LIMIT
+#   "rowid"   - walks the rowid b-tree in order, e.g. ORDER BY id DESC LIMIT n
+#   "full"    - deliberately reads a tiny table in full
+# None of them may need a temporary b-tree for sorting.
+_RECALL_COLUMNS = "id, event, emotion, intensity, context, timestamp, occurrences, last_seen, content_hash, user_id"
+HOT_QUERIES = [
+    ("narrative", "SELECT trait, value FROM personality_traits", (), "full"),
+    ("narrative", "SELECT content FROM narrative_log ORDER BY id DESC LIMIT 10", (), "rowid"),
+    ("narrative", "SELECT timestamp, type, content FROM narrative_log ORDER BY id DESC LIMIT ?", (10,), "rowid"),
+    ("narrative", "SELECT timestamp, type, content FROM narrative_log WHERE type = ? ORDER BY id DESC LIMIT ?", ("chat_interaction", 10), "index"),
+    ("narrative", "SELECT timestamp, type, content FROM narrative_log WHERE user_id = ? ORDER BY id DESC LIMIT ?", ("u1", 10), "index"),
+    ("narrative", "SELECT id, timestamp, type, content, user_id FROM narrative_log WHERE type = ? AND timestamp >= ? AND timestamp <= ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?", ("chat_interaction", "2026-01-01", "2026-02-01T00:00:00", "2026-02-01T00:00:00", 100, 50), "index"),
+    ("narrative", "SELECT id, timestamp, type, content, user_id FROM narrative_log WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp, id LIMIT ?", ("2026-01-01", "2026-02-01", 50), "index"),
+    ("narrative", "SELECT id, role, content, timestamp FROM chat_messages WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?", ("session-1", 100, 21), "index"),
+    ("narrative", "SELECT user_id, last_seen FROM chat_sessions WHERE token_hash = ?", ("0" * 64,), "index"),
+    ("narrative", "SELECT id, records FROM trait_history WHERE trait = ? ORDER BY last_ts DESC LIMIT 1", ("empathy",), "index"),
+    ("narrative", "SELECT id, first_ts, last_ts, records, min_value, max_value, sum_value FROM trait_history WHERE trait = ? AND last_ts >= ? AND first_ts < ? ORDER BY last_ts", ("empathy", 0.0, 1e10), "index"),
+    ("narrative", "SELECT id FROM goals WHERE status = 'pending'", (), "index"),
+    ("narrative", "SELECT goal_id, depends_on FROM goal_dependencies WHERE goal_id IN (SELECT id FROM goals WHERE status = 'pending')", (), "index"),
+    ("narrative", "SELECT id, status FROM goals WHERE id IN (SELECT depends_on FROM goal_dependencies WHERE goal_id IN (SELECT id FROM goals WHERE status = 'pending'))", (), "index"),
+    # Cycle checks when a dependency is added need the whole DAG; it is not read on reruns
+    ("narrative", "SELECT goal_id, depends_on FROM goal_dependencies", (), "full"),
+    ("narrative", "SELECT id FROM goals WHERE status = ? AND started_at < ?", ("running", "2026-01-01"), "index"),
+    ("narrative", "SELECT goal_id FROM goal_dependencies WHERE depends_on = ?", (1,), "index"),
+    ("narrative", "SELECT day, type, events FROM narrative_daily WHERE day >= ? AND day <= ? ORDER BY day", ("2026-01-01", "2026-01-31"), "index"),
+    ("moral", 'SELECT name, description, priority_score FROM "values" ORDER BY priority_score DESC', (), "scan-ok"),
+    ("moral", "SELECT id, rule, weight, pinned FROM ethical_rules ORDER BY weight DESC", (), "scan-ok"),
+    ("moral", "UPDATE ethical_rules SET weight = MAX(0.1, MIN(2.0, weight + ?)) WHERE id = ?", (0.05, 1), "index"),
+    ("moral", "SELECT timestamp, situation, decision FROM dilemma_log ORDER BY id DESC LIMIT 5", (), "rowid"),
+    ("moral", "SELECT rule_id, outcome_feedback, substr(timestamp, 1, 10) AS day, COUNT(*) FROM moral_outcomes GROUP BY rule_id, outcome_feedback, day", (), "scan-ok"),
+    ("moral", "UPDATE ethical_rules SET weight = ? WHERE id = ?", (1.0, 1), "index"),
+    ("moral", "SELECT d.id, d.situation, d.decision, d.rules_version FROM dilemma_fts JOIN dilemma_log AS d ON d.id = dilemma_fts.rowid WHERE dilemma_fts MATCH ? ORDER BY dilemma_fts.rank LIMIT ?", ('"privacy"', 20), "index"),
+    ("moral", "SELECT source, COUNT(*) FROM dilemma_log GROUP BY source", (), "scan-ok"),
+    ("emotional", "SELECT id, intensity, occurrences, last_seen FROM emotional_memory WHERE content_hash = ? ORDER BY id LIMIT 1", ("0" * 40,), "index"),
+    ("emotional", f"SELECT {_RECALL_COLUMNS} FROM emotional_memory WHERE event LIKE ? ORDER BY recall_weight DESC, last_seen DESC LIMIT ?", ("%praise%", 20), "scan-ok"),
+    ("emotional", f"SELECT {_RECALL_COLUMNS} FROM emotional_memory WHERE user_id = ? AND event LIKE ? ORDER BY recall_weight DESC, last_seen DESC LIMIT ?", ("u1", "%praise%", 20), "index"),
+    ("emotional", "SELECT event, emotion, intensity, timestamp FROM emotional_memory ORDER BY id DESC LIMIT 5", (), "rowid"),
+    ("tom", "SELECT agent_id, beliefs, emotions, intentions, timestamp FROM theory_of_mind ORDER BY id DESC LIMIT 5", (), "rowid"),
+    ("tom", "SELECT beliefs, desires, emotions, intentions, last_input, updated_at FROM agent_state WHERE agent_id = ?", ("current_user",), "index"),
+    ("tom", "SELECT agent_id, predicted_emotion, actual_emotion, timestamp FROM empathy_logs ORDER BY id DESC LIMIT ?", (10,), "rowid"),
+    ("tom", "SELECT agent_id, predicted_emotion, actual_emotion, timestamp FROM empathy_logs WHERE agent_id = ? ORDER BY id DESC LIMIT ?", ("current_user", 10), "index"),
+]
+
+def explain(conn, sql, params=()):
+    """Returns the detail lines of EXPLAIN QUERY PLAN for a query."""
+    cursor = conn.cursor()
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[3] for row in cursor.fetchall()]
+
+def plan_problems(plan, expected):
+    """Returns a list of reasons why a plan does not match the expected access path (empty if it does)."""
+    problems = []
+    if any("TEMP B-TREE" in line for line in plan):
+        problems.append("sorts through a temporary b-tree")
+    if expected == "index":
+        scans = [line for line in plan if line.startswith("SCAN ") and "VIRTUAL TABLE INDEX" not in line]
+        if scans:
+            problems.append("scans instead of searching: " + "; ".join(scans))
+        elif not any(line.startswith("SEARCH ") or "VIRTUAL TABLE INDEX" in line for line in plan):
+            problems.append("does not use an index")
+    elif expected == "scan-ok":
+        if not any("INDEX" in line for line in plan):
+            problems.append("does not walk an index")
+    return problems
+
+def check_query_plans(conn=None, components=None):
+    """
+    Runs EXPLAIN QUERY PLAN on the hot queries of the given components (all by default).
+    Without a connection they run against a fresh, fully migrated in-memory database; a
+    given connection is used as it is and must already hold those components' schemas.
+    Returns a list of (component, sql, plan, problems) tuples.
+    """
+    components = tuple(components or MIGRATIONS)
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(":memory:")
+    try:
+        if own_conn:
+            for component in components:
+                apply_migrations(conn, component)
+        report = []
+        for component, sql, params, expected in HOT_QUERIES:
+            if component not in components:
+                continue
+            plan = explain(conn, sql, params)
+            report.append((component, sql, plan, plan_problems(plan, expected)))
+        return report
+    finally:
+        if own_conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    # python sk/storage/migrations.py -> verifies every hot query is index-backed
+    failures = 0
+    for component, sql, plan, problems in check_query_plans():
+        status = "FAIL" if problems else "ok"
+        print(f"[{status}] {component}: {sql}")
+        for line in plan:
+            print(f"        {line}")
+        for problem in problems:
+            print(f"        -> {problem}")
+        failures += bool(problems)
+    print(f"{len(HOT_QUERIES) - failures}/{len(HOT_QUERIES)} queries use the expected access path.")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,74 @@
+import os
+import threading
+from collections import OrderedDict
+from storage.engine import all_paths, connect, query_all_shards, write_generation
+
+# Change-aware cache for the read-only panels rendered by the render_ui functions.
+# Each entry remembers a change token of the databases it was read from: the
+# in-process write generation plus the stat signature (mtime, size) of each
+# database file and its WAL/journal. Writes from this process bump the
+# generation; writes from other processes change the file signature. A rerun
+# with no new writes therefore only stats a few files and runs no SQL at all
+# (PRAGMA data_version would need a query, and a connection, per check).
+# Keys include cursors, filters and days, so the cache is a bounded LRU, and a
+# reload also drops every other entry read from the same databases before the
+# write it noticed, since none of those can be served again.
+
+PANEL_CACHE_SIZE = int(os.environ.get("SUPERBOT_PANEL_CACHE_SIZE", "256"))
+_cache = OrderedDict() # key -> ({component: token}, value), most recently used last
+_lock = threading.Lock()
+panel_cache_stats = {"hits": 0, "misses": 0}
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def change_token(component):
+    """Returns a value that changes whenever any database file of the component is written."""
+    token = []
+    for path in all_paths(component):
+        path = os.path.abspath(path)
+        token.append((path, write_generation.get(path, 0), _file_signature(path),
+                      _file_signature(path + "-wal"), _file_signature(path + "-journal")))
+    return tuple(token)
+
+def cached_panel(key, components, loader):
+    """Returns loader()'s cached result for key, reloading only when one of the components changed."""
+    tokens = {c: change_token(c) for c in components}
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == tokens:
+            _cache.move_to_end(key)
+            panel_cache_stats["hits"] += 1
+            return entry[1]
+        panel_cache_stats["misses"] += 1
+    value = loader()
+    with _lock:
+        stale = [k for k, (entry_tokens, _) in _cache.items()
+                 if any(c in tokens and t != tokens[c] for c, t in entry_tokens.items())]
+        for k in stale:
+            del _cache[k]
+        _cache[key] = (tokens, value)
+        _cache.move_to_end(key)
+        while len(_cache) > PANEL_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+def cached_query(component, sql, params=(), all_shards=False):
+    """Runs a read query through the panel cache; all_shards fans it out over every user shard."""
+    def load():
+        if all_shards:
+            return query_all_shards(component, sql, params)
+        conn = connect(component)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+    return cached_panel(("query", component, sql, tuple(params), all_shards), (component,), load)
+
+def clear():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The modules import each other from sk/ (e.g. "from storage.engine import connect"),
+# and storage.engine resolves every database path from SUPERBOT_DATA_DIR when it is
+# first imported, so both are set before any test module imports them.
+SK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sk")
+sys.path.insert(0, SK_DIR)
+os.environ.setdefault("SUPERBOT_DATA_DIR", tempfile.mkdtemp(prefix="superbot-tests-"))
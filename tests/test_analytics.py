@@ -0,0 +1,25 @@
+from cognition.analytics import dilemmas_vs_empathy_accuracy
+from storage import engine
+
+DAY = "2030-05-01"
+
+def _insert(component, user_id, sql, rows):
+    conn = engine.connect(component, user_id)
+    conn.executemany(sql, rows)
+    conn.commit()
+    conn.close()
+
+def test_empathy_accuracy_counts_every_shard(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, "SHARD_BUCKETS", 4)
+    monkeypatch.setattr(engine, "SHARD_DIR", str(tmp_path / "shards"))
+    _insert("moral", None, "INSERT INTO dilemma_log (timestamp, situation, decision, source) VALUES (?, 's', 'd', 'test')",
+            [(f"{DAY}T09:00:00",), (f"{DAY}T10:00:00",)])
+    empathy = "INSERT INTO empathy_logs (agent_id, predicted_emotion, actual_emotion, timestamp) VALUES (?, ?, ?, ?)"
+    agents = [f"agent-{i}" for i in range(8)]
+    for i, agent in enumerate(agents):
+        _insert("tom", agent, empathy, [(agent, "joy", "joy" if i % 2 == 0 else "anger", f"{DAY}T11:00:00")])
+    _insert("tom", None, empathy, [(None, "Fear ", "fear", f"{DAY}T12:00:00")])
+    assert len({engine.shard_for(agent) for agent in agents}) > 1
+
+    row = next(r for r in dilemmas_vs_empathy_accuracy() if r["day"] == DAY)
+    assert row == {"day": DAY, "dilemmas": 2, "empathy_logs": 9, "empathy_accuracy": 5 / 9}
@@ -0,0 +1,28 @@
+import json
+from batch_runner import run_batch, trim_partial_line
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8")
+
+def test_trim_partial_line_keeps_complete_lines(tmp_path):
+    output = tmp_path / "results.jsonl"
+    _write(output, json.dumps({"id": "1", "status": "ok"}) + "\n" + '{"id": "2", "sta')
+    trim_partial_line(str(output))
+    assert output.read_text(encoding="utf-8") == json.dumps({"id": "1", "status": "ok"}) + "\n"
+
+def test_trim_partial_line_leaves_terminated_file_alone(tmp_path):
+    output = tmp_path / "results.jsonl"
+    _write(output, '{"id": "1"}\n')
+    trim_partial_line(str(output))
+    assert output.read_text(encoding="utf-8") == '{"id": "1"}\n'
+
+def test_resume_counts_only_skipped_inputs(tmp_path):
+    scenarios = tmp_path / "scenarios.jsonl"
+    _write(scenarios, "".join(json.dumps({"id": i, "scenario": "s"}) + "\n" for i in ("a", "b")))
+    output = tmp_path / "results.jsonl"
+    # Results for both inputs, one for an id this input no longer has, and a line cut short
+    _write(output, "".join(json.dumps({"id": i, "status": "ok"}) + "\n" for i in ("a", "b", "old")) + '{"id": "c"')
+    summary = run_batch(str(scenarios), str(output), workers=1)
+    assert summary["skipped"] == 2
+    assert summary["ok"] == summary["error"] == 0
+    assert output.read_text(encoding="utf-8").endswith('"old", "status": "ok"}\n')
@@ -0,0 +1,91 @@
+import math
+import pytest
+from storage import bulk_io
+from storage import engine
+from storage.engine import connect
+
+def _emotional_rows():
+    conn = connect("emotional")
+    try:
+        return conn.execute("SELECT event, occurrences, max_intensity, last_seen, recall_weight, content_hash "
+                            "FROM emotional_memory ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+def _clear():
+    conn = connect("emotional")
+    conn.execute("DELETE FROM emotional_memory")
+    conn.commit()
+    conn.close()
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+def test_round_trip_keeps_merge_state(tmp_path, fmt):
+    _clear()
+    bulk_io.import_records("emotional_memory", [
+        {"event": "won the match", "emotion": "joy", "intensity": 0.5, "timestamp": "2026-01-01T00:00:00",
+         "occurrences": 500, "max_intensity": 0.9, "last_seen": "2026-03-01T00:00:00",
+         "recall_weight": 3.6, "content_hash": "abc"},
+        {"event": "lost the match", "emotion": "sadness", "intensity": 0.4, "timestamp": "2026-01-02T00:00:00",
+         "occurrences": 3},
+    ])
+    before = _emotional_rows()
+    assert before[0] == ("won the match", 500, 0.9, "2026-03-01T00:00:00", 3.6, "abc")
+    assert before[1][:4] == ("lost the match", 3, 0.4, "2026-01-02T00:00:00")
+    assert before[1][4] == pytest.approx(0.4 * (1 + math.log(3)))
+    assert before[1][5] is None
+
+    path = str(tmp_path / f"memories.{fmt}")
+    exporter, importer = (bulk_io.export_csv, bulk_io.import_csv) if fmt == "csv" else (bulk_io.export_jsonl, bulk_io.import_jsonl)
+    assert exporter("emotional_memory", path) == 2
+    _clear()
+    assert importer("emotional_memory", path) == 2
+    assert _emotional_rows() == before
+
+def _index_names(component, table):
+    conn = connect(component)
+    try:
+        return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))}
+    finally:
+        conn.close()
+
+def test_interrupted_import_keeps_indexes_and_adds_no_rows():
+    _clear()
+    indexes = _index_names("emotional", "emotional_memory")
+    assert indexes
+    def records():
+        for i in range(25):
+            yield {"event": f"event {i}", "emotion": "joy"}
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        bulk_io.import_records("emotional_memory", records(), chunk_size=10)
+    assert _index_names("emotional", "emotional_memory") == indexes
+    assert _emotional_rows() == []
+
+def test_export_without_user_reads_every_shard(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, "SHARD_BUCKETS", 4)
+    monkeypatch.setattr(engine, "SHARD_DIR", str(tmp_path / "shards"))
+    _clear()
+    users = [f"user-{i}" for i in range(6)]
+    for user in users:
+        bulk_io.import_records("emotional_memory", [{"event": f"{user} smiled", "emotion": "joy", "user_id": user}], user_id=user)
+    path = str(tmp_path / "all.jsonl")
+    assert bulk_io.export_jsonl("emotional_memory", path) == len(users)
+    assert [r["user_id"] for r in bulk_io.iter_table("emotional_memory", user_id="user-0")] == ["user-0"]
+
+def test_theory_of_mind_import_only_refreshes_imported_agents():
+    conn = connect("tom")
+    conn.execute("INSERT INTO theory_of_mind (agent_id, beliefs, timestamp) VALUES ('bystander', 'b', 't')")
+    conn.execute("INSERT OR REPLACE INTO agent_state (agent_id, beliefs, last_input, updated_at) VALUES ('bystander', 'b', 'hello', 't')")
+    conn.commit()
+    conn.close()
+    bulk_io.import_records("theory_of_mind", [
+        {"agent_id": "imported", "beliefs": "old", "timestamp": "2026-01-01"},
+        {"agent_id": "imported", "beliefs": "new", "timestamp": "2026-01-02"},
+    ])
+    conn = connect("tom")
+    try:
+        states = dict(conn.execute("SELECT agent_id, beliefs || '/' || COALESCE(last_input, '') FROM agent_state "
+                                   "WHERE agent_id IN ('bystander', 'imported')").fetchall())
+    finally:
+        conn.close()
+    assert states == {"bystander": "b/hello", "imported": "new/"}
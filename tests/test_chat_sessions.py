@@ -0,0 +1,21 @@
+import datetime
+import chat_history
+from storage.engine import connect
+
+def test_token_resumes_its_user_once():
+    user_id, token = chat_history.open_session()
+    resumed, new_token = chat_history.open_session(token)
+    assert resumed == user_id and new_token != token
+    # The old token was exchanged, so a copied link no longer opens the conversation
+    assert chat_history.open_session(token)[0] != user_id
+    assert chat_history.open_session(new_token)[0] == user_id
+
+def test_unknown_or_expired_token_starts_a_new_user():
+    assert chat_history.open_session("session-someone-else")[0] != "session-someone-else"
+    user_id, token = chat_history.open_session()
+    stale = (datetime.datetime.now() - datetime.timedelta(days=chat_history.CHAT_SESSION_DAYS + 1)).isoformat()
+    conn = connect("narrative")
+    conn.execute("UPDATE chat_sessions SET last_seen = ? WHERE user_id = ?", (stale, user_id))
+    conn.commit()
+    conn.close()
+    assert chat_history.open_session(token)[0] != user_id
@@ -0,0 +1,33 @@
+from cognition import generation
+from cognition.generation import ControlledPipeline
+
+class _Tokenizer:
+    def __call__(self, text):
+        return {"input_ids": text.split()}
+
+class _Pipe:
+    tokenizer = _Tokenizer()
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, prompts, **kwargs):
+        self.calls.append((list(prompts), kwargs))
+        return [[{"generated_text": " answer. STOP extra"}] for _ in prompts]
+
+def test_each_batch_gets_its_own_stopping_criteria(monkeypatch):
+    monkeypatch.setattr(generation, "_stopping_criteria", lambda tokenizer, stop, labels: object())
+    pipe = _Pipe()
+    outputs = ControlledPipeline(pipe)(["short prompt", "a much longer second prompt", "third"],
+                                       max_new_tokens=8, stop_sequences=["STOP"])
+    assert [prompts for prompts, _ in pipe.calls] == [["short prompt"], ["a much longer second prompt"], ["third"]]
+    criteria = [kwargs["stopping_criteria"] for _, kwargs in pipe.calls]
+    assert len({id(c) for c in criteria}) == 3
+    assert [r[0]["generated_text"] for r in outputs] == [" answer."] * 3
+    assert all(r[0]["stop_reason"] == "stop_sequence" for r in outputs)
+
+def test_batched_calls_share_criteria_only_within_a_batch(monkeypatch):
+    monkeypatch.setattr(generation, "_stopping_criteria", lambda tokenizer, stop, labels: object())
+    pipe = _Pipe()
+    ControlledPipeline(pipe)(["a", "b", "c"], stop_sequences=["STOP"], batch_size=2)
+    assert [(prompts, kwargs["batch_size"]) for prompts, kwargs in pipe.calls] == [(["a", "b"], 2), (["c"], 1)]
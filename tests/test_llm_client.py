@@ -0,0 +1,33 @@
+import math
+import time
+import pytest
+from cognition.llm_client import LLMClient, CircuitBreaker, LLMUnavailableError
+
+def _slow_backend(seconds):
+    def backend(prompt, max_tokens, history=None, timeout=None, **controls):
+        time.sleep(seconds)
+        return f"answer to {prompt}"
+    return backend
+
+def test_deadline_still_applies_by_default():
+    client = LLMClient(_slow_backend(0.3), max_retries=0, timeout=0.05, coalesce=False)
+    with pytest.raises(LLMUnavailableError):
+        client.generate("slow")
+
+def test_client_without_deadline_waits_for_a_slow_local_model():
+    # How gemini_api sets up the local GPT-2 client
+    client = LLMClient(_slow_backend(0.3), max_retries=0, timeout=None, breaker=CircuitBreaker(math.inf), coalesce=False)
+    assert client.generate("slow") == "answer to slow"
+    assert client.snapshot()["timeouts"] == 0
+
+def test_breaker_that_never_opens_keeps_calling_the_backend():
+    calls = []
+    def failing(prompt, max_tokens, history=None, timeout=None, **controls):
+        calls.append(prompt)
+        raise TimeoutError("took too long")
+    client = LLMClient(failing, max_retries=0, timeout=None, breaker=CircuitBreaker(math.inf), coalesce=False)
+    for i in range(10):
+        with pytest.raises(LLMUnavailableError):
+            client.generate(f"p{i}")
+    assert len(calls) == 10
+    assert client.snapshot()["breaker"] == "closed"
@@ -0,0 +1,33 @@
+import os
+import stat
+import threading
+import time
+import pytest
+import model_server
+from model_server import ModelServerClient, ModelServerUnavailableError, ModelService
+
+def _serve(socket_path):
+    service = ModelService(loader=lambda task, model: lambda inputs, **kwargs: [x.upper() for x in inputs])
+    threading.Thread(target=model_server.serve, args=(socket_path, service), daemon=True).start()
+    for _ in range(200):
+        if os.path.exists(socket_path):
+            return
+        time.sleep(0.01)
+    raise AssertionError("model server did not start")
+
+def test_socket_and_generated_key_are_owner_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_server, "MODEL_SERVER_KEY", "")
+    socket_path = str(tmp_path / "models.sock")
+    _serve(socket_path)
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) & 0o077 == 0
+    assert stat.S_IMODE(os.stat(model_server.key_path(socket_path)).st_mode) == 0o600
+    assert ModelServerClient(socket_path, timeout=5).run("upper", None, ["a", "b"]) == ["A", "B"]
+
+def test_client_without_the_key_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_server, "MODEL_SERVER_KEY", "")
+    socket_path = str(tmp_path / "models.sock")
+    _serve(socket_path)
+    with open(model_server.key_path(socket_path), "w") as f:
+        f.write("guessed")
+    with pytest.raises(ModelServerUnavailableError):
+        ModelServerClient(socket_path, timeout=5).health()
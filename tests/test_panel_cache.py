@@ -0,0 +1,24 @@
+from storage import panel_cache
+from storage.engine import connect
+
+def _write_narrative():
+    conn = connect("narrative")
+    conn.execute("INSERT INTO narrative_log (timestamp, type, content) VALUES ('2026-01-01', 'test', 'x')")
+    conn.commit()
+    conn.close()
+
+def test_cache_is_bounded(monkeypatch):
+    panel_cache.clear()
+    monkeypatch.setattr(panel_cache, "PANEL_CACHE_SIZE", 3)
+    for page in range(10):
+        panel_cache.cached_panel(("timeline", page), ("narrative",), lambda: page)
+    assert list(panel_cache._cache) == [("timeline", 7), ("timeline", 8), ("timeline", 9)]
+
+def test_reload_drops_entries_with_a_stale_token():
+    panel_cache.clear()
+    panel_cache.cached_panel(("timeline", 0), ("narrative",), lambda: 0)
+    panel_cache.cached_panel(("timeline", 1), ("narrative",), lambda: 1)
+    panel_cache.cached_panel("rules", ("moral",), lambda: "rules")
+    _write_narrative()
+    assert panel_cache.cached_panel(("timeline", 0), ("narrative",), lambda: "reloaded") == "reloaded"
+    assert set(panel_cache._cache) == {("timeline", 0), "rules"}
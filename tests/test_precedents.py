@@ -0,0 +1,37 @@
+import sqlite3
+from cognition import precedents
+from storage import panel_cache
+from storage.engine import connect
+from storage import migrations
+
+def _log(situation, source):
+    conn = connect("moral")
+    conn.execute("INSERT INTO dilemma_log (timestamp, situation, decision, source) VALUES ('2026-01-01', ?, 'Decline', ?)",
+                 (situation, source))
+    conn.commit()
+    conn.close()
+
+def test_stats_rerun_without_writes_runs_no_sql(monkeypatch):
+    _log("Stats check about consent", "llm")
+    first = precedents.precedent_stats()
+    def no_sql(*args, **kwargs):
+        raise AssertionError("precedent_stats queried the database")
+    monkeypatch.setattr(panel_cache, "connect", no_sql)
+    assert precedents.precedent_stats() == first
+
+def test_ui_test_runs_are_not_precedents():
+    _log("Test Dilemma", "test")
+    assert all(p.situation != "Test Dilemma" for p in precedents.find_precedents("Test Dilemma"))
+
+def test_migration_removes_legacy_test_rows_from_the_index(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    monkeypatch.setitem(migrations.MIGRATIONS, "moral", migrations.MIGRATIONS["moral"][:5])
+    migrations.apply_migrations(conn, "moral")
+    conn.executemany("INSERT INTO dilemma_log (timestamp, situation, decision) VALUES ('2026-01-01', ?, 'Decline')",
+                     [("Test Dilemma",), ("Legacy privacy question",)])
+    monkeypatch.undo()
+    migrations.apply_migrations(conn, "moral")
+    conn.execute("INSERT INTO dilemma_fts (dilemma_fts) VALUES ('integrity-check')")
+    assert conn.execute("SELECT rowid FROM dilemma_fts WHERE dilemma_fts MATCH 'dilemma'").fetchall() == []
+    assert len(conn.execute("SELECT rowid FROM dilemma_fts WHERE dilemma_fts MATCH 'privacy'").fetchall()) == 1
+    assert conn.execute("SELECT source FROM dilemma_log WHERE situation = 'Test Dilemma'").fetchone() == ("test",)
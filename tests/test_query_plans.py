@@ -0,0 +1,36 @@
+import sqlite3
+import pytest
+from storage.migrations import MIGRATIONS, HOT_QUERIES, migrate, check_query_plans, plan_problems
+
+def _failures(report):
+    return [f"{component}: {sql} -> {', '.join(problems)} ({' / '.join(plan)})"
+            for component, sql, plan, problems in report if problems]
+
+def test_hot_queries_use_expected_access_path_in_memory():
+    report = check_query_plans()
+    assert len(report) == len(HOT_QUERIES)
+    assert _failures(report) == []
+
+@pytest.mark.parametrize("layout", ["split", "single"])
+def test_hot_queries_use_expected_access_path_after_migrating_a_file(tmp_path, layout):
+    # migrate() is what connect() runs on real files; the plans must hold on its result too
+    paths = {component: str(tmp_path / (f"{component}.db" if layout == "split" else "superbot.db")) for component in MIGRATIONS}
+    for component, path in paths.items():
+        migrate(path, component)
+    for component in MIGRATIONS:
+        conn = sqlite3.connect(paths[component])
+        try:
+            report = check_query_plans(conn, components=(component,))
+            if layout == "split":
+                # Checking must not create the other components' schemas in this file
+                assert conn.execute("SELECT COUNT(*) FROM schema_version WHERE component != ?", (component,)).fetchone() == (0,)
+        finally:
+            conn.close()
+        assert report and all(entry[0] == component for entry in report)
+        assert _failures(report) == []
+
+def test_index_expectation_rejects_full_index_scans():
+    plan = ["SCAN emotional_memory USING INDEX idx_emotional_memory_weight"]
+    assert plan_problems(plan, "index")
+    assert plan_problems(plan, "scan-ok") == []
+    assert plan_problems(["SEARCH goals USING COVERING INDEX idx_goals_status (status=?)"], "index") == []
@@ -0,0 +1,51 @@
+import sqlite3
+import pytest
+from storage import engine
+from storage.migrations import migrate
+
+def test_refuses_to_consolidate_while_user_shards_exist(tmp_path, monkeypatch):
+    shard_dir = tmp_path / "shards"
+    shard_dir.mkdir()
+    sqlite3.connect(str(shard_dir / "bucket_000.db")).close()
+    monkeypatch.setattr(engine, "SHARD_DIR", str(shard_dir))
+    with pytest.raises(RuntimeError, match="shard"):
+        engine.migrate_to_single_file(str(tmp_path / "superbot.db"), sources={})
+    assert not (tmp_path / "superbot.db").exists()
+
+def test_consolidated_precedent_index_matches_copied_dilemmas(tmp_path):
+    moral = str(tmp_path / "moral.db")
+    migrate(moral, "moral")
+    conn = sqlite3.connect(moral)
+    conn.executemany("INSERT INTO dilemma_log (timestamp, situation, decision, source) VALUES (?, ?, ?, ?)", [
+        ("2026-01-01", "A user asks us to share their privacy settings", "Decline", "llm"),
+        ("2026-01-02", "Reused answer about privacy", "Decline", "precedent"),
+        ("2026-01-03", "Someone wants help moving house", "Help", None),
+    ])
+    conn.commit()
+    conn.close()
+
+    dest = str(tmp_path / "superbot.db")
+    copied = engine.migrate_to_single_file(dest, sources={"moral": moral})
+    assert copied["dilemma_log"] == 3
+    assert not any(table.startswith("dilemma_fts") for table in copied)
+
+    conn = sqlite3.connect(dest)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        conn.execute("INSERT INTO dilemma_fts (dilemma_fts) VALUES ('integrity-check')")
+        hits = conn.execute("SELECT d.situation FROM dilemma_fts JOIN dilemma_log AS d ON d.id = dilemma_fts.rowid "
+                            "WHERE dilemma_fts MATCH 'privacy'").fetchall()
+    finally:
+        conn.close()
+    assert hits == [("A user asks us to share their privacy settings",)]
+
+def test_read_only_transaction_does_not_block_writers():
+    with engine.transaction("moral", "tom", read_only=True) as conn:
+        conn.execute("SELECT COUNT(*) FROM dilemma_log").fetchall()
+        writer = engine.connect("moral")
+        writer.execute("PRAGMA busy_timeout = 0")
+        writer.execute("INSERT INTO dilemma_log (timestamp, situation, decision, source) VALUES ('2026-01-01', 'w', 'd', 'test')")
+        writer.commit()
+        writer.close()
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM dilemma_log")